@@ -1,11 +1,24 @@
+from collections import defaultdict
+
 from django.contrib import admin
 
+from Chat.models.archived_message import ArchivedMessage
 from Chat.models.chat_room import ChatRoom
 from Chat.models.message import Message
 from Chat.models.participant import Participant
-from Chat.models.unread_message import UnreadMessage
 
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        """Deletes the selected messages chat by chat, so the deletions are tombstoned"""
+        messages_uuids = defaultdict(list)
+        for message_uuid, chat_uuid in queryset.values_list('id', 'chat_room'):
+            messages_uuids[chat_uuid].append(message_uuid)
+        for chat_uuid, uuids in messages_uuids.items():
+            ChatRoom.delete_messages(chat_uuid, uuids)
+
+
+admin.site.register(ArchivedMessage)
 admin.site.register(ChatRoom)
-admin.site.register(Message)
 admin.site.register(Participant)
-admin.site.register(UnreadMessage)
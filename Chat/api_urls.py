@@ -5,6 +5,15 @@ from Chat import views
 app_name = 'chat'
 
 urlpatterns = [
+    path(r'metrics', views.fetch_metrics),
+    path(r'chats', views.fetch_rooms),
+    path(r'chats/unread-counts', views.fetch_unread_counts),
+    path(r'search', views.search_messages),
     path(r'chat/<uuid:chat_uuid>/messages', views.fetch_messages),
-    path(r'chat/<uuid:chat_uuid>/send', views.send_message)
+    path(r'chat/<uuid:chat_uuid>/changes', views.fetch_changes),
+    path(r'chat/<uuid:chat_uuid>/export', views.export_messages),
+    path(r'chat/<uuid:chat_uuid>/send', views.send_message),
+    path(r'chat/<uuid:chat_uuid>/send-batch', views.send_messages),
+    path(r'async/chat/<uuid:chat_uuid>/messages', views.fetch_messages_async),
+    path(r'async/chat/<uuid:chat_uuid>/send', views.send_message_async)
 ]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ChatConfig(AppConfig):
     name = 'Chat'
+
+    def ready(self):
+        # Connect the signal receivers
+        from Chat.utils import membership, recent, search, tombstones, unread_counts  # noqa: F401
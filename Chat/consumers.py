@@ -0,0 +1,125 @@
+import asyncio
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http.request import split_domain_port, validate_host
+
+from Chat.utils.membership import is_participant
+from Chat.utils.pubsub import get_pubsub_backend, get_chat_channel
+
+# Close codes of the WebSocket connection
+CHAT_ACCESS_CLOSE_CODE = 4403
+OVERFLOW_CLOSE_CODE = 4008
+
+
+@sync_to_async
+def get_participant_id(scope, chat_uuid):
+    """Returns the id of the User from the session cookie if the User participates in the chat"""
+    try:
+        cookies = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookies.load(value.decode('latin1'))
+        if settings.SESSION_COOKIE_NAME not in cookies:
+            return None
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        session = session_store(cookies[settings.SESSION_COOKIE_NAME].value)
+        user = get_user(SimpleNamespace(session=session))
+        if not user.is_authenticated:
+            return None
+        return user.id if is_participant(chat_uuid, user.id) else None
+    finally:
+        close_old_connections()
+
+
+def is_allowed_origin(scope) -> bool:
+    """
+    Returns whether the handshake comes from a page of an allowed origin
+
+    The browsers send the cookies of the user with the handshake of any page, so the origins
+    which aren't served by ALLOWED_HOSTS or listed in CHAT_CONFIGURATION['websocket_allowed_origins']
+    are rejected, otherwise a foreign page could read the chats of the user.
+    """
+    origins = [value.decode('latin1') for name, value in scope.get('headers', []) if name == b'origin']
+    if len(origins) != 1:
+        return False
+    origin = origins[0]
+    allowed_origins = settings.CHAT_CONFIGURATION.get('websocket_allowed_origins', '').split(',')
+    if origin in [allowed_origin.strip() for allowed_origin in allowed_origins if allowed_origin.strip()]:
+        return True
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        # The same hosts which Django allows in the debug mode
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    domain, port = split_domain_port(urlparse(origin).netloc)
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+@sync_to_async
+def check_participant(chat_uuid, user_id) -> bool:
+    """Returns whether the User still participates in the chat"""
+    try:
+        return is_participant(chat_uuid, user_id)
+    finally:
+        close_old_connections()
+
+
+class ChatConsumer:
+    """
+    Pushes new messages of the chat to the WebSocket connection of its participant
+
+    Every message is sent as a text frame with the same JSON object
+    which `fetch_messages` returns for it. The client messages are ignored.
+    The membership is checked again before every push, so the connection
+    of a removed participant is closed instead of receiving the chat.
+    The handshakes of the pages of foreign origins are rejected.
+    """
+
+    async def __call__(self, scope, receive, send, chat_uuid=None):
+        event = await receive()
+        if event['type'] != 'websocket.connect':
+            return
+        user_id = await get_participant_id(scope, chat_uuid) if is_allowed_origin(scope) else None
+        if user_id is None:
+            await send({'type': 'websocket.close', 'code': CHAT_ACCESS_CLOSE_CODE})
+            return
+        backend = get_pubsub_backend()
+        subscription = backend.subscribe(get_chat_channel(chat_uuid))
+        try:
+            await send({'type': 'websocket.accept'})
+            await self.push_messages(subscription, receive, send, lambda: check_participant(chat_uuid, user_id))
+        finally:
+            backend.unsubscribe(subscription)
+
+    @staticmethod
+    async def push_messages(subscription, receive, send, is_allowed):
+        receive_task = asyncio.ensure_future(receive())
+        try:
+            while True:
+                payload_task = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    (receive_task, payload_task), return_when=asyncio.FIRST_COMPLETED)
+                if payload_task in done:
+                    if subscription.overflowed:
+                        # The client fell behind, it must refetch the messages
+                        await send({'type': 'websocket.close', 'code': OVERFLOW_CLOSE_CODE})
+                        return
+                    if not await is_allowed():
+                        # The user was removed from the chat after the connect
+                        await send({'type': 'websocket.close', 'code': CHAT_ACCESS_CLOSE_CODE})
+                        return
+                    await send({'type': 'websocket.send', 'text': payload_task.result()})
+                else:
+                    payload_task.cancel()
+                if receive_task in done:
+                    if receive_task.result()['type'] == 'websocket.disconnect':
+                        return
+                    receive_task = asyncio.ensure_future(receive())
+        finally:
+            receive_task.cancel()
@@ -0,0 +1,69 @@
+"""
+PostgreSQL backend which takes the connections from an in-process pool
+
+The pool is configured by the `POOL` dictionary of the database OPTIONS:
+`max_size`, `timeout` and `health_check_interval`. The connection is returned
+to the pool when Django closes it, so it must be used with CONN_MAX_AGE = 0.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from Chat.db.pool import (
+    ConnectionPool, DEFAULT_POOL_MAX_SIZE, DEFAULT_POOL_TIMEOUT, DEFAULT_POOL_HEALTH_CHECK_INTERVAL)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def check_connection(connection) -> bool:
+    """Returns whether the raw connection answers a trivial query"""
+    if connection.closed:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def reset_connection(connection):
+    """Rolls back the transaction left open on the raw connection before it goes back to the pool"""
+    if connection.closed:
+        raise base.Database.InterfaceError('The connection is closed')
+    if connection.get_transaction_status() != base.Database.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('POOL', None)
+        return conn_params
+
+    def get_pool(self, conn_params) -> ConnectionPool:
+        """Returns the pool of the database alias, it's shared by the threads of the process"""
+        with _pools_lock:
+            pool = _pools.get(self.alias)
+            if pool is None:
+                options = self.settings_dict['OPTIONS'].get('POOL', {})
+                pool = _pools[self.alias] = ConnectionPool(
+                    connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+                    check=check_connection,
+                    reset=reset_connection,
+                    max_size=int(options.get('max_size', DEFAULT_POOL_MAX_SIZE)),
+                    timeout=float(options.get('timeout', DEFAULT_POOL_TIMEOUT)),
+                    health_check_interval=float(
+                        options.get('health_check_interval', DEFAULT_POOL_HEALTH_CHECK_INTERVAL)))
+            return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool(conn_params).acquire()
+        # The isolation level of the session is set once when the pooled connection is opened
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool(None).release(self.connection)
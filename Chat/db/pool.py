@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+DEFAULT_POOL_MAX_SIZE = 10
+DEFAULT_POOL_TIMEOUT = 10.0
+DEFAULT_POOL_HEALTH_CHECK_INTERVAL = 30.0
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of the database connections of the current process
+
+    At most `max_size` connections are open, checked out or idle. An idle
+    connection is checked before it is reused if it has been idle for more
+    than `health_check_interval` seconds, broken connections are replaced.
+    `acquire` waits up to `timeout` seconds for a free connection.
+    """
+
+    def __init__(self, connect, check, reset=None, max_size=DEFAULT_POOL_MAX_SIZE,
+                 timeout=DEFAULT_POOL_TIMEOUT, health_check_interval=DEFAULT_POOL_HEALTH_CHECK_INTERVAL):
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # Idle connections with the time they were returned, the most recent ones are reused first
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """Returns the number of the open connections"""
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        """Returns the number of the idle connections"""
+        return len(self._idle)
+
+    def acquire(self):
+        """Returns an idle or a new connection, waits if all connections are checked out"""
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    if time.monotonic() - released_at < self.health_check_interval or self._is_usable(connection):
+                        return connection
+                    self._discard(connection)
+                    continue
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(
+                        f'No database connection is available in the pool of {self.max_size} connections '
+                        f'after {self.timeout} seconds')
+                self._condition.wait(remaining)
+        try:
+            return self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection):
+        """Returns the connection to the pool, the connection which can't be reset is closed"""
+        try:
+            if self.reset is not None:
+                self.reset(connection)
+        except Exception:
+            with self._condition:
+                self._discard(connection)
+                self._condition.notify()
+            return
+        with self._condition:
+            if self._size > self.max_size:
+                # The pool is closed or shrunk
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """Closes the idle connections, the checked out ones are closed when they are released"""
+        with self._condition:
+            while self._idle:
+                connection, released_at = self._idle.pop()
+                self._discard(connection)
+            self.max_size = 0
+            self._condition.notify_all()
+
+    def _is_usable(self, connection) -> bool:
+        try:
+            return self.check(connection)
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        """Closes the connection and frees its slot, the caller holds the lock"""
+        self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,68 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_REPLICA_STICKINESS_SECONDS = '5'
+
+_use_primary = ContextVar('chat_use_primary', default=False)
+
+
+def get_read_replicas() -> list:
+    """Returns the database aliases of the read replicas configured by CHAT_CONFIGURATION['read_replicas']"""
+    replicas = [
+        alias.strip()
+        for alias in settings.CHAT_CONFIGURATION.get('read_replicas', '').split(',')
+        if alias.strip()
+    ]
+    unknown = [alias for alias in replicas if alias not in settings.DATABASES]
+    if unknown:
+        raise ImproperlyConfigured(
+            f"CHAT_CONFIGURATION['read_replicas'] contains unknown databases: {', '.join(unknown)}")
+    return replicas
+
+
+def get_replica_stickiness_seconds() -> int:
+    """Returns the number of seconds the reads of a client go to the primary after its write"""
+    return int(settings.CHAT_CONFIGURATION.get('replica_stickiness_seconds', DEFAULT_REPLICA_STICKINESS_SECONDS))
+
+
+@contextmanager
+def use_primary():
+    """Sends the reads inside the block to the primary database"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads to a random read replica and the writes to the primary database
+
+    The reads go to the primary inside a transaction of the primary and inside
+    `use_primary`, which gives the client its own writes while the replicas lag.
+    Migrations are applied to the primary only, the replicas get them by replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_read_replicas()
+        if not replicas or _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
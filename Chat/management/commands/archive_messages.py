@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from Chat.models.archived_message import ArchivedMessage
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.archive import get_archive_after_days, get_archive_cutoff
+
+ARCHIVED_FIELDS = ('id', 'chat_room_id', 'sender_id', 'text', 'date')
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the messages older than CHAT_CONFIGURATION[\'archive_after_days\'] which every participant '
+        'of the chat has read to the archive table. Every batch is moved in its own short transaction, '
+        'oldest messages first. The archived messages are removed from the search index.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Age of the messages to archive in days, overrides the configuration')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of messages moved in a single transaction')
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Stop after this number of batches')
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to pause between the batches to let the writers in')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_archive_after_days()
+        if days is None:
+            raise CommandError("The archive is disabled, set CHAT_CONFIGURATION['archive_after_days'] or --days")
+        cutoff = get_archive_cutoff(days)
+        archived_count = 0
+        batches = 0
+        # Walk chat by chat, so every batch is found by the (chat_room, date, id) index
+        for chat_uuid in ChatRoom.objects.order_by('id').values_list('id', flat=True).iterator():
+            while options['max_batches'] is None or batches < options['max_batches']:
+                moved = self.archive_batch(chat_uuid, cutoff, options['batch_size'])
+                if not moved:
+                    break
+                archived_count += moved
+                batches += 1
+                self.stdout.write(f'Archived {archived_count} messages')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived_count} messages older than {cutoff.isoformat()}'))
+
+    @classmethod
+    def archive_batch(cls, chat_uuid, cutoff, batch_size) -> int:
+        """Moves the oldest batch of messages of the chat before the cutoff, returns the number of moved messages"""
+        with transaction.atomic():
+            read = cls.read_by_everyone(chat_uuid)
+            if read is None:
+                return 0
+            rows = list(
+                Message.objects
+                .filter(read, chat_room=chat_uuid, date__lt=cutoff)
+                .order_by('date', 'id')
+                .values_list(*ARCHIVED_FIELDS, 'change_seq')[:batch_size])
+            if not rows:
+                return 0
+            ArchivedMessage.objects.bulk_create(
+                [ArchivedMessage(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows],
+                ignore_conflicts=True)
+            # The archived messages still exist, so they leave no tombstones
+            Message.objects.filter(id__in=[row[0] for row in rows]).delete(tombstones=False)
+            # The pagination reads the archive boundary of the chat instead of the configured age,
+            # the delta sync makes the clients which haven't synced the archived changes reload the chat
+            newest_date = Value(rows[-1][ARCHIVED_FIELDS.index('date')])
+            newest_seq = max(row[-1] for row in rows)
+            ChatRoom.objects.filter(id=chat_uuid).update(
+                archived_until=Greatest(Coalesce(F('archived_until'), newest_date), newest_date),
+                archived_seq=Greatest(F('archived_seq'), Value(newest_seq)))
+        return len(rows)
+
+    @staticmethod
+    def read_by_everyone(chat_uuid):
+        """
+        Returns the condition of the messages which every participant of the chat has read
+
+        The archived messages are read by everyone, so the unread messages stay in the hot table.
+        Returns None if some participant hasn't read anything.
+        """
+        participants = Participant.objects.filter(chat_room=chat_uuid)
+        if participants.filter(last_read_at__isnull=True).exists():
+            return None
+        oldest_watermark = (
+            participants
+            .order_by('last_read_at', F('last_read_message').asc(nulls_last=True))
+            .values_list('last_read_at', 'last_read_message')
+            .first())
+        if oldest_watermark is None:
+            # Nobody participates in the chat
+            return Q()
+        date, message_uuid = oldest_watermark
+        if message_uuid is None:
+            return Q(date__lte=date)
+        return Q(date__lt=date) | Q(date=date, id__lte=message_uuid)
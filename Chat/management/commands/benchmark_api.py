@@ -0,0 +1,305 @@
+import asyncio
+import json
+import platform
+import random
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.receipts import get_read_receipts
+from Chat.utils.search import get_search_backend
+
+PREFIX = 'api_benchmark_'
+ENDPOINTS = ['fetch_messages', 'fetch_unread', 'send_message', 'fetch_rooms']
+INTERFACES = ['wsgi', 'asgi']
+CSRF_TOKEN = 'b' * 32
+# The query count reported by Chat.middleware.InstrumentationMiddleware
+SERVER_TIMING_QUERIES_REGEX = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives the Chat API in process against synthesized chats and reports throughput, '
+        'latency percentiles and queries per request of every endpoint as JSON. Under WSGI the '
+        'requests go through the Django test client from several threads like a threaded WSGI '
+        'worker, under ASGI they go concurrently through the ASGI application on one event loop '
+        'like an ASGI worker and use the async views where they exist. '
+        'It creates and deletes its own users and chats, so run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rooms', type=int, default=10,
+            help='Number of chats to synthesize')
+        parser.add_argument(
+            '--members', type=int, default=50,
+            help='Number of participants of every chat')
+        parser.add_argument(
+            '--messages', type=int, default=1000,
+            help='Number of messages of every chat')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Number of requests to every endpoint')
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Number of concurrent clients: threads under WSGI or coroutines under ASGI')
+        parser.add_argument(
+            '--interface', choices=INTERFACES, default='wsgi',
+            help='Server interface which handles the requests')
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS,
+            help='Endpoints to measure')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the chosen users and chats')
+        parser.add_argument(
+            '--output', default=None,
+            help='File to write the JSON report to instead of the standard output')
+
+    def handle(self, *args, **options):
+        users = self.create_users(options['members'])
+        rooms = [self.create_room(i, users, options['messages']) for i in range(options['rooms'])]
+        try:
+            results = {}
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for endpoint in options['endpoints']:
+                    results[endpoint] = self.measure(endpoint, users, rooms, options)
+            # Don't leave the deferred receipts of the deleted chats behind
+            get_read_receipts().flush()
+        finally:
+            self.delete_rooms(rooms)
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+        report = {
+            'parameters': {
+                name: options[name]
+                for name in ['rooms', 'members', 'messages', 'requests', 'threads', 'interface', 'endpoints', 'seed']},
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'chat_configuration': settings.CHAT_CONFIGURATION,
+            },
+            'created_at': timezone.now().isoformat(),
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure(self, endpoint, users, rooms, options):
+        """Sends the requests to the endpoint from the concurrent clients and summarizes them"""
+        randomizer = random.Random(f'{options["seed"]}:{endpoint}')
+        # The (user, chat) pairs are chosen beforehand, so every run sends the same requests
+        targets = [(randomizer.choice(users), randomizer.choice(rooms)) for _ in range(options['requests'])]
+        threads = max(1, options['threads'])
+        start = time.perf_counter()
+        if options['interface'] == 'asgi':
+            samples = asyncio.run(self.send_asgi(endpoint, targets, threads))
+        else:
+            samples = self.send_wsgi(endpoint, targets, threads)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(sample[0] for sample in samples)
+        queries = [sample[1] for sample in samples if sample[1] is not None]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies) * 1000, 3),
+                'p50': round(self.percentile(latencies, 0.5) * 1000, 3),
+                'p95': round(self.percentile(latencies, 0.95) * 1000, 3),
+                'p99': round(self.percentile(latencies, 0.99) * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            },
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        }
+
+    def send_wsgi(self, endpoint, targets, threads):
+        """Sends the requests through the test client from the threads, returns the samples"""
+        samples = []
+        lock = threading.Lock()
+
+        def work(thread_targets):
+            # Every user of the thread keeps its own session
+            clients = {}
+            thread_samples = []
+            try:
+                for index, (user, room) in enumerate(thread_targets):
+                    if user.id not in clients:
+                        clients[user.id] = Client()
+                        clients[user.id].force_login(user)
+                    method, path, params, body = self.request(endpoint, room, index, 'wsgi')
+                    start = time.perf_counter()
+                    if method == 'POST':
+                        response = clients[user.id].post(path, body, content_type='application/json')
+                    else:
+                        response = clients[user.id].get(path, params)
+                    latency = time.perf_counter() - start
+                    thread_samples.append(
+                        (latency, self.count_queries(response.get('Server-Timing')), response.status_code))
+            finally:
+                close_old_connections()
+            with lock:
+                samples.extend(thread_samples)
+
+        if threads == 1:
+            work(targets)
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(work, [targets[i::threads] for i in range(threads)]))
+        return samples
+
+    async def send_asgi(self, endpoint, targets, concurrency):
+        """Sends the requests through the ASGI application from the coroutines, returns the samples"""
+        application = get_asgi_application()
+        # The sessions are created beforehand, the logins are not measured
+        users = {user.id: user for user, room in targets}
+        cookies = await asyncio.get_running_loop().run_in_executor(None, self.login_users, list(users.values()))
+        samples = []
+        pending = iter(enumerate(targets))
+
+        async def work():
+            for index, (user, room) in pending:
+                method, path, params, body = self.request(endpoint, room, index, 'asgi')
+                start = time.perf_counter()
+                status_code, headers = await self.send_asgi_request(
+                    application, method, path, urlencode(params), body, cookies[user.id])
+                latency = time.perf_counter() - start
+                samples.append((latency, self.count_queries(headers.get('server-timing')), status_code))
+
+        await asyncio.gather(*(work() for _ in range(concurrency)))
+        return samples
+
+    @staticmethod
+    def login_users(users):
+        """Returns the session cookie header of every user"""
+        cookies = {}
+        try:
+            for user in users:
+                client = Client()
+                client.force_login(user)
+                cookies[user.id] = '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+        finally:
+            close_old_connections()
+        return cookies
+
+    @staticmethod
+    async def send_asgi_request(application, method, path, query_string, body, cookie):
+        """Sends the HTTP request to the ASGI application like an ASGI server, returns the status and the headers"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                # The async views are protected from CSRF like the sessions of the browsers
+                (b'cookie', f'{cookie}; {settings.CSRF_COOKIE_NAME}={CSRF_TOKEN}'.encode()),
+                (b'x-csrftoken', CSRF_TOKEN.encode()),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        events = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        response = {}
+
+        async def receive():
+            if events:
+                return events.pop(0)
+            # The client stays connected until the response is sent
+            await asyncio.Event().wait()
+
+        async def send(event):
+            if event['type'] == 'http.response.start':
+                response['status'] = event['status']
+                response['headers'] = {name.decode().lower(): value.decode() for name, value in event['headers']}
+
+        await application(scope, receive, send)
+        return response['status'], response['headers']
+
+    @staticmethod
+    def count_queries(server_timing):
+        """Returns the query count from the Server-Timing header or None without the instrumentation"""
+        match = SERVER_TIMING_QUERIES_REGEX.search(server_timing or '')
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def request(endpoint, room, index, interface):
+        """Returns the method, the path, the query parameters and the body of the request to the endpoint"""
+        # The async views serve the same API under ASGI
+        prefix = '/api/async' if interface == 'asgi' else '/api'
+        if endpoint == 'fetch_messages':
+            return 'GET', f'{prefix}/chat/{room.id}/messages', {'messages_type': 'read', 'count': '20'}, b''
+        if endpoint == 'fetch_unread':
+            return 'GET', f'{prefix}/chat/{room.id}/messages', {'messages_type': 'unread', 'count': '20'}, b''
+        if endpoint == 'send_message':
+            body = json.dumps({'text': f'Benchmark message {index}'}).encode()
+            return 'POST', f'{prefix}/chat/{room.id}/send', {}, body
+        return 'GET', '/api/chats', {'count': '20'}, b''
+
+    @staticmethod
+    def percentile(values, fraction):
+        return values[int(fraction * (len(values) - 1))]
+
+    @staticmethod
+    def create_users(count):
+        User.objects.bulk_create(
+            [User(username=f'{PREFIX}{i}') for i in range(count)],
+            batch_size=1000)
+        return list(User.objects.filter(username__startswith=PREFIX).order_by('id'))
+
+    @staticmethod
+    def create_room(number, users, messages_count):
+        date = timezone.now() - timedelta(seconds=messages_count)
+        room = ChatRoom.objects.create(name=f'{PREFIX}{number}', last_message_at=date, last_seq=messages_count)
+        Participant.objects.bulk_create(
+            [Participant(person=user, chat_room=room) for user in users],
+            batch_size=1000)
+        Message.objects.bulk_create(
+            [Message(
+                chat_room=room,
+                sender=users[i % len(users)],
+                text=f'Benchmark history {i}',
+                date=date + timedelta(seconds=i),
+                seq=i + 1,
+                change_seq=i + 1) for i in range(messages_count)],
+            batch_size=1000)
+        return room
+
+    @staticmethod
+    def delete_rooms(rooms):
+        """Deletes the chats without loading their messages for the deletion signals"""
+        field = Message._meta.get_field('chat_room')
+        for room in rooms:
+            Participant.objects.filter(chat_room=room).update(last_read_message=None)
+            get_search_backend().remove_chat_messages(room.id)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {Message._meta.db_table} WHERE {field.column} = %s',
+                    [field.get_db_prep_value(room.id, connection)])
+            room.delete()
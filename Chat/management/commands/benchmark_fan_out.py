@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.participant import Participant
+from Chat.utils.fanout import FAN_OUT_STRATEGIES, get_fan_out_strategy
+
+USERNAME_PREFIX = 'fan_out_benchmark_'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the send_message latency against the chat size for every fan-out strategy. '
+        'It creates and deletes its own users and chats, so run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10, 100, 1000, 5000],
+            help='Numbers of chat participants')
+        parser.add_argument(
+            '--messages', type=int, default=20,
+            help='Number of messages to send for every strategy and chat size')
+        parser.add_argument(
+            '--strategies', nargs='+', choices=list(FAN_OUT_STRATEGIES), default=list(FAN_OUT_STRATEGIES),
+            help='Fan-out strategies to measure')
+
+    def handle(self, *args, **options):
+        users = self.create_users(max(options['sizes']))
+        try:
+            self.stdout.write(f'{"strategy":<10}{"size":>8}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"drain ms":>10}')
+            for size in options['sizes']:
+                chat_room = self.create_chat_room(users[:size])
+                try:
+                    for name in options['strategies']:
+                        self.measure(name, chat_room, users[0], size, options['messages'])
+                finally:
+                    chat_room.delete()
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    def measure(self, name, chat_room, sender, size, messages_count):
+        configuration = dict(settings.CHAT_CONFIGURATION, fan_out_strategy=name)
+        with override_settings(CHAT_CONFIGURATION=configuration):
+            latencies = []
+            for i in range(messages_count):
+                start = time.perf_counter()
+                with transaction.atomic():
+                    ChatRoom.send_message(
+                        chat_uuid=chat_room.id,
+                        user_id=sender.id,
+                        text=f'Benchmark message {i}')
+                latencies.append(time.perf_counter() - start)
+            # Time left for the background worker to finish the fan-out
+            start = time.perf_counter()
+            strategy = get_fan_out_strategy()
+            if hasattr(strategy, 'join'):
+                strategy.join()
+            drain = time.perf_counter() - start
+        latencies.sort()
+        self.stdout.write(
+            f'{name:<10}{size:>8}'
+            f'{statistics.mean(latencies) * 1000:>10.2f}'
+            f'{statistics.median(latencies) * 1000:>10.2f}'
+            f'{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>10.2f}'
+            f'{drain * 1000:>10.2f}')
+
+    @staticmethod
+    def create_users(count):
+        User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}') for i in range(count)],
+            batch_size=1000)
+        return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+
+    @staticmethod
+    def create_chat_room(users):
+        chat_room = ChatRoom.objects.create(name=f'{USERNAME_PREFIX}{len(users)}')
+        Participant.objects.bulk_create(
+            [Participant(person=user, chat_room=chat_room) for user in users],
+            batch_size=1000)
+        return chat_room
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.search import get_search_backend
+
+USERNAME = 'search_benchmark'
+VOCABULARY_SIZE = 5000
+WORDS_PER_MESSAGE = 8
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the full-text search latency over a generated chat history. '
+        'It creates and deletes its own user and chat, so run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages', type=int, default=1000000,
+            help='Number of messages to generate')
+        parser.add_argument(
+            '--queries', type=int, default=100,
+            help='Number of queries to measure for every number of words')
+        parser.add_argument(
+            '--count', type=int, default=20,
+            help='Number of results in the page')
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Number of messages inserted and indexed in a single transaction')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the generated texts and queries')
+
+    def handle(self, *args, **options):
+        randomizer = random.Random(options['seed'])
+        vocabulary = [f'word{i}' for i in range(VOCABULARY_SIZE)]
+        user = User.objects.create(username=USERNAME)
+        chat_room = ChatRoom.objects.create(name=USERNAME)
+        try:
+            Participant.objects.create(person=user, chat_room=chat_room)
+            start = time.perf_counter()
+            self.create_messages(chat_room, user, vocabulary, randomizer, options['messages'], options['batch_size'])
+            self.stdout.write(f'Generated and indexed {options["messages"]} messages in {time.perf_counter() - start:.1f} s')
+            self.stdout.write(f'{"words":<8}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"results":>10}')
+            for words in [1, 2, 3]:
+                self.measure(user, vocabulary, randomizer, words, options['queries'], options['count'])
+        finally:
+            self.delete_messages(chat_room)
+            chat_room.delete()
+            user.delete()
+
+    def measure(self, user, vocabulary, randomizer, words, queries, count):
+        backend = get_search_backend()
+        latencies = []
+        results = 0
+        for _ in range(queries):
+            query = ' '.join(randomizer.sample(vocabulary, words))
+            start = time.perf_counter()
+            rows, next_cursor = backend.search(user.id, query, count)
+            latencies.append(time.perf_counter() - start)
+            results += len(rows)
+        latencies.sort()
+        self.stdout.write(
+            f'{words:<8}'
+            f'{statistics.mean(latencies) * 1000:>10.2f}'
+            f'{statistics.median(latencies) * 1000:>10.2f}'
+            f'{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>10.2f}'
+            f'{results / queries:>10.1f}')
+
+    @staticmethod
+    def create_messages(chat_room, user, vocabulary, randomizer, count, batch_size):
+        backend = get_search_backend()
+        date = timezone.now()
+        for offset in range(0, count, batch_size):
+            messages = [
+                Message(
+                    chat_room=chat_room,
+                    sender=user,
+                    text=' '.join(randomizer.choices(vocabulary, k=WORDS_PER_MESSAGE)),
+                    date=date + timedelta(microseconds=i),
+                    seq=i + 1,
+                    change_seq=i + 1)
+                for i in range(offset, min(offset + batch_size, count))]
+            with transaction.atomic():
+                ChatRoom.objects.filter(id=chat_room.id).update(last_seq=offset + len(messages))
+                Message.objects.bulk_create(messages)
+                backend.index_messages(messages)
+
+    @staticmethod
+    def delete_messages(chat_room):
+        """Deletes the generated messages without loading them for the deletion signals"""
+        get_search_backend().remove_chat_messages(chat_room.id)
+        field = Message._meta.get_field('chat_room')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Message._meta.db_table} WHERE {field.column} = %s',
+                [field.get_db_prep_value(chat_room.id, connection)])
@@ -0,0 +1,93 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.test import override_settings
+from django.utils import timezone
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.serializers import MessageSerializer, render_message_rows, orjson
+
+USERNAME = 'serialization_benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares MessageSerializer with the rows fast path for pages of messages. '
+        'It creates and deletes its own user and chat, so run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--counts', nargs='+', type=int, default=[10, 50],
+            help='Numbers of messages in the page')
+        parser.add_argument(
+            '--iterations', type=int, default=200,
+            help='Number of pages to serialize for every path and page size')
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=USERNAME)
+        chat_room = ChatRoom.objects.create(name=USERNAME)
+        try:
+            Participant.objects.create(person=user, chat_room=chat_room)
+            self.create_messages(chat_room, user, max(options['counts']))
+            paths = {
+                'serializer': self.serializer_path,
+                'rows/json': self.rows_path,
+            }
+            if orjson is not None:
+                paths['rows/orjson'] = self.rows_orjson_path
+            self.stdout.write(f'{"path":<14}{"count":>8}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}')
+            for count in options['counts']:
+                messages = Message.objects.filter(chat_room=chat_room)[:count]
+                for name, path in paths.items():
+                    self.measure(name, path, messages, count, options['iterations'])
+        finally:
+            chat_room.delete()
+            user.delete()
+
+    def measure(self, name, path, messages, count, iterations):
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            path(messages)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        self.stdout.write(
+            f'{name:<14}{count:>8}'
+            f'{statistics.mean(latencies) * 1000:>10.3f}'
+            f'{statistics.median(latencies) * 1000:>10.3f}'
+            f'{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>10.3f}')
+
+    @staticmethod
+    def serializer_path(messages):
+        return JsonResponse(MessageSerializer(list(messages.all()), many=True).data, safe=False).content
+
+    @staticmethod
+    def rows_path(messages):
+        with override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, json_backend='json')):
+            return render_message_rows(list(messages.all().as_rows()))
+
+    @staticmethod
+    def rows_orjson_path(messages):
+        with override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, json_backend='orjson')):
+            return render_message_rows(list(messages.all().as_rows()))
+
+    @staticmethod
+    def create_messages(chat_room, user, count):
+        date = timezone.now()
+        Message.objects.bulk_create(
+            [Message(
+                chat_room=chat_room,
+                sender=user,
+                text=f'Benchmark message {i}',
+                date=date + timedelta(microseconds=i),
+                seq=i + 1,
+                change_seq=i + 1) for i in range(count)],
+            batch_size=1000)
+        ChatRoom.objects.filter(id=chat_room.id).update(last_seq=count)
@@ -0,0 +1,78 @@
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from Chat.models.chat_room import ChatRoom
+from Chat.serializers import render_export_lines
+from Chat.utils.export import compress_gzip
+
+# Number of bytes read from the end of the output to find the last complete line on resume
+RESUME_READ_SIZE = 64 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports the whole history of the chat, the archived messages included, as NDJSON. '
+        'Every line has the cursor of the message, so an interrupted export is continued with --cursor or --resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('chat_uuid', help='Primary key of the chat to export')
+        parser.add_argument(
+            '--output', default=None,
+            help='File to write, the standard output by default')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Compress the output with gzip, requires --output')
+        parser.add_argument(
+            '--cursor', default=None,
+            help='Continue the export after the message with this cursor')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue the uncompressed --output file after its last complete line')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help="Number of messages fetched at once, CHAT_CONFIGURATION['export_chunk_size'] by default")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if options['gzip'] and output is None:
+            raise CommandError('--gzip requires --output')
+        if options['resume'] and (output is None or options['gzip']):
+            raise CommandError('--resume requires the uncompressed --output file')
+        cursor = options['cursor']
+        if options['resume'] and os.path.exists(output):
+            cursor = self.truncate_to_last_line(output) or cursor
+        try:
+            rows = ChatRoom.export_messages(options['chat_uuid'], cursor=cursor, chunk_size=options['chunk_size'])
+        except ValidationError as err:
+            raise CommandError(' '.join(err.messages))
+        chunks = render_export_lines(rows)
+        if output is None:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+        if options['gzip']:
+            chunks = compress_gzip(chunks)
+        exported_bytes = 0
+        with open(output, 'ab' if options['resume'] else 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                exported_bytes += len(chunk)
+        self.stderr.write(f'Exported {exported_bytes} bytes to {output}')
+
+    @staticmethod
+    def truncate_to_last_line(path):
+        """Drops the incomplete last line of the file and returns the cursor of the last complete one or None"""
+        with open(path, 'rb+') as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(0, size - RESUME_READ_SIZE))
+            tail = file.read()
+            end = tail.rfind(b'\n')
+            # The lines are much shorter than the read size, so no newline means no complete line
+            file.truncate(size - len(tail) + end + 1)
+            if end == -1:
+                return None
+            start = tail.rfind(b'\n', 0, end) + 1
+            return json.loads(tail[start:end])['cursor']
@@ -0,0 +1,239 @@
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+
+import django
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext as _
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.error_messages import INVALID_IMPORT_LINE_MESSAGE
+from Chat.utils.search import get_search_backend
+from Chat.utils.validators import validate_message_text
+
+# Namespace of the ids derived from the content of the imported messages which have no `id`
+IMPORT_NAMESPACE = uuid.UUID('5b0f8c52-63d4-4f0a-9d8e-4c1f0bb1d0a7')
+UNREAD_MODES = ['recount', 'skip']
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports historical messages from JSONL lines with the `chat_room`, `sender`, `text`, `date` and optional '
+        '`id` fields. The messages are inserted with bulk INSERTs without the per-message fan-out, the chats are '
+        'imported in parallel processes and the progress is checkpointed, so a rerun continues the interrupted import.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='JSONL file to import, `.gz` files are decompressed, `-` reads stdin')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of messages inserted in a single transaction')
+        parser.add_argument(
+            '--segment-size', type=int, default=100000,
+            help='Number of input lines imported between the checkpoints')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of processes which import the chats in parallel')
+        parser.add_argument(
+            '--unread', choices=UNREAD_MODES, default='recount',
+            help='`recount` recounts the unread counters of the imported chats at the end, `skip` leaves them')
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='File which keeps the number of imported lines, `<input>.checkpoint` by default')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        if checkpoint is None and options['input'] != '-':
+            checkpoint = f'{options["input"]}.checkpoint'
+        done_lines = read_checkpoint(checkpoint)
+        if done_lines:
+            self.stdout.write(f'Resuming after line {done_lines}')
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite allows a single writer at a time, the chats are imported by a single worker')
+            workers = 1
+        stats = {'imported': 0, 'existing': 0, 'invalid': 0}
+        chats = set()
+        start = time.perf_counter()
+        with open_input(options['input']) as lines, self.executor(workers) as executor:
+            line_number = 0
+            segment = {}
+            pending = 0
+            for line_number, line in enumerate(lines, 1):
+                if line_number <= done_lines or not line.strip():
+                    continue
+                try:
+                    chat_uuid, row = parse_line(line)
+                except ValidationError as err:
+                    stats['invalid'] += 1
+                    self.stderr.write(f'Line {line_number}: {" ".join(err.messages)}')
+                    continue
+                segment.setdefault(chat_uuid, []).append(row)
+                pending += 1
+                if pending >= options['segment_size']:
+                    self.import_segment(executor, segment, options['batch_size'], stats)
+                    chats.update(segment)
+                    segment = {}
+                    pending = 0
+                    write_checkpoint(checkpoint, line_number)
+                    self.report(stats, start)
+            self.import_segment(executor, segment, options['batch_size'], stats)
+            chats.update(segment)
+            write_checkpoint(checkpoint, max(line_number, done_lines))
+        if options['unread'] == 'recount':
+            for chat_uuid in chats:
+                Participant.objects.recount_unread_counts(chat_uuid)
+        self.report(stats, start, self.style.SUCCESS)
+
+    def import_segment(self, executor, segment, batch_size, stats):
+        """Imports the rows of the segment chat by chat, the chats are imported concurrently by the executor"""
+        chats = list(segment)
+        results = executor.map(
+            import_chat_messages, chats, [segment[chat_uuid] for chat_uuid in chats], repeat(batch_size))
+        for chat_uuid, result in zip(chats, results):
+            if result['unknown_chat']:
+                self.stderr.write(f'Chat {chat_uuid} doesn\'t exist, its messages are skipped')
+            for key in stats:
+                stats[key] += result[key]
+
+    def report(self, stats, start, style=None):
+        elapsed = time.perf_counter() - start
+        rate = stats['imported'] / elapsed if elapsed else 0.0
+        message = (
+            f'Imported {stats["imported"]} messages, skipped {stats["existing"]} existing '
+            f'and {stats["invalid"]} invalid in {elapsed:.1f}s ({rate:.0f} rows/s)')
+        self.stdout.write(style(message) if style else message)
+
+    @staticmethod
+    @contextmanager
+    def executor(workers):
+        """Returns the process pool or the inline executor for a single worker"""
+        if workers <= 1:
+            yield InlineExecutor()
+            return
+        # The forked workers must open connections of their own
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            yield executor
+
+
+class InlineExecutor:
+    """Runs the tasks in the current process, so the import doesn't need a database shared between processes"""
+
+    @staticmethod
+    def map(func, *iterables):
+        return map(func, *iterables)
+
+
+@contextmanager
+def open_input(path):
+    if path == '-':
+        yield sys.stdin
+    elif path.endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            yield file
+    else:
+        with open(path, encoding='utf-8') as file:
+            yield file
+
+
+def read_checkpoint(path) -> int:
+    """Returns the number of the input lines imported by the previous runs"""
+    if path is None or not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as file:
+            return int(json.load(file)['lines'])
+    except (ValueError, KeyError, TypeError):
+        raise CommandError(f'The checkpoint {path} is corrupted, remove it to import from the beginning')
+
+
+def write_checkpoint(path, lines: int):
+    if path is None:
+        return
+    # The file is replaced atomically, so an interrupted write leaves the previous checkpoint
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump({'lines': lines}, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def parse_line(line: str) -> tuple:
+    """Validates the JSONL line, returns the chat id and the (id, sender, text, date) row of the message"""
+    try:
+        data = json.loads(line)
+        chat_uuid = uuid.UUID(str(data['chat_room']))
+        sender = data['sender']
+        text = data['text']
+        date = parse_datetime(data['date'])
+        message_uuid = uuid.UUID(str(data['id'])) if data.get('id') is not None else None
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValidationError(_(INVALID_IMPORT_LINE_MESSAGE))
+    if not isinstance(sender, int) or isinstance(sender, bool) or not isinstance(text, str) or date is None:
+        raise ValidationError(_(INVALID_IMPORT_LINE_MESSAGE))
+    validate_message_text(text)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    if message_uuid is None:
+        # The same line gets the same id, so a repeated import skips it
+        message_uuid = uuid.uuid5(IMPORT_NAMESPACE, f'{chat_uuid}:{sender}:{date.isoformat()}:{text}')
+    return chat_uuid, (message_uuid, sender, text, date)
+
+
+def import_chat_messages(chat_uuid, rows, batch_size: int) -> dict:
+    """Imports the rows of the chat in batches, every batch is a transaction of its own"""
+    result = {'imported': 0, 'existing': 0, 'invalid': 0, 'unknown_chat': False}
+    rows = sorted({row[0]: row for row in rows}.values(), key=lambda row: (row[3], row[0]))
+    for offset in range(0, len(rows), batch_size):
+        try:
+            imported, existing, invalid = import_batch(chat_uuid, rows[offset:offset + batch_size])
+        except ChatRoom.DoesNotExist:
+            result['invalid'] += len(rows) - offset
+            result['unknown_chat'] = True
+            break
+        result['imported'] += imported
+        result['existing'] += existing
+        result['invalid'] += invalid
+    return result
+
+
+def import_batch(chat_uuid, rows) -> tuple:
+    """
+    Inserts the messages of the batch which aren't imported yet, returns the numbers of imported, existing
+    and invalid rows
+
+    The messages are numbered by a single UPDATE of the chat, inserted with a bulk INSERT and indexed
+    for the search. They aren't fanned out, the unread counters are recounted after the import.
+    """
+    with transaction.atomic():
+        existing = set(
+            Message.objects
+            .filter(id__in=[row[0] for row in rows])
+            .values_list('id', flat=True))
+        senders = set(
+            User.objects
+            .filter(id__in={row[1] for row in rows})
+            .values_list('id', flat=True))
+        messages = [
+            Message(chat_room_id=chat_uuid, sender_id=sender, text=text, date=date, id=message_uuid)
+            for message_uuid, sender, text, date in rows
+            if message_uuid not in existing and sender in senders]
+        if messages:
+            first_seq = ChatRoom.allocate_seq(chat_uuid, len(messages), messages[-1].date)
+            for index, message in enumerate(messages):
+                message.seq = message.change_seq = first_seq + index
+            Message.objects.bulk_create(messages)
+            get_search_backend().index_messages(messages)
+    invalid = sum(1 for row in rows if row[0] not in existing and row[1] not in senders)
+    return len(messages), len(existing), invalid
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Chat.utils.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text index of the messages of CHAT_CONFIGURATION['search_backend'] from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of messages indexed with a single statement')
+
+    def handle(self, *args, **options):
+        indexed_count = get_search_backend().rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed_count} messages'))
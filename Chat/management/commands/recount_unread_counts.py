@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.participant import Participant
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the unread counters of the participants from their read watermarks. '
+        'Run it after switching CHAT_CONFIGURATION[\'fan_out_strategy\'] from `lazy`, '
+        'which doesn\'t maintain the counters, to `eager` or `deferred`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'chat_uuids', nargs='*',
+            help='Primary keys of the chats to recount, all chats by default')
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Seconds to pause between the chats to let the writers in')
+
+    def handle(self, *args, **options):
+        chat_uuids = options['chat_uuids'] or ChatRoom.objects.order_by('id').values_list('id', flat=True).iterator()
+        chats_count = 0
+        participants_count = 0
+        # Every chat is recounted with a single UPDATE in its own transaction
+        for chat_uuid in chat_uuids:
+            participants_count += Participant.objects.recount_unread_counts(chat_uuid)
+            chats_count += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted {participants_count} unread counters in {chats_count} chats'))
@@ -0,0 +1,116 @@
+import abc
+import asyncio
+
+from Chat.db.routers import get_read_replicas, get_replica_stickiness_seconds, use_primary
+from Chat.utils.metrics import measure_request, metrics_registry
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+SERVER_TIMING_HEADER = 'Server-Timing'
+USE_PRIMARY_COOKIE = 'chat_use_primary'
+
+
+class ChatMiddleware(abc.ABC):
+    """
+    Base of the middleware which runs in the mode of the next handler
+
+    Under ASGI the async views aren't adapted to the sync mode by this middleware,
+    the context variables it sets are copied to the threads of sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the instance as a coroutine function for the handler of Django
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    @abc.abstractmethod
+    def handle(self, request):
+        """Returns the response to the request in the sync mode"""
+
+    @abc.abstractmethod
+    async def __acall__(self, request):
+        """Returns the response to the request in the async mode"""
+
+
+class InstrumentationMiddleware(ChatMiddleware):
+    """
+    Measures the query count, the database time, the instrumented phases and the total time of the chat requests
+
+    The timings are reported to the client in the Server-Timing header
+    and aggregated for the Prometheus-style metrics endpoint.
+    """
+
+    def handle(self, request):
+        with measure_request() as timings:
+            response = self.get_response(request)
+            total = timings.total_seconds
+        return self.report(request, response, timings, total)
+
+    async def __acall__(self, request):
+        with measure_request() as timings:
+            response = await self.get_response(request)
+            total = timings.total_seconds
+        return self.report(request, response, timings, total)
+
+    def report(self, request, response, timings, total):
+        view = self.get_view_name(request)
+        if view is None:
+            return response
+        metrics_registry.observe_request(view, request.method, response.status_code, timings, total)
+        metrics = [f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.queries} queries"']
+        metrics += [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in timings.phases.items()]
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        response[SERVER_TIMING_HEADER] = ', '.join(metrics)
+        return response
+
+    @staticmethod
+    def get_view_name(request):
+        """Returns the name of the chat view which handled the request or None for the other requests"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.app_name != 'chat':
+            return None
+        return match.func.__name__
+
+
+class ReplicaStickinessMiddleware(ChatMiddleware):
+    """
+    Gives the clients their own writes while the read replicas lag behind the primary
+
+    The reads of a request which writes go to the primary. The response to
+    such a request sets a short-lived cookie, so the following reads of the
+    client also go to the primary for CHAT_CONFIGURATION['replica_stickiness_seconds'].
+    """
+
+    def handle(self, request):
+        if not self.is_sticky(request):
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if not self.is_sticky(request):
+            return await self.get_response(request)
+        with use_primary():
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    @staticmethod
+    def is_sticky(request) -> bool:
+        """Returns whether the reads of the request go to the primary"""
+        return request.method not in SAFE_METHODS or USE_PRIMARY_COOKIE in request.COOKIES
+
+    @staticmethod
+    def pin(request, response):
+        """Sends the following reads of the client which wrote to the primary"""
+        if request.method not in SAFE_METHODS and response.status_code < 400 and get_read_replicas():
+            response.set_cookie(
+                USE_PRIMARY_COOKIE, '1', max_age=get_replica_stickiness_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ('-date', '-id')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0002_message_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='chat_room',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Chat.chatroom'),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='chat_room',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Chat.chatroom'),
+        ),
+        migrations.AlterField(
+            model_name='unreadmessage',
+            name='participant',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Chat.participant'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_room', 'date', 'id'], name='message_room_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['chat_room', 'person'], name='participant_room_person_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='unreadmessage',
+            index=models.Index(fields=['participant', 'message'], name='unread_participant_msg_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:56
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def unread_messages_to_watermarks(apps, schema_editor):
+    """Moves the watermark of every participant right before its oldest unread message"""
+    Message = apps.get_model('Chat', 'Message')
+    Participant = apps.get_model('Chat', 'Participant')
+    for participant in Participant.objects.iterator(chunk_size=BATCH_SIZE):
+        read_messages = Message.objects.filter(chat_room=participant.chat_room_id)
+        oldest_unread = (
+            Message.objects
+            .filter(unreadmessage__participant=participant)
+            .order_by('date', 'id')
+            .values_list('date', 'id')
+            .first())
+        if oldest_unread is not None:
+            date, message_uuid = oldest_unread
+            read_messages = read_messages.filter(Q(date__lt=date) | Q(date=date, id__lt=message_uuid))
+        last_read = read_messages.order_by('-date', '-id').values_list('date', 'id').first()
+        if last_read is not None:
+            Participant.objects.filter(id=participant.id).update(
+                last_read_at=last_read[0],
+                last_read_message=last_read[1])
+
+
+def watermarks_to_unread_messages(apps, schema_editor):
+    """Creates UnreadMessage rows for messages after the watermark of every participant"""
+    Message = apps.get_model('Chat', 'Message')
+    Participant = apps.get_model('Chat', 'Participant')
+    UnreadMessage = apps.get_model('Chat', 'UnreadMessage')
+    for participant in Participant.objects.iterator(chunk_size=BATCH_SIZE):
+        unread_messages = (
+            Message.objects
+            .filter(chat_room=participant.chat_room_id)
+            .exclude(sender=participant.person_id))
+        if participant.last_read_at is not None:
+            date, message_uuid = participant.last_read_at, participant.last_read_message_id
+            if message_uuid is None:
+                unread_messages = unread_messages.filter(date__gt=date)
+            else:
+                unread_messages = unread_messages.filter(Q(date__gt=date) | Q(date=date, id__gt=message_uuid))
+        UnreadMessage.objects.bulk_create(
+            (UnreadMessage(message_id=message_uuid, participant=participant)
+             for message_uuid in unread_messages.values_list('id', flat=True).iterator()),
+            batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0003_message_unread_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Chat.message'),
+        ),
+        migrations.RunPython(unread_messages_to_watermarks, watermarks_to_unread_messages),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0004_participant_read_watermark'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='UnreadMessage',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:07
+
+from django.db import migrations, models
+from django.db.models import Q
+
+BATCH_SIZE = 1000
+
+
+def count_unread_messages(apps, schema_editor):
+    """Counts the messages of other participants after the watermark of every participant"""
+    Message = apps.get_model('Chat', 'Message')
+    Participant = apps.get_model('Chat', 'Participant')
+    for participant in Participant.objects.iterator(chunk_size=BATCH_SIZE):
+        unread_messages = (
+            Message.objects
+            .filter(chat_room=participant.chat_room_id)
+            .exclude(sender=participant.person_id))
+        if participant.last_read_at is not None:
+            date, message_uuid = participant.last_read_at, participant.last_read_message_id
+            if message_uuid is None:
+                unread_messages = unread_messages.filter(date__gt=date)
+            else:
+                unread_messages = unread_messages.filter(Q(date__gt=date) | Q(date=date, id__gt=message_uuid))
+        Participant.objects.filter(id=participant.id).update(unread_count=unread_messages.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0006_message_date_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread_messages, migrations.RunPython.noop),
+    ]
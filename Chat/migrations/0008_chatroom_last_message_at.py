@@ -0,0 +1,35 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:13
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.utils.timezone
+
+
+def fill_last_message_at(apps, schema_editor):
+    """Moves the last activity of every chat with messages to the date of its newest message"""
+    ChatRoom = apps.get_model('Chat', 'ChatRoom')
+    Message = apps.get_model('Chat', 'Message')
+    newest_dates = (
+        Message.objects
+        .order_by()
+        .values('chat_room')
+        .annotate(newest_date=Max('date'))
+        .values_list('chat_room', 'newest_date'))
+    for chat_uuid, newest_date in newest_dates:
+        ChatRoom.objects.filter(id=chat_uuid).update(last_message_at=newest_date)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0007_participant_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fill_last_message_at, migrations.RunPython.noop),
+    ]
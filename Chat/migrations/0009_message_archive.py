@@ -0,0 +1,35 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Chat', '0008_chatroom_last_message_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text', models.TextField(max_length=255)),
+                ('date', models.DateTimeField()),
+                ('chat_room', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Chat.chatroom')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'message_archive',
+                'ordering': ('-date', '-id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['chat_room', 'date', 'id'], name='message_archive_room_date_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:20
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Creates the full-text index of the message texts for the database of the search backend"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE message_search USING fts5(text, message_id UNINDEXED)')
+        schema_editor.execute(
+            'INSERT INTO message_search (text, message_id) SELECT text, id FROM message')
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX message_text_search_idx ON message "
+            "USING GIN (to_tsvector('simple'::regconfig, COALESCE(text, '')))")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE message_search')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX message_text_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0009_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
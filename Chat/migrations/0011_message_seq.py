@@ -0,0 +1,84 @@
+# Generated by Django 3.1.3 on 2026-10-18 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+BATCH_SIZE = 1000
+
+
+def number_messages(apps, schema_editor):
+    """Numbers the messages of every chat in the (date, id) order and sets the last sequence number of the chat"""
+    ChatRoom = apps.get_model('Chat', 'ChatRoom')
+    Message = apps.get_model('Chat', 'Message')
+    for chat_room in ChatRoom.objects.iterator(chunk_size=BATCH_SIZE):
+        messages = []
+        for seq, message in enumerate(
+                Message.objects.filter(chat_room=chat_room).order_by('date', 'id').only('id').iterator(), 1):
+            message.seq = message.change_seq = seq
+            messages.append(message)
+        Message.objects.bulk_update(messages, ('seq', 'change_seq'), batch_size=BATCH_SIZE)
+        ChatRoom.objects.filter(id=chat_room.id).update(last_seq=len(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0010_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_room', 'change_seq'], name='message_room_change_seq_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'seq'), name='message_room_seq_uniq'),
+        ),
+        migrations.CreateModel(
+            name='MessageTombstone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('message_id', models.UUIDField()),
+                ('seq', models.PositiveBigIntegerField()),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('chat_room', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Chat.chatroom')),
+            ],
+            options={
+                'db_table': 'message_tombstone',
+                'ordering': ('seq',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='messagetombstone',
+            index=models.Index(fields=['chat_room', 'seq'], name='message_tombstone_room_seq_idx'),
+        ),
+    ]
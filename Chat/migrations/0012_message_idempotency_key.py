@@ -0,0 +1,22 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0011_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='idempotency_key',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(idempotency_key__isnull=False), fields=('chat_room', 'sender', 'idempotency_key'), name='message_idempotency_key_uniq'),
+        ),
+    ]
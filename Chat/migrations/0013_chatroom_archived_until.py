@@ -0,0 +1,34 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:56
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def set_archive_boundaries(apps, schema_editor):
+    """Sets the archive boundary of every chat to the date of its newest archived message"""
+    ChatRoom = apps.get_model('Chat', 'ChatRoom')
+    ArchivedMessage = apps.get_model('Chat', 'ArchivedMessage')
+    newest_date = (
+        ArchivedMessage.objects
+        .filter(chat_room=OuterRef('id'))
+        .order_by()
+        .values('chat_room')
+        .annotate(newest_date=Max('date'))
+        .values('newest_date'))
+    ChatRoom.objects.update(archived_until=Subquery(newest_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0012_message_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_until',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_archive_boundaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def add_chat_room_column(apps, schema_editor):
+    """Recreates the SQLite full-text index with the chat of every message as a column of its own"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE message_search')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE message_search USING fts5(text, chat_room, message_id UNINDEXED)')
+    schema_editor.execute(
+        'INSERT INTO message_search (text, chat_room, message_id) SELECT text, chat_room_id, id FROM message')
+
+
+def drop_chat_room_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE message_search')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE message_search USING fts5(text, message_id UNINDEXED)')
+    schema_editor.execute(
+        'INSERT INTO message_search (text, message_id) SELECT text, id FROM message')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0013_chatroom_archived_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_chat_room_column, drop_chat_room_column),
+    ]
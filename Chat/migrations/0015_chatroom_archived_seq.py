@@ -0,0 +1,26 @@
+# Generated by Django 3.1.3 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_archived_seqs(apps, schema_editor):
+    """Makes the clients of the chats which have archived messages reload them, their change numbers are unknown"""
+    ChatRoom = apps.get_model('Chat', 'ChatRoom')
+    ChatRoom.objects.filter(archived_until__isnull=False).update(archived_seq=F('last_seq'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Chat', '0014_message_search_chat_room'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='archived_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_archived_seqs, migrations.RunPython.noop),
+    ]
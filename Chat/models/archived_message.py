@@ -0,0 +1,33 @@
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models
+
+from Chat.models.message import MessageManager
+
+
+class ArchivedMessage(models.Model):
+    """
+    Message which is older than CHAT_CONFIGURATION['archive_after_days'] and is read by every participant
+
+    The messages are moved here by the `archive_messages` command, so every archived
+    message of the chat is older than every message which is left in the `message` table
+    and `ChatRoom.archived_until` is the date of the newest archived message.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False)
+    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE, db_index=False)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE)
+    text = models.TextField(blank=False, max_length=255)
+    date = models.DateTimeField()
+    objects = MessageManager()
+
+    class Meta:
+        db_table = 'message_archive'
+        ordering = ('-date', '-id')
+        indexes = (
+            # Keyset pagination of the archived chat history
+            models.Index(fields=('chat_room', 'date', 'id'), name='message_archive_room_date_idx'),
+        )
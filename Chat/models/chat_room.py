@@ -1,10 +1,36 @@
+import itertools
 import uuid
+from datetime import timedelta
 
-from django.db import models
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.translation import ugettext as _
 
+from Chat.db.routers import use_primary
+from Chat.models.archived_message import ArchivedMessage
 from Chat.models.message import Message
-from Chat.utils.helpers import preprocess_count
-from Chat.utils.validators import validate_message_text, validate_messages_type
+from Chat.models.message_tombstone import MessageTombstone
+from Chat.models.participant import Participant
+from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE
+from Chat.utils.export import get_export_chunk_size
+from Chat.utils.fanout import get_fan_out_strategy
+from Chat.utils.idempotency import get_sent_message, remember_sent_message
+from Chat.utils.membership import invalidate_chat_participants
+from Chat.utils.metrics import instrument
+from Chat.utils.pubsub import publish_messages
+from Chat.utils.search import get_search_backend
+from Chat.utils.recent import (
+    append_recent_messages, get_recent_messages, get_recent_messages_count, recent_messages_stats)
+from Chat.utils.helpers import preprocess_count, encode_cursor, encode_position, decode_cursor
+from Chat.utils.validators import (
+    validate_idempotency_key, validate_message_text, validate_messages_type, validate_search_query, validate_since)
+
+# Number of participants removed in a single transaction
+REMOVE_PARTICIPANTS_BATCH_SIZE = 1000
 
 
 class ChatRoom(models.Model):
@@ -13,11 +39,81 @@ class ChatRoom(models.Model):
         default=uuid.uuid4,
         editable=False)
     name = models.CharField(max_length=255)
+    # The date of the newest message or of the creation of the chat
+    last_message_at = models.DateTimeField(default=timezone.now)
+    # The last sequence number of the changes of the chat messages: inserts, edits and deletions
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # The date of the newest archived message, None if nothing is archived
+    archived_until = models.DateTimeField(null=True, editable=False)
+    # The newest change number of the archived messages, the changes before it aren't complete anymore
+    archived_seq = models.PositiveBigIntegerField(default=0, editable=False)
 
     class Meta:
         db_table = 'chat_room'
         ordering = ('name',)
 
+    @classmethod
+    def get_rooms_page(
+            cls,
+            user_id: int,
+            count: str = None,
+            cursor: str = None) -> tuple:
+        """
+        Returns the page of chats of the user from the most to the least recently active
+
+        Every chat comes with its newest message and the number of messages
+        which are unread by the user. The page is extracted with two queries
+        whatever the number of chats: the chats with the unread counts and
+        the primary keys of their newest messages, then the newest messages.
+
+        Parameters
+        ----------
+        user_id: int
+            the primary key of the User
+        count: str
+            the count of chats to extract, must be a positive integer
+        cursor: str
+            the opaque cursor from the previous page
+
+        Returns
+        -------
+        tuple
+            the list of ChatRoom models with the `unread_count` and the `last_message`
+            attributes and the next cursor; the cursor is None on the last page
+        """
+        count = preprocess_count(count)
+        newest_message = (
+            Message.objects
+            .filter(chat_room=OuterRef('chat_room'))
+            .order_by('-date', '-id')
+            .values('id')[:1])
+        participants = (
+            Participant.objects
+            .with_unread(user_id, maintained=get_fan_out_strategy().maintains_unread_counts)
+            .select_related('chat_room')
+            .annotate(last_message_uuid=Subquery(newest_message))
+            .order_by('-chat_room__last_message_at', '-chat_room_id'))
+        if cursor is not None:
+            date, chat_uuid, previous = decode_cursor(cursor)
+            participants = participants.filter(
+                Q(chat_room__last_message_at__lt=date)
+                | Q(chat_room__last_message_at=date, chat_room_id__lt=chat_uuid))
+        participants = list(participants[:count + 1])
+        has_more = len(participants) > count
+        participants = participants[:count]
+        last_messages_uuids = [p.last_message_uuid for p in participants if p.last_message_uuid is not None]
+        last_messages = {}
+        if last_messages_uuids:
+            last_messages = {row.id: row for row in Message.objects.filter(id__in=last_messages_uuids).as_rows()}
+        rooms = []
+        for participant in participants:
+            room = participant.chat_room
+            room.unread_count = participant.unread
+            room.last_message = last_messages.get(participant.last_message_uuid)
+            rooms.append(room)
+        next_cursor = encode_position(rooms[-1].last_message_at, rooms[-1].id) if has_more else None
+        return rooms, next_cursor
+
     @classmethod
     def get_messages(
             cls,
@@ -25,7 +121,8 @@ class ChatRoom(models.Model):
             user_id: int,
             messages_type: str = None,
             count: str = None,
-            message_uuid: str = None) -> list:
+            message_uuid: str = None,
+            cursor: str = None) -> list:
         """
         Returns the messages from the database
 
@@ -42,32 +139,584 @@ class ChatRoom(models.Model):
         message_uuid: str
             the primary key of Message from which to extract messages;
             it is needed only for message with the `read` type
+        cursor: str
+            the opaque keyset cursor returned by `get_messages_page`;
+            it takes precedence over `message_uuid`
 
         Returns
         -------
         list
             the list of Message models
         """
+        messages, next_cursor, prev_cursor = cls.get_messages_page(
+            chat_uuid=chat_uuid,
+            user_id=user_id,
+            messages_type=messages_type,
+            count=count,
+            message_uuid=message_uuid,
+            cursor=cursor)
+        return messages
+
+    @classmethod
+    @instrument('get_messages')
+    def get_messages_page(
+            cls,
+            chat_uuid: str,
+            user_id: int,
+            messages_type: str = None,
+            count: str = None,
+            message_uuid: str = None,
+            cursor: str = None,
+            as_rows: bool = False,
+            version: tuple = None) -> tuple:
+        """
+        Returns the page of messages together with the keyset cursors
+
+        Messages are ordered by the composite (date, id) key, so the page
+        boundaries are stable even if several messages share the same date.
+        `read` messages go from newest to oldest and `unread` messages go
+        from oldest to newest; the `next_cursor` continues after the last
+        message of the page and the `prev_cursor` goes back before the first one.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom for which to extract messages
+        user_id: int
+            the primary key of the User which must participate in the ChatRoom
+        messages_type: str
+            determines which type of messages to extract - `read` or `unread`
+        count: str
+            the count of messages to extract, must be a positive integer
+        message_uuid: str
+            the primary key of Message from which to extract messages;
+            it is needed only for message with the `read` type
+        cursor: str
+            the opaque cursor from the previous page
+        as_rows: bool
+            whether to extract the named tuples of the serialized fields
+            instead of the models, see `MessageQuerySet.as_rows`
+        version: tuple
+            the version returned by `get_messages_version`; the first page
+            of `read` rows is served from the recent messages cache if the
+            cache is not behind the version
+
+        Returns
+        -------
+        tuple
+            the list of Message models, the next cursor and the previous cursor;
+            a cursor is None if there is nothing to extract in its direction
+        """
         # Preprocess and validate input parameters
         count = preprocess_count(count)
         validate_messages_type(messages_type)
+        if (as_rows and version is not None and messages_type == 'read'
+                and cursor is None and message_uuid is None):
+            page = cls._get_recent_page(chat_uuid, user_id, count, version)
+            if page is not None:
+                recent_messages_stats.hit()
+                return page
+            recent_messages_stats.miss()
         # Call method for the certain messages_type
         method_to_call = getattr(Message.objects, f'{messages_type}_messages')
         messages = method_to_call(chat_uuid=chat_uuid, user_id=user_id)
-        # Get read messages before the provided message
+        if as_rows:
+            messages = messages.as_rows()
+        if cursor is not None:
+            return cls._get_keyset_page(chat_uuid, messages, messages_type, count, cursor, as_rows)
+        # Get read messages before the provided message, it may be archived already
+        anchor_date = None
         if messages_type == 'read' and message_uuid is not None:
-            messages = messages.messages_before_message(message_uuid)
-        return list(messages[:count])
+            anchor_date = Coalesce(
+                Subquery(Message.objects.get_message_date(message_uuid)),
+                Subquery(ArchivedMessage.objects.get_message_date(message_uuid)))
+            messages = messages.filter(date__lt=anchor_date)
+        # Extract one extra message to find out whether the next page exists
+        messages = list(messages[:count + 1])
+        if messages_type == 'read':
+            messages = cls._continue_into_archive(
+                chat_uuid, messages, count, as_rows,
+                lambda archived: archived.filter(date__lt=anchor_date) if anchor_date is not None else archived)
+        next_cursor = encode_cursor(messages[count - 1]) if len(messages) > count else None
+        return messages[:count], next_cursor, None
+
+    @classmethod
+    def get_messages_version(cls, chat_uuid: str, user_id: int) -> tuple:
+        """
+        Returns the version of the messages which the user can fetch from the chat
+
+        The version consists of the newest message of the chat, the read
+        watermark of the user, the archive boundary of the chat and the
+        sequence number of its changes, it is extracted with a single indexed query.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom
+        user_id: int
+            the primary key of the User which must participate in the ChatRoom
+
+        Returns
+        -------
+        tuple
+            the primary keys of the newest message and of the last read message,
+            the date of the newest archived message and the last sequence number
+        """
+        newest_message = (
+            Message.objects
+            .filter(chat_room=chat_uuid)
+            .order_by('-date', '-id')
+            .values('id')[:1])
+        version = (
+            Participant.objects
+            .filter(chat_room=chat_uuid, person=user_id)
+            .annotate(newest_message=Subquery(newest_message))
+            .values_list('newest_message', 'last_read_message', 'chat_room__archived_until', 'chat_room__last_seq')
+            .first())
+        return version or (None, None, None, None)
+
+    @classmethod
+    def get_unread_counts(cls, user_id: int) -> dict:
+        """
+        Returns the number of unread messages in every chat of the user
+
+        The counters maintained by the eager fan-out strategy are read with a single
+        indexed query over the participants of the user. The lazy and the deferred
+        strategies don't keep them exact, so the messages after the watermarks are
+        counted instead.
+
+        Parameters
+        ----------
+        user_id: int
+            the primary key of the User
+
+        Returns
+        -------
+        dict
+            the numbers of unread messages by the primary keys of the ChatRooms
+        """
+        unread_counts = Participant.objects.unread_counts(
+            user_id=user_id,
+            maintained=get_fan_out_strategy().maintains_unread_counts)
+        return dict(unread_counts)
+
+    @classmethod
+    def search_messages(
+            cls,
+            user_id: int,
+            query: str,
+            count: str = None,
+            cursor: str = None) -> tuple:
+        """
+        Returns the page of messages which match the query in the chats of the user
+
+        The messages are found by the full-text index of the configured search
+        backend and go from the best to the worst match. The archived messages
+        aren't indexed, so only the messages of the `message` table are found.
+
+        Parameters
+        ----------
+        user_id: int
+            the primary key of the User
+        query: str
+            the words which every found message must contain
+        count: str
+            the count of messages to extract, must be a positive integer
+        cursor: str
+            the opaque cursor from the previous page
+
+        Returns
+        -------
+        tuple
+            the list of message rows in the `MessageQuerySet.as_rows` format
+            and the next cursor; the cursor is None on the last page
+        """
+        validate_search_query(query)
+        count = preprocess_count(count)
+        return get_search_backend().search(user_id, query, count, cursor)
+
+    @classmethod
+    def export_messages(cls, chat_uuid: str, cursor: str = None, chunk_size: int = None):
+        """
+        Returns the iterator over the whole history of the chat from oldest to newest
+
+        The archived messages go first, they are older than the hot ones.
+        Both tables are read by server-side cursors in chunks, so the memory
+        doesn't depend on the size of the chat. Nothing is marked as read.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom which to export
+        cursor: str
+            the cursor of the last exported message, the export continues after it
+        chunk_size: int
+            the number of rows fetched from the database at once,
+            CHAT_CONFIGURATION['export_chunk_size'] by default
+
+        Returns
+        -------
+        Iterator
+            the rows of `MessageQuerySet.as_rows`, the queries run on iteration
+        """
+        if chunk_size is None:
+            chunk_size = get_export_chunk_size()
+        messages = Message.objects.filter(chat_room=chat_uuid).order_by('date', 'id').as_rows()
+        archived = ArchivedMessage.objects.filter(chat_room=chat_uuid).order_by('date', 'id').as_rows()
+        if cursor is not None:
+            date, message_uuid, previous = decode_cursor(cursor)
+            messages = messages.messages_after_position(date, message_uuid)
+            archived = archived.messages_after_position(date, message_uuid)
+        # The archive is read even if it's disabled now, it keeps the messages archived before
+        return itertools.chain(archived.iterator(chunk_size=chunk_size), messages.iterator(chunk_size=chunk_size))
+
+    @classmethod
+    def get_changes(cls, chat_uuid: str, since: str = None, count: str = None) -> tuple:
+        """
+        Returns the changes of the chat messages after the sequence number
+
+        The changes are the new and the edited messages and the tombstones
+        of the deleted ones in the order of their sequence numbers. Every change
+        is numbered in the transaction which holds the lock of the chat row,
+        so the changes are committed in the order of their numbers and a client
+        which continues from the returned sequence number misses nothing.
+
+        The archived messages leave the changes without tombstones, they still
+        exist. The client which has synced less than the newest archived change
+        gets no changes and `resync`: it reloads the chat with the messages API
+        and continues from the returned sequence number.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom for which to extract changes
+        since: str
+            the sequence number which the client has synced, `0` by default
+        count: str
+            the maximum count of changes to extract, must be a positive integer
+
+        Returns
+        -------
+        tuple
+            the list of message rows with the `seq` and the `change_seq` fields,
+            the list of (message id, seq) tombstones, the sequence number of the
+            last returned change, whether there are more changes after it and
+            whether the client must reload the chat
+        """
+        validate_since(since)
+        since = int(since or 0)
+        count = preprocess_count(count)
+        last_seq, archived_seq = cls.objects.filter(id=chat_uuid).values_list('last_seq', 'archived_seq').get()
+        if since < archived_seq:
+            return [], [], last_seq, False, True
+        messages = list(
+            Message.objects
+            .filter(chat_room=chat_uuid, change_seq__gt=since)
+            .order_by('change_seq')
+            .values_list('id', 'chat_room', 'sender', 'text', 'date', 'seq', 'change_seq', named=True)[:count + 1])
+        tombstones = list(
+            MessageTombstone.objects
+            .filter(chat_room=chat_uuid, seq__gt=since)
+            .order_by('seq')
+            .values_list('message_id', 'seq')[:count + 1])
+        # Take the first `count` changes of both kinds
+        seqs = sorted([message.change_seq for message in messages] + [seq for message_uuid, seq in tombstones])
+        has_more = len(seqs) > count
+        last_seq = seqs[count - 1] if has_more else (seqs[-1] if seqs else since)
+        messages = [message for message in messages if message.change_seq <= last_seq]
+        tombstones = [tombstone for tombstone in tombstones if tombstone[1] <= last_seq]
+        return messages, tombstones, last_seq, has_more, False
+
+    @classmethod
+    def delete_messages(cls, chat_uuid: str, messages_uuids) -> int:
+        """
+        Deletes the messages of the chat and leaves their tombstones for the changes of the chat
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom from which to delete the messages
+        messages_uuids: Iterable
+            the primary keys of the Messages to delete, the ones of other chats are skipped
+
+        Returns
+        -------
+        int
+            the number of deleted messages
+        """
+        # The deletion of the queryset leaves the tombstones in its transaction
+        deleted = (
+            Message.objects
+            .filter(chat_room=chat_uuid, id__in=list(messages_uuids))
+            .delete())
+        return deleted[1].get(Message._meta.label, 0)
+
+    @classmethod
+    def allocate_seq(cls, chat_uuid: str, count: int = 1, date=None) -> int:
+        """
+        Reserves `count` consecutive sequence numbers of the chat and returns the first one
+
+        It must be called in the transaction which writes the numbered changes:
+        the UPDATE locks the chat row until the commit, so the concurrent writers
+        of the chat commit in the order of their numbers, and a rollback releases
+        the numbers, so the sequence has no gaps. With `date` the last activity
+        of the chat is also moved forward to the date by the same UPDATE.
+
+        Raises
+        ------
+        ChatRoom.DoesNotExist
+            if the chat doesn't exist
+        """
+        changes = {'last_seq': F('last_seq') + count}
+        if date is not None:
+            changes['last_message_at'] = Greatest('last_message_at', Value(date, output_field=models.DateTimeField()))
+        return cls._update_seq(chat_uuid, count, changes)[0]
+
+    @classmethod
+    def _update_seq(cls, chat_uuid: str, count: int, changes: dict) -> tuple:
+        """Applies the changes which reserve `count` sequence numbers, returns the first one and the chat activity"""
+        if not cls.objects.filter(id=chat_uuid).update(**changes):
+            raise cls.DoesNotExist
+        last_seq, last_message_at = (
+            cls.objects
+            .filter(id=chat_uuid)
+            .values_list('last_seq', 'last_message_at')
+            .get())
+        return last_seq - count + 1, last_message_at
+
+    @classmethod
+    def add_participants(cls, chat_uuid: str, users_ids) -> int:
+        """
+        Adds the users to the chat with a single INSERT
+
+        The joiners start with the whole history of the chat read: their watermark
+        is set to the newest message and their unread counter to zero. The users
+        which already participate in the chat or don't exist are skipped.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom to which to add the users
+        users_ids: Iterable
+            the primary keys of the Users to add
+
+        Returns
+        -------
+        int
+            the number of the users which didn't participate in the chat before the INSERT
+        """
+        with transaction.atomic():
+            joiners_ids = list(
+                User.objects
+                .filter(id__in=list(users_ids))
+                .exclude(participant__chat_room=chat_uuid)
+                .values_list('id', flat=True))
+            if not joiners_ids:
+                return 0
+            watermark = Participant.objects.get_joining_watermark(chat_uuid)
+            # The unique constraint skips the participants added concurrently after the SELECT
+            Participant.objects.bulk_create([
+                Participant(
+                    person_id=user_id,
+                    chat_room_id=chat_uuid,
+                    last_read_at=watermark[0],
+                    last_read_message_id=watermark[1],
+                    unread_count=0)
+                for user_id in joiners_ids
+            ], ignore_conflicts=True)
+        # The INSERT doesn't send post_save, so the cached participants are dropped here
+        invalidate_chat_participants(chat_uuid)
+        return len(joiners_ids)
+
+    @classmethod
+    def remove_participants(cls, chat_uuid: str, users_ids, batch_size: int = REMOVE_PARTICIPANTS_BATCH_SIZE) -> int:
+        """
+        Removes the users from the chat in short transactions of `batch_size` participants
+
+        The read state is kept in the participant rows, so nothing else is deleted.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom from which to remove the users
+        users_ids: Iterable
+            the primary keys of the Users to remove
+        batch_size: int
+            the number of participants deleted in a single transaction
+
+        Returns
+        -------
+        int
+            the number of removed participants
+        """
+        users_ids = list(users_ids)
+        removed = 0
+        for start in range(0, len(users_ids), batch_size):
+            with transaction.atomic():
+                removed += (
+                    Participant.objects
+                    .filter(chat_room=chat_uuid, person__in=users_ids[start:start + batch_size])
+                    .delete())[0]
+        invalidate_chat_participants(chat_uuid)
+        return removed
+
+    @classmethod
+    def _allocate_message_seq(cls, chat_uuid: str, count: int) -> tuple:
+        """
+        Reserves the sequence numbers of the new messages, returns the first one and the date of the first message
+
+        The dates are assigned by the UPDATE which locks the chat row: they follow the newest
+        message of the chat, so the dates of the messages are in the order of their commits
+        and sequence numbers even if the clock of the server is behind. The date of the last
+        new message is recorded as the last activity of the chat.
+        """
+        newest_date = Greatest(
+            F('last_message_at') + Value(timedelta(microseconds=count), output_field=models.DurationField()),
+            Value(timezone.now() + timedelta(microseconds=count - 1)),
+            output_field=models.DateTimeField())
+        try:
+            first_seq, last_message_at = cls._update_seq(
+                chat_uuid, count, {'last_seq': F('last_seq') + count, 'last_message_at': newest_date})
+        except cls.DoesNotExist:
+            raise PermissionDenied(_(CHAT_ACCESS_MESSAGE))
+        return first_seq, last_message_at - timedelta(microseconds=count - 1)
+
+    @staticmethod
+    def _get_sent_message(chat_uuid: str, user_id: int, idempotency_key: str):
+        """Returns the message which the user has already sent to the chat with the key or None"""
+        if idempotency_key is None:
+            return None
+        # The message may be committed just now, so it isn't looked up on the replicas
+        with use_primary():
+            sent_message = Message.objects.filter(
+                chat_room=chat_uuid,
+                sender=user_id,
+                idempotency_key=idempotency_key).first()
+        if sent_message is not None:
+            remember_sent_message(sent_message)
+        return sent_message
+
+    @staticmethod
+    def _get_recent_page(chat_uuid: str, user_id: int, count: int, version: tuple):
+        """Returns the newest page of read messages from the recent messages cache or None"""
+        newest_uuid, last_read_uuid, archived_until, last_seq = version
+        if newest_uuid is None or last_read_uuid is None or count > get_recent_messages_count():
+            return None
+        rows, complete = get_recent_messages(chat_uuid, seq=last_seq)
+        if not rows or rows[0].id != newest_uuid:
+            return None
+        # Every message from the watermark to the oldest one is read
+        watermark_index = next(
+            (index for index, row in enumerate(rows) if row.id == last_read_uuid), len(rows))
+        messages = [
+            row for index, row in enumerate(rows)
+            if index >= watermark_index or row.sender == user_id]
+        if len(messages) > count:
+            has_more = True
+        elif complete and archived_until is None:
+            has_more = False
+        elif watermark_index == len(rows) and len(messages) == count:
+            # The watermark message itself is older than the buffer
+            has_more = True
+        else:
+            return None
+        messages = messages[:count]
+        next_cursor = encode_cursor(messages[-1]) if has_more else None
+        return messages, next_cursor, None
+
+    @staticmethod
+    def _continue_into_archive(chat_uuid: str, messages: list, count: int, as_rows: bool, narrow):
+        """
+        Appends the older read messages from the archive when the page runs out of the hot ones
+
+        The archived messages are older than the hot ones and every participant has read them,
+        so the archive continues right after the last hot message of the page or from the position
+        given by `narrow` if there is none.
+        """
+        if len(messages) > count:
+            return messages
+        archived = ArchivedMessage.objects.filter(chat_room=chat_uuid)
+        if as_rows:
+            archived = archived.as_rows()
+        if messages:
+            archived = archived.messages_before_position(messages[-1].date, messages[-1].id)
+        else:
+            archived = narrow(archived)
+        return messages + list(archived[:count + 1 - len(messages)])
+
+    @staticmethod
+    def _walk_back_from_archive(chat_uuid: str, messages, count: int, as_rows: bool, date, message_uuid) -> list:
+        """Returns the read messages after the position from oldest to newest, the archived ones go first"""
+        archived = ArchivedMessage.objects.filter(chat_room=chat_uuid)
+        if as_rows:
+            archived = archived.as_rows()
+        archived = list(archived.messages_after_position(date, message_uuid).reverse()[:count + 1])
+        if len(archived) > count:
+            return archived
+        return archived + list(messages[:count + 1 - len(archived)])
+
+    @classmethod
+    def _get_keyset_page(
+            cls,
+            chat_uuid: str,
+            messages,
+            messages_type: str,
+            count: int,
+            cursor: str,
+            as_rows: bool) -> tuple:
+        """Returns the page of messages which are adjacent to the cursor position"""
+        date, message_uuid, previous = decode_cursor(cursor)
+        # `unread` pages go towards newer messages, `read` pages go towards older ones
+        towards_newer = (messages_type == 'unread') != previous
+        if towards_newer:
+            messages = messages.messages_after_position(date, message_uuid)
+        else:
+            messages = messages.messages_before_position(date, message_uuid)
+        if previous:
+            # Walk from the cursor backwards
+            messages = messages.reverse()
+        if messages_type == 'read' and previous:
+            # Walk back from the archive into the hot messages
+            messages = cls._walk_back_from_archive(chat_uuid, messages, count, as_rows, date, message_uuid)
+        else:
+            messages = list(messages[:count + 1])
+        if messages_type == 'read' and not previous:
+            messages = cls._continue_into_archive(
+                chat_uuid, messages, count, as_rows,
+                lambda archived: archived.messages_before_position(date, message_uuid))
+        has_more = len(messages) > count
+        messages = messages[:count]
+        if not messages:
+            return messages, None, None
+        if previous:
+            # Restore the natural order of the page
+            messages.reverse()
+        next_cursor = encode_cursor(messages[-1]) if has_more or previous else None
+        prev_cursor = encode_cursor(messages[0], previous=True) if has_more or not previous else None
+        return messages, next_cursor, prev_cursor
 
     @classmethod
     def send_message(
             cls,
             chat_uuid: str,
             user_id: int,
-            text: str):
+            text: str,
+            idempotency_key: str = None) -> Message:
         """
         Sends the new message to the corresponding chat
 
+        The message is inserted, fanned out, marked as read for its sender
+        and recorded as the last activity of the chat in a single transaction.
+        The sender's watermark update also checks the access to the chat,
+        so no separate participant query is needed.
+        After the commit the message is published to the WebSocket subscribers
+        and written through to the recent messages cache.
+
+        The retries of the send with the same idempotency key return the message
+        of the first send: it's taken from the idempotency cache without queries,
+        and after the cache timeout or on a concurrent retry the unique constraint
+        of the key rejects the duplicate before it's fanned out.
+
         Parameters
         ----------
         chat_uuid: str
@@ -76,10 +725,119 @@ class ChatRoom(models.Model):
             the primary key of the User which must participate in the ChatRoom
         text: str
             the content of the message
+        idempotency_key: str
+            the key which the client generated for the message, optional
+
+        Returns
+        -------
+        Message
+            the new Message model or the one sent with the same idempotency key
+
+        Raises
+        ------
+        PermissionDenied
+            if the user doesn't participate in the chat
         """
         validate_message_text(text)
-        new_message = Message(
-            chat_room_id=chat_uuid,
-            sender_id=user_id,
-            text=text)
-        new_message.save()
+        validate_idempotency_key(idempotency_key)
+        if idempotency_key is not None:
+            sent_message = get_sent_message(chat_uuid, user_id, idempotency_key)
+            if sent_message is not None:
+                return sent_message
+        try:
+            with transaction.atomic():
+                seq, date = cls._allocate_message_seq(chat_uuid, 1)
+                new_message = Message(
+                    chat_room_id=chat_uuid,
+                    sender_id=user_id,
+                    text=text,
+                    date=date,
+                    seq=seq,
+                    change_seq=seq,
+                    idempotency_key=idempotency_key)
+                new_message.save()
+                if not Participant.objects.advance_watermark(
+                        user_id=user_id,
+                        chat_uuid=chat_uuid,
+                        date=new_message.date,
+                        message_uuid=new_message.id):
+                    raise PermissionDenied(_(CHAT_ACCESS_MESSAGE))
+                # Push the message to the WebSocket subscribers of the chat
+                transaction.on_commit(lambda: publish_messages([new_message]))
+                transaction.on_commit(lambda: append_recent_messages(chat_uuid, [new_message]))
+                if idempotency_key is not None:
+                    transaction.on_commit(lambda: remember_sent_message(new_message))
+        except IntegrityError:
+            sent_message = cls._get_sent_message(chat_uuid, user_id, idempotency_key)
+            if sent_message is None:
+                raise
+            return sent_message
+        return new_message
+
+    @classmethod
+    def send_messages(
+            cls,
+            chat_uuid: str,
+            user_id: int,
+            texts: list) -> tuple:
+        """
+        Sends the batch of new messages to the corresponding chat
+
+        Every text is validated separately and the invalid ones are skipped.
+        The valid messages are inserted with a single bulk INSERT, fanned out
+        together, marked as read for their sender and recorded as the last
+        activity of the chat in a single transaction.
+
+        Parameters
+        ----------
+        chat_uuid: str
+            the primary key of the ChatRoom for which to extract messages
+        user_id: int
+            the primary key of the User which must participate in the ChatRoom
+        texts: list
+            the contents of the messages in the order of sending
+
+        Returns
+        -------
+        tuple
+            the list of new Message models and the dict of error messages
+            by the indexes of the invalid texts
+
+        Raises
+        ------
+        PermissionDenied
+            if the user doesn't participate in the chat
+        """
+        new_messages = []
+        errors = {}
+        for index, text in enumerate(texts):
+            try:
+                validate_message_text(text)
+            except ValidationError as err:
+                errors[index] = err.message
+                continue
+            new_messages.append(Message(chat_room_id=chat_uuid, sender_id=user_id, text=text))
+        if not new_messages:
+            # Nothing to send, but the access is checked anyway
+            if not Participant.objects.filter(chat_room=chat_uuid, person=user_id).exists():
+                raise PermissionDenied(_(CHAT_ACCESS_MESSAGE))
+            return new_messages, errors
+        with transaction.atomic():
+            first_seq, date = cls._allocate_message_seq(chat_uuid, len(new_messages))
+            for index, new_message in enumerate(new_messages):
+                new_message.seq = new_message.change_seq = first_seq + index
+                # Keep the order of the batch, the messages can't share the same date
+                new_message.date = date + timedelta(microseconds=index)
+            Message.objects.bulk_create(new_messages)
+            # The bulk INSERT doesn't send post_save, so the batch is indexed here
+            get_search_backend().index_messages(new_messages)
+            get_fan_out_strategy().fan_out_batch(new_messages)
+            if not Participant.objects.advance_watermark(
+                    user_id=user_id,
+                    chat_uuid=chat_uuid,
+                    date=new_messages[-1].date,
+                    message_uuid=new_messages[-1].id):
+                raise PermissionDenied(_(CHAT_ACCESS_MESSAGE))
+            transaction.on_commit(lambda: publish_messages(new_messages))
+            transaction.on_commit(lambda: append_recent_messages(chat_uuid, new_messages))
+        return new_messages, errors
@@ -1,14 +1,21 @@
+import itertools
+import operator
 import uuid
+from collections import namedtuple
 
-from django.db import models
-
-from django.db.models import Subquery
-from django.db.models.functions import Now
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Q, Subquery
+from django.utils import timezone
 
+from Chat.models.message_tombstone import MessageTombstone
 from Chat.models.participant import Participant
-from Chat.models.unread_message import UnreadMessage
-from django.contrib.auth.models import User
+from Chat.utils.fanout import get_fan_out_strategy
+from Chat.utils.metrics import instrument
+
 
+# The serialized fields of the message, the same as the rows of MessageQuerySet.as_rows
+MessageRow = namedtuple('MessageRow', ('id', 'chat_room', 'sender', 'text', 'date'))
 
 
 class MessageQuerySet(models.query.QuerySet):
@@ -17,6 +24,64 @@ class MessageQuerySet(models.query.QuerySet):
         date = Message.objects.get_message_date(message_uuid)
         return self.filter(date__lt=Subquery(date))
 
+    def messages_before_position(self, date, message_uuid):
+        """Returns messages which are OLDER than the (date, id) keyset position"""
+        return self.filter(
+            Q(date__lt=date) | Q(date=date, id__lt=message_uuid))
+
+    def messages_after_position(self, date, message_uuid):
+        """Returns messages which are NEWER than the (date, id) keyset position"""
+        return self.filter(
+            Q(date__gt=date) | Q(date=date, id__gt=message_uuid))
+
+    def messages_read_by(self, user_id: int, watermark: tuple = None):
+        """Returns messages which are sent by the user or are not newer than the read watermark"""
+        read = Q(sender=user_id)
+        if watermark is not None:
+            date, message_uuid = watermark
+            if message_uuid is None:
+                read |= Q(date__lte=date)
+            else:
+                read |= Q(date__lt=date) | Q(date=date, id__lte=message_uuid)
+        return self.filter(read)
+
+    def messages_unread_by(self, user_id: int, watermark: tuple = None):
+        """Returns messages which are sent by other users and are newer than the read watermark"""
+        messages = self.exclude(sender=user_id)
+        if watermark is not None:
+            date, message_uuid = watermark
+            if message_uuid is None:
+                messages = messages.filter(date__gt=date)
+            else:
+                messages = messages.messages_after_position(date, message_uuid)
+        return messages
+
+    def delete(self, tombstones: bool = True):
+        """Deletes the messages and leaves their tombstones for the changes of the chats unless `tombstones` is False"""
+        with transaction.atomic(savepoint=False):
+            if tombstones:
+                self.write_tombstones()
+            return super().delete()
+
+    def write_tombstones(self) -> int:
+        """Leaves the tombstones of the messages, must be called in the transaction which deletes them"""
+        chat_room_model = self.model._meta.get_field('chat_room').related_model
+        messages = self.order_by('chat_room', 'date', 'id').values_list('chat_room', 'id')
+        tombstones = []
+        # Every chat numbers the deletions of its messages with a single UPDATE
+        for chat_uuid, group in itertools.groupby(messages, key=operator.itemgetter(0)):
+            messages_uuids = [message_uuid for chat_uuid, message_uuid in group]
+            first_seq = chat_room_model.allocate_seq(chat_uuid, len(messages_uuids))
+            tombstones += [
+                MessageTombstone(chat_room_id=chat_uuid, message_id=message_uuid, seq=first_seq + index)
+                for index, message_uuid in enumerate(messages_uuids)]
+        MessageTombstone.objects.bulk_create(tombstones)
+        return len(tombstones)
+
+    def as_rows(self):
+        """Returns named tuples of the serialized fields instead of the models"""
+        return self.values_list('id', 'chat_room', 'sender', 'text', 'date', named=True)
+
 
 class MessageManager(models.Manager):
     def get_queryset(self):
@@ -25,18 +90,19 @@ class MessageManager(models.Manager):
 
     def read_messages(self, chat_uuid: str, user_id: int):
         """Returns READ messages from newest to oldest"""
+        watermark = Participant.objects.get_watermark(chat_uuid, user_id)
         return (
             self.get_queryset()
             .filter(chat_room=chat_uuid)
-            .exclude(unreadmessage__participant__person=user_id))
+            .messages_read_by(user_id, watermark))
 
     def unread_messages(self, chat_uuid: str, user_id: int):
         """Returns UNREAD messages from oldest to newest"""
+        watermark = Participant.objects.get_watermark(chat_uuid, user_id)
         return (
             self.get_queryset()
-            .filter(
-                chat_room=chat_uuid,
-                unreadmessage__participant__person=user_id)
+            .filter(chat_room=chat_uuid)
+            .messages_unread_by(user_id, watermark)
             .reverse())
 
     def get_message_date(self, message_uuid: str):
@@ -49,22 +115,59 @@ class Message(models.Model):
         primary_key=True,
         default=uuid.uuid4,
         editable=False)
-    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE)
+    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE, db_index=False)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField(blank=False, max_length=255)
-    date = models.DateTimeField(default=Now)
+    date = models.DateTimeField(default=timezone.now)
+    # The gap-free sequence number of the message in the chat, it's assigned on insert
+    seq = models.PositiveBigIntegerField(editable=False)
+    # The sequence number of the last change of the message: the insert or the last edit
+    change_seq = models.PositiveBigIntegerField(editable=False)
+    # The key which the client sends with the message, the retries of the send with the key are deduplicated
+    idempotency_key = models.CharField(max_length=64, null=True, editable=False)
     objects = MessageManager()
 
     class Meta:
         db_table = 'message'
-        ordering = ('-date',)
+        ordering = ('-date', '-id')
+        indexes = (
+            # Keyset pagination of the chat history
+            models.Index(fields=('chat_room', 'date', 'id'), name='message_room_date_id_idx'),
+            # Changes of the chat after the sequence number
+            models.Index(fields=('chat_room', 'change_seq'), name='message_room_change_seq_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(fields=('chat_room', 'seq'), name='message_room_seq_uniq'),
+            models.UniqueConstraint(
+                fields=('chat_room', 'sender', 'idempotency_key'),
+                condition=Q(idempotency_key__isnull=False),
+                name='message_idempotency_key_uniq'),
+        )
 
+    @instrument('message_save')
     def save(self, *args, **kwargs):
-        participants = (
-            Participant.objects
-            .filter(chat_room=self.chat_room_id)
-            .exclude(person=self.sender_id))
-        UnreadMessage.objects.bulk_create([
-            UnreadMessage(message=self, participant=p)
-            for p in participants])
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic(savepoint=False):
+            # ChatRoom.send_message reserves the sequence number together with the chat activity
+            if not adding or self.seq is None:
+                self.change_seq = self._allocate_seq(1)
+                if adding:
+                    self.seq = self.change_seq
+                elif kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+            super().save(*args, **kwargs)
+        if adding:
+            get_fan_out_strategy().fan_out(self)
+
+    def delete(self, *args, **kwargs):
+        """Deletes the message and leaves the tombstone for the changes of the chat"""
+        with transaction.atomic(savepoint=False):
+            MessageTombstone.objects.create(
+                chat_room_id=self.chat_room_id,
+                message_id=self.id,
+                seq=self._allocate_seq(1))
+            return super().delete(*args, **kwargs)
+
+    def _allocate_seq(self, count: int) -> int:
+        chat_room_model = self._meta.get_field('chat_room').related_model
+        return chat_room_model.allocate_seq(self.chat_room_id, count)
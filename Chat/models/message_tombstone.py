@@ -0,0 +1,29 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class MessageTombstone(models.Model):
+    """
+    Deletion of the message, it's returned by `ChatRoom.get_changes`
+    to the clients which have synced the chat before the deletion
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False)
+    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE, db_index=False)
+    # The primary key of the deleted message, the message itself doesn't exist anymore
+    message_id = models.UUIDField()
+    # The sequence number of the deletion in the changes of the chat
+    seq = models.PositiveBigIntegerField()
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'message_tombstone'
+        ordering = ('seq',)
+        indexes = (
+            # Changes of the chat after the sequence number
+            models.Index(fields=('chat_room', 'seq'), name='message_tombstone_room_seq_idx'),
+        )
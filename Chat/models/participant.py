@@ -1,13 +1,236 @@
+import operator
+import uuid
+from collections.abc import Iterable
+from functools import reduce
+
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 
+from Chat.utils.metrics import instrument
+
+
+class ParticipantManager(models.Manager):
+    def get_watermark(self, chat_uuid: str, user_id: int):
+        """Returns the (date, id) position of the last message read by the user or None"""
+        watermark = (
+            self.get_queryset()
+            .filter(chat_room=chat_uuid, person=user_id)
+            .values_list('last_read_at', 'last_read_message')
+            .first())
+        if watermark is None or watermark[0] is None:
+            return None
+        return watermark
+
+    def get_joining_watermark(self, chat_uuid: str) -> tuple:
+        """Returns the (date, id) position of the newest message of the chat or (None, None) if it's empty"""
+        message_model = self.model._meta.get_field('last_read_message').related_model
+        return (
+            message_model.objects
+            .filter(chat_room=chat_uuid)
+            .order_by('-date', '-id')
+            .values_list('date', 'id')
+            .first()) or (None, None)
+
+    @instrument('mark_as_read')
+    def mark_messages_as_read(self, user_id: int, chat_uuid: str, messages_uuids=None):
+        """
+        Moves the read watermark of the participant forward to the newest of the messages
+
+        Every message up to the watermark is read, so marking the message as read also
+        marks all the older messages of the chat as read. Without `messages_uuids`
+        the watermark is moved to the newest message of the chat. The watermark never
+        moves backwards and it is done with a single UPDATE of the participant row
+        which also recounts the unread messages after the new watermark.
+        """
+        message_model = self.model._meta.get_field('last_read_message').related_model
+        messages = message_model.objects.filter(chat_room=chat_uuid)
+        if type(messages_uuids) in [str, uuid.UUID]:
+            messages = messages.filter(id=messages_uuids)
+        elif isinstance(messages_uuids, Iterable):
+            messages_uuids = list(messages_uuids)
+            if not messages_uuids:
+                return
+            messages = messages.filter(id__in=messages_uuids)
+        newest_message = messages.order_by('-date', '-id')[:1]
+        newest_date = Subquery(newest_message.values('date'))
+        newest_uuid = Subquery(newest_message.values('id'))
+        unread_messages = (
+            message_model.objects
+            .filter(chat_room=chat_uuid)
+            .filter(~Q(sender=OuterRef('person')))
+            .filter(Q(date__gt=newest_date) | Q(date=newest_date, id__gt=newest_uuid)))
+        (self.get_queryset()
+         .filter(person=user_id, chat_room=chat_uuid)
+         .filter(self._watermark_before(newest_date, newest_uuid))
+         .update(
+             last_read_at=newest_date,
+             last_read_message=newest_uuid,
+             unread_count=self._count(unread_messages)))
+
+    def advance_watermark(self, user_id: int, chat_uuid: str, date, message_uuid) -> int:
+        """
+        Moves the read watermark of the participant forward to the known (date, id) position
+
+        The participant row is updated even if its watermark is already ahead,
+        so the returned count of updated rows tells whether the user participates in the chat.
+        The position is the user's own newest message, so nothing before it is left unread.
+        """
+        moves_forward = self._watermark_before(date, message_uuid)
+        return (
+            self.get_queryset()
+            .filter(person=user_id, chat_room=chat_uuid)
+            .update(
+                last_read_at=Case(
+                    When(moves_forward, then=Value(date, output_field=models.DateTimeField())),
+                    default=F('last_read_at')),
+                last_read_message=Case(
+                    When(moves_forward, then=Value(message_uuid, output_field=models.UUIDField())),
+                    default=F('last_read_message')),
+                unread_count=Case(
+                    When(moves_forward, then=Value(0)),
+                    default=F('unread_count'))))
+
+    def advance_watermarks(self, positions: dict) -> int:
+        """
+        Moves the read watermarks of several participants forward with two UPDATEs
+
+        `positions` maps the (user id, chat id) pairs to the (date, id) positions of the newest read
+        messages. The first UPDATE moves the watermarks which are behind their positions, the second
+        one recounts the unread messages of the participants. Returns the number of moved watermarks.
+        """
+        if not positions:
+            return 0
+        participants = [Q(person=user_id, chat_room=chat_uuid) for user_id, chat_uuid in positions]
+        moves_forward = [
+            (participant & self._watermark_before(date, message_uuid), date, message_uuid)
+            for participant, (date, message_uuid) in zip(participants, positions.values())]
+        moved = (
+            self.get_queryset()
+            .filter(reduce(operator.or_, (condition for condition, _, _ in moves_forward)))
+            .update(
+                last_read_at=Case(
+                    *(When(condition, then=Value(date, output_field=models.DateTimeField()))
+                      for condition, date, _ in moves_forward),
+                    default=F('last_read_at')),
+                last_read_message=Case(
+                    *(When(condition, then=Value(message_uuid, output_field=models.UUIDField()))
+                      for condition, _, message_uuid in moves_forward),
+                    default=F('last_read_message'))))
+        (self.get_queryset()
+         .filter(reduce(operator.or_, participants))
+         .update(unread_count=self._count_unread()))
+        return moved
+
+    def increment_unread_counts(self, chat_uuid: str, sender_id: int, messages) -> int:
+        """
+        Adds the new messages of the sender to the unread counters of the other participants
+
+        Only the messages after the watermark of the participant are added, so the delivery
+        which runs after a concurrent mark as read doesn't count the read messages again.
+        The participants whose watermark is older than the whole batch get its size, only
+        the watermarks inside the batch count its messages in a subquery.
+        """
+        messages = sorted(messages, key=lambda message: (message.date, message.id))
+        if not messages:
+            return 0
+        message_model = self.model._meta.get_field('last_read_message').related_model
+        unread_messages = (
+            message_model.objects
+            .filter(id__in=[message.id for message in messages], chat_room=OuterRef('chat_room'))
+            .filter(
+                Q(date__gt=OuterRef('last_read_at'))
+                | Q(date=OuterRef('last_read_at'), id__gt=OuterRef('last_read_message'))))
+        unread = Case(
+            When(self._watermark_before(messages[0].date, messages[0].id), then=Value(len(messages))),
+            default=self._count(unread_messages))
+        return (
+            self.get_queryset()
+            .filter(chat_room=chat_uuid)
+            .exclude(person=sender_id)
+            .update(unread_count=F('unread_count') + unread))
+
+    def unread_counts(self, user_id: int, maintained: bool = True):
+        """
+        Returns the (chat_room, unread count) pairs of every chat of the user
+
+        The maintained counters are read from the participant rows with a single indexed query,
+        otherwise the messages after the watermark of every participant are counted.
+        """
+        return self.with_unread(user_id, maintained).values_list('chat_room', 'unread')
+
+    def with_unread(self, user_id: int, maintained: bool = True):
+        """Returns the participants of the user annotated with the number of `unread` messages"""
+        participants = self.get_queryset().filter(person=user_id).order_by()
+        if maintained:
+            return participants.annotate(unread=F('unread_count'))
+        return participants.annotate(unread=self._count_unread())
+
+    def recount_unread_counts(self, chat_uuid: str) -> int:
+        """Recounts the unread counters of the participants of the chat after their watermarks with a single UPDATE"""
+        return (
+            self.get_queryset()
+            .filter(chat_room=chat_uuid)
+            .update(unread_count=self._count_unread()))
+
+    def _count_unread(self):
+        """Returns the expression which counts the messages of other users after the watermark of the participant"""
+        message_model = self.model._meta.get_field('last_read_message').related_model
+        messages = (
+            message_model.objects
+            .filter(chat_room=OuterRef('chat_room'))
+            .filter(~Q(sender=OuterRef('person'))))
+        unread_messages = messages.filter(
+            Q(date__gt=OuterRef('last_read_at'))
+            | Q(date=OuterRef('last_read_at'), id__gt=OuterRef('last_read_message')))
+        return Case(
+            When(last_read_at__isnull=True, then=self._count(messages)),
+            default=self._count(unread_messages))
+
+    @staticmethod
+    def _count(messages):
+        """Returns the expression which counts the messages in a correlated subquery"""
+        counted = messages.order_by().values('chat_room').annotate(count=Count('id')).values('count')
+        return Coalesce(Subquery(counted, output_field=models.IntegerField()), Value(0))
+
+    @staticmethod
+    def _watermark_before(date, message_uuid) -> Q:
+        """Returns the condition that the watermark is missing or is older than the (date, id) position"""
+        return (
+            Q(last_read_at__isnull=True)
+            | Q(last_read_at__lt=date)
+            | Q(last_read_at=date, last_read_message__lt=message_uuid))
 
 
 class Participant(models.Model):
     person = models.ForeignKey(User, on_delete=models.CASCADE)
-    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE)
+    chat_room = models.ForeignKey('Chat.ChatRoom', on_delete=models.CASCADE, db_index=False)
+    # The read watermark: every message up to this (date, id) position is read
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    last_read_message = models.ForeignKey(
+        'Chat.Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+')
+    # The number of messages of other participants after the watermark,
+    # it is maintained in the send transaction by the eager fan-out strategy
+    unread_count = models.PositiveIntegerField(default=0)
+    objects = ParticipantManager()
 
     class Meta:
         db_table = 'participant'
         ordering = ('person',)
         unique_together = ('person', 'chat_room')
+        indexes = (
+            # Participants of the chat in the default order
+            models.Index(fields=('chat_room', 'person'), name='participant_room_person_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.last_read_at is None:
+            # The joiner starts with the history of the chat read, new messages are unread
+            self.last_read_at, self.last_read_message_id = Participant.objects.get_joining_watermark(self.chat_room_id)
+            self.unread_count = 0
+        super().save(*args, **kwargs)
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from Chat.consumers import ChatConsumer
+
+websocket_urlpatterns = [
+    path(r'ws/chat/<uuid:chat_uuid>', ChatConsumer())
+]
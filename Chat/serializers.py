@@ -1,6 +1,22 @@
+import itertools
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
 from rest_framework import serializers
 
 from Chat.models.message import Message
+from Chat.utils.helpers import encode_position
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_JSON_BACKEND = 'json'
+# Number of NDJSON lines of the history export written at once
+EXPORT_LINES_PER_CHUNK = 500
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -8,3 +24,95 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ('id', 'chat_room', 'sender', 'text', 'date')
+
+
+def serialize_message_rows(rows) -> list:
+    """
+    Returns the same data as MessageSerializer for the rows of `MessageQuerySet.as_rows`
+
+    UUIDs and datetimes are formatted in a single pass without the serializer fields.
+    """
+    return [
+        {
+            'id': str(row.id),
+            'chat_room': str(row.chat_room),
+            'sender': row.sender,
+            'text': row.text,
+            'date': format_date(row.date),
+        }
+        for row in rows
+    ]
+
+
+def serialize_rooms(rooms) -> list:
+    """Returns the data of the chats extracted by `ChatRoom.get_rooms_page`"""
+    return [
+        {
+            'id': str(room.id),
+            'name': room.name,
+            'last_message_at': format_date(room.last_message_at),
+            'unread_count': room.unread_count,
+            'last_message': serialize_message_rows([room.last_message])[0] if room.last_message else None,
+        }
+        for room in rooms
+    ]
+
+
+def serialize_changes(messages, tombstones, seq: int, has_more: bool, resync: bool = False) -> dict:
+    """Returns the changes of `ChatRoom.get_changes`, the messages have the same fields as MessageSerializer and `seq`"""
+    serialized_messages = serialize_message_rows(messages)
+    for data, message in zip(serialized_messages, messages):
+        data['seq'] = message.seq
+    return {
+        'messages': serialized_messages,
+        'deleted': [{'id': str(message_uuid), 'seq': deleted_seq} for message_uuid, deleted_seq in tombstones],
+        'seq': seq,
+        'has_more': has_more,
+        'resync': resync,
+    }
+
+
+def render_export_lines(rows, lines_per_chunk: int = EXPORT_LINES_PER_CHUNK):
+    """
+    Encodes the rows as NDJSON, yields the bytes of `lines_per_chunk` lines at once
+
+    Every line has the same fields as MessageSerializer and the `cursor`
+    which continues the interrupted export after the message.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, lines_per_chunk))
+        if not chunk:
+            return
+        lines = []
+        for data, row in zip(serialize_message_rows(chunk), chunk):
+            data['cursor'] = encode_position(row.date, row.id)
+            lines.append(json.dumps(data))
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def format_date(value) -> str:
+    """Formats the datetime in the current time zone as DRF DateTimeField does"""
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def render_message_rows(rows) -> bytes:
+    """
+    Encodes the rows with the backend configured by CHAT_CONFIGURATION['json_backend']
+
+    The `json` backend produces the same bytes as JsonResponse for MessageSerializer data,
+    the `orjson` backend produces the equivalent compact UTF-8 JSON.
+    """
+    data = serialize_message_rows(rows)
+    backend = settings.CHAT_CONFIGURATION.get('json_backend', DEFAULT_JSON_BACKEND)
+    if backend == 'orjson':
+        if orjson is None:
+            raise ImproperlyConfigured("CHAT_CONFIGURATION['json_backend'] is `orjson`, but orjson isn't installed")
+        return orjson.dumps(data)
+    if backend != 'json':
+        raise ImproperlyConfigured("CHAT_CONFIGURATION['json_backend'] must be one of the following: json, orjson")
+    # All values are already strings and integers, so the C encoder does all the work
+    return json.dumps(data).encode()
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent by the fan-out strategy for every group of new messages which share
+# the chat and the sender, with the arguments: `messages` - the list of new
+# Message models in the order of sending, `recipients` - the list of User ids
+# of the chat participants except the sender
+messages_fanned_out = Signal()
@@ -0,0 +1,133 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from Chat.models.archived_message import ArchivedMessage
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+
+
+class ArchiveMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages which are older than the archive age
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which read all 10 messages
+        self.user_id = 5
+        self.expected_messages = list(Message.objects.filter(chat_room=self.chat_uuid))
+        # Only the messages which every participant has read are archived
+        for user_id in [3, 4]:
+            Participant.objects.mark_messages_as_read(user_id=user_id, chat_uuid=self.chat_uuid)
+
+    def test_archive_messages_batches(self):
+        call_command('archive_messages', days=365, batch_size=3, max_batches=1, stdout=StringIO())
+        # Assert that only the oldest batch is moved
+        self.assertEqual(ArchivedMessage.objects.count(), 3)
+        self.assertEqual(Message.objects.count(), 8)
+        self.assertEqual(
+            list(ArchivedMessage.objects.values_list('id', flat=True)),
+            [message.id for message in self.expected_messages[-3:]])
+
+    def test_archive_messages_keeps_new_messages(self):
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=self.user_id, text='Test hot')
+        call_command('archive_messages', days=365, batch_size=3, stdout=StringIO())
+        self.assertEqual(
+            list(Message.objects.filter(chat_room=self.chat_uuid).values_list('id', flat=True)), [new_message.id])
+        self.assertEqual(ArchivedMessage.objects.filter(chat_room=self.chat_uuid).count(), 10)
+
+    def test_read_messages_continue_into_archive(self):
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=self.user_id, text='Test hot')
+        call_command('archive_messages', days=365, stdout=StringIO())
+        expected_ids = [new_message.id] + [message.id for message in self.expected_messages]
+        # Walk the history through the hot message into the archive
+        output_ids = []
+        pages = []
+        cursor = None
+        while True:
+            messages, cursor, prev_cursor = ChatRoom.get_messages_page(
+                chat_uuid=self.chat_uuid,
+                user_id=self.user_id,
+                messages_type='read',
+                count='4',
+                cursor=cursor,
+                as_rows=True)
+            output_ids += [message.id for message in messages]
+            pages.append((messages, prev_cursor))
+            if cursor is None:
+                break
+        self.assertEqual(output_ids, expected_ids)
+        # Assert that the previous cursor walks back from the archive
+        messages, _, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=self.user_id,
+            messages_type='read',
+            count='4',
+            cursor=pages[1][1])
+        self.assertEqual([message.id for message in messages], expected_ids[:4])
+
+    def test_archive_messages_boundary(self):
+        call_command('archive_messages', days=365, batch_size=3, max_batches=1, stdout=StringIO())
+        # Assert that the boundary is the date of the newest archived message
+        self.assertEqual(
+            ChatRoom.objects.get(id=self.chat_uuid).archived_until,
+            self.expected_messages[-3].date)
+
+    @override_settings(CHAT_CONFIGURATION={
+        key: value for key, value in settings.CHAT_CONFIGURATION.items() if key != 'archive_after_days'})
+    def test_read_messages_archive_disabled(self):
+        # The messages which were archived before the archive was disabled
+        call_command('archive_messages', days=365, stdout=StringIO())
+        messages, cursor, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid, user_id=self.user_id, messages_type='read', count='20')
+        # Assert that the history doesn't depend on the configured age
+        self.assertEqual([message.id for message in messages], [message.id for message in self.expected_messages])
+        self.assertIsNone(cursor)
+
+    def test_read_messages_archived_anchor(self):
+        call_command('archive_messages', days=365, stdout=StringIO())
+        messages, _, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=self.user_id,
+            messages_type='read',
+            count='3',
+            message_uuid=str(self.expected_messages[4].id))
+        # Assert that the archived anchor is found
+        self.assertEqual(
+            [message.id for message in messages], [message.id for message in self.expected_messages[5:8]])
+
+
+class ArchiveUnreadMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages which are older than the archive age
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which read 5 of 10 messages
+        self.user_id = 4
+
+    def test_archive_messages_keeps_unread_history(self):
+        # User which didn't read any message
+        call_command('archive_messages', days=365, stdout=StringIO())
+        self.assertEqual(ArchivedMessage.objects.count(), 0)
+
+    def test_archive_messages_keeps_unread_messages(self):
+        Participant.objects.mark_messages_as_read(user_id=3, chat_uuid=self.chat_uuid)
+        expected_unread = self.get_ids('unread')
+        expected_read = self.get_ids('read')
+        call_command('archive_messages', days=365, stdout=StringIO())
+        # Assert that only the messages which everybody has read are archived
+        self.assertEqual(ArchivedMessage.objects.count(), 5)
+        self.assertEqual(self.get_ids('unread'), expected_unread)
+        self.assertEqual(self.get_ids('read'), expected_read)
+        self.assertEqual(
+            Participant.objects.get(chat_room=self.chat_uuid, person=self.user_id).unread_count,
+            len(expected_unread))
+
+    def get_ids(self, messages_type):
+        messages, _, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid, user_id=self.user_id, messages_type=messages_type, count='20')
+        return [message.id for message in messages]
@@ -0,0 +1,49 @@
+import json
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from Chat.models.chat_room import ChatRoom
+
+
+@override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, read_receipts='sync'))
+class BenchmarkApiTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_benchmark_api_report(self):
+        stdout = StringIO()
+        call_command(
+            'benchmark_api', rooms=2, members=3, messages=30, requests=6,
+            endpoints=['fetch_messages', 'send_message'], stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(set(report['results']), {'fetch_messages', 'send_message'})
+        for result in report['results'].values():
+            self.assertEqual(result['requests'], 6)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
+            self.assertEqual(set(result['latency_ms']), {'mean', 'p50', 'p95', 'p99', 'max'})
+        # Assert that the synthesized data is deleted
+        self.assertEqual(ChatRoom.objects.count(), 3)
+        self.assertFalse(User.objects.filter(username__startswith='api_benchmark_').exists())
+
+
+@override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, read_receipts='sync'))
+class BenchmarkApiAsgiTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def test_benchmark_api_asgi_report(self):
+        stdout = StringIO()
+        # The requests are handled in the threads of the ASGI handler, they need the committed data;
+        # a single client, the in-memory test database doesn't allow concurrent writers
+        call_command(
+            'benchmark_api', rooms=2, members=3, messages=30, requests=6, interface='asgi',
+            endpoints=['fetch_messages', 'send_message', 'fetch_rooms'], stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['parameters']['interface'], 'asgi')
+        for result in report['results'].values():
+            self.assertEqual(result['requests'], 6)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.utils import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from Chat.db.pool import ConnectionPool
+from Chat.db.routers import ReplicaRouter, get_read_replicas, use_primary
+from Chat.middleware import USE_PRIMARY_COOKIE, ReplicaStickinessMiddleware
+from Chat.models.message import Message
+from Chat.tests.test_fanout import chat_configuration
+
+
+def check_connection(connection):
+    connection.execute('SELECT 1')
+    return True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def get_pool(self, **options):
+        pool = ConnectionPool(connect=lambda: sqlite3.connect(':memory:'), check=check_connection, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_acquire_reuses_connection(self):
+        pool = self.get_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_acquire_max_size(self):
+        pool = self.get_pool(max_size=1, timeout=0.1)
+        pool.acquire()
+        # Assert that the checked out connections are limited
+        with self.assertRaises(OperationalError):
+            pool.acquire()
+
+    def test_acquire_waits_for_release(self):
+        pool = self.get_pool(max_size=1, timeout=5)
+        connection = pool.acquire()
+        releaser = threading.Timer(0.1, pool.release, (connection,))
+        releaser.start()
+        self.assertIs(pool.acquire(), connection)
+        releaser.join()
+
+    def test_acquire_health_check(self):
+        pool = self.get_pool(health_check_interval=0)
+        connection = pool.acquire()
+        connection.close()
+        pool.release(connection)
+        # Assert that the broken idle connection is replaced
+        new_connection = pool.acquire()
+        self.assertIsNot(new_connection, connection)
+        self.assertEqual(pool.size, 1)
+        check_connection(new_connection)
+
+    def test_release_after_close(self):
+        pool = self.get_pool()
+        connection = pool.acquire()
+        pool.close()
+        pool.release(connection)
+        self.assertEqual((pool.size, pool.idle), (0, 0))
+
+
+@patch('Chat.db.routers.get_read_replicas', lambda: ['replica'])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_db_for_read(self):
+        self.assertEqual(self.router.db_for_read(Message), 'replica')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Message), 'default')
+
+    def test_db_for_write(self):
+        self.assertEqual(self.router.db_for_write(Message), 'default')
+
+    def test_allow_migrate(self):
+        self.assertTrue(self.router.allow_migrate('default', 'Chat'))
+        self.assertFalse(self.router.allow_migrate('replica', 'Chat'))
+
+    @patch('Chat.middleware.get_read_replicas', lambda: ['replica'])
+    def test_stickiness(self):
+        factory = RequestFactory()
+        databases = []
+
+        def get_response(request):
+            databases.append(self.router.db_for_read(Message))
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(get_response)
+        middleware(factory.get('/api/chats'))
+        response = middleware(factory.post('/api/chat/send'))
+        # Assert that the client reads its own writes after the write
+        sticky_request = factory.get('/api/chats')
+        sticky_request.COOKIES[USE_PRIMARY_COOKIE] = response.cookies[USE_PRIMARY_COOKIE].value
+        middleware(sticky_request)
+        self.assertEqual(databases, ['replica', 'default', 'default'])
+
+
+class ReadReplicasSettingTestCase(SimpleTestCase):
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(read_replicas='unknown'))
+    def test_get_read_replicas_unknown(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_read_replicas()
+
+    def test_get_read_replicas_default(self):
+        self.assertEqual(get_read_replicas(), [])
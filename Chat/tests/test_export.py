@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework import status
+
+from Chat.models.archived_message import ArchivedMessage
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.tests.test_fanout import chat_configuration
+from Chat.utils.error_messages import COMPRESSION_MESSAGE
+
+
+class ExportMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages which are older than the archive age
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        self.expected_ids = [
+            str(message_uuid) for message_uuid in
+            Message.objects.filter(chat_room=self.chat_uuid).order_by('date', 'id').values_list('id', flat=True)]
+
+    def test_export_messages_with_archive(self):
+        for user_id in [3, 4]:
+            Participant.objects.mark_messages_as_read(user_id=user_id, chat_uuid=self.chat_uuid)
+        call_command('archive_messages', days=365, batch_size=3, max_batches=1, stdout=StringIO())
+        self.assertEqual(ArchivedMessage.objects.count(), 3)
+        # Assert that the archived messages go first and the chunks don't split the history
+        rows = list(ChatRoom.export_messages(self.chat_uuid, chunk_size=4))
+        self.assertEqual([str(row.id) for row in rows], self.expected_ids)
+
+    def test_export_messages_archive_disabled(self):
+        for user_id in [3, 4]:
+            Participant.objects.mark_messages_as_read(user_id=user_id, chat_uuid=self.chat_uuid)
+        call_command('archive_messages', days=365, batch_size=3, max_batches=1, stdout=StringIO())
+        # Assert that the messages archived before the archive is disabled are still exported
+        with override_settings(CHAT_CONFIGURATION=chat_configuration(archive_after_days=None)):
+            rows = list(ChatRoom.export_messages(self.chat_uuid))
+        self.assertEqual([str(row.id) for row in rows], self.expected_ids)
+
+    def test_export_messages_cursor(self):
+        lines = self.read_lines(call_command_output('export_messages', self.chat_uuid))
+        rows = ChatRoom.export_messages(self.chat_uuid, cursor=lines[3]['cursor'])
+        self.assertEqual([str(row.id) for row in rows], self.expected_ids[4:])
+
+    def test_export_view(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/export')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self.read_lines(b''.join(response.streaming_content).decode())
+        self.assertEqual([line['id'] for line in lines], self.expected_ids)
+        self.assertEqual(
+            {key for key in lines[0]}, {'id', 'chat_room', 'sender', 'text', 'date', 'cursor'})
+        # Assert that nothing is marked as read
+        self.assertEqual(Participant.objects.get(chat_room=self.chat_uuid, person=3).unread_count, 10)
+
+    async def test_export_view_asgi(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(await sync_to_async(User.objects.get)(id=3))
+        response = await client.get(f'/api/chat/{self.chat_uuid}/export?compression=gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        # Assert that the content is read without the queries on the event loop
+        lines = self.read_lines(gzip.decompress(b''.join(response.streaming_content)).decode())
+        self.assertEqual([line['id'] for line in lines], self.expected_ids)
+
+    def test_export_view_gzip(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/export', {'compression': 'gzip'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{self.chat_uuid}.ndjson.gz"')
+        lines = self.read_lines(gzip.decompress(b''.join(response.streaming_content)).decode())
+        self.assertEqual([line['id'] for line in lines], self.expected_ids)
+
+    def test_export_view_invalid_compression(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/export', {'compression': 'zip'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)['error']['message'], COMPRESSION_MESSAGE)
+
+    def test_export_command_resume(self):
+        content = call_command_output('export_messages', self.chat_uuid)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            # The export which is interrupted in the middle of the 5th line
+            with open(path, 'w') as file:
+                file.write(content[:content.index(self.expected_ids[4]) + 10])
+            call_command('export_messages', self.chat_uuid, output=path, resume=True, stderr=StringIO())
+            with open(path) as file:
+                self.assertEqual(file.read(), content)
+
+    @staticmethod
+    def read_lines(content):
+        return [json.loads(line) for line in content.splitlines()]
+
+
+def call_command_output(*args, **options):
+    stdout = StringIO()
+    call_command(*args, stdout=stdout, **options)
+    return stdout.getvalue()
@@ -0,0 +1,138 @@
+import uuid
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.participant import Participant
+from Chat.signals import messages_fanned_out
+from Chat.utils.fanout import get_fan_out_strategy, EagerFanOut, LazyFanOut, DeferredFanOut
+from Chat.utils.membership import get_membership_cache
+
+
+def chat_configuration(**options):
+    """Returns the chat configuration with the replaced options, None removes the option"""
+    configuration = dict(settings.CHAT_CONFIGURATION, **options)
+    return {key: value for key, value in configuration.items() if value is not None}
+
+
+class FanOutTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 3 participants
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        self.receiver = Mock()
+        messages_fanned_out.connect(self.receiver)
+        self.addCleanup(messages_fanned_out.disconnect, self.receiver)
+        get_membership_cache().clear()
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy=None))
+    def test_get_fan_out_strategy_default(self):
+        self.assertIsInstance(get_fan_out_strategy(), EagerFanOut)
+
+    def test_get_fan_out_strategy_by_name(self):
+        self.assertIsInstance(get_fan_out_strategy('lazy'), LazyFanOut)
+        self.assertIsInstance(get_fan_out_strategy('eager'), EagerFanOut)
+        self.assertIsInstance(get_fan_out_strategy('deferred'), DeferredFanOut)
+        # Assert that the strategy instance is reused
+        self.assertIs(get_fan_out_strategy('deferred'), get_fan_out_strategy('deferred'))
+
+    def test_get_fan_out_strategy_unknown(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_fan_out_strategy('unknown')
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='eager'))
+    def test_eager_fan_out(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test eager')
+        # Assert that all participants except the sender received the message
+        self.receiver.assert_called_once()
+        kwargs = self.receiver.call_args[1]
+        self.assertEqual([m.text for m in kwargs['messages']], ['Test eager'])
+        self.assertEqual(sorted(kwargs['recipients']), [4, 5])
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='eager'))
+    def test_eager_fan_out_batch(self):
+        # SAVEPOINT, UPDATE chat sequence and activity, SELECT chat sequence, bulk INSERT, INSERT search index,
+        # participants of the chat which are not cached yet, UPDATE unread counts, UPDATE watermark, RELEASE SAVEPOINT
+        with self.assertNumQueries(9):
+            ChatRoom.send_messages(chat_uuid=self.chat_uuid, user_id=3, texts=['Test 1', 'Test 2'])
+        # Assert that the whole batch is delivered at once
+        self.receiver.assert_called_once()
+        kwargs = self.receiver.call_args[1]
+        self.assertEqual([m.text for m in kwargs['messages']], ['Test 1', 'Test 2'])
+        self.assertEqual(sorted(kwargs['recipients']), [4, 5])
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='eager'))
+    def test_eager_fan_out_max_batch(self):
+        max_batch_size = int(settings.CHAT_CONFIGURATION['max_batch_size'])
+        ChatRoom.send_messages(
+            chat_uuid=self.chat_uuid, user_id=3, texts=[f'Test {index}' for index in range(max_batch_size)])
+        # Assert that the whole batch is counted with a single expression whatever its size
+        for user_id, unread_count in [(4, 5 + max_batch_size), (5, max_batch_size)]:
+            self.assertEqual(
+                Participant.objects.get(chat_room=self.chat_uuid, person=user_id).unread_count, unread_count)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='lazy'))
+    def test_lazy_fan_out(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test lazy')
+        # Assert that nothing is delivered on write
+        self.receiver.assert_not_called()
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='lazy'))
+    def test_recount_unread_counts_command(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test lazy')
+        # Switch to the strategy which maintains the counters
+        call_command('recount_unread_counts', stdout=StringIO())
+        for user_id in [3, 4, 5]:
+            self.assertEqual(
+                dict(Participant.objects.unread_counts(user_id)),
+                dict(Participant.objects.unread_counts(user_id, maintained=False)))
+
+
+class DeferredFanOutTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        self.receiver = Mock()
+        messages_fanned_out.connect(self.receiver)
+        self.addCleanup(messages_fanned_out.disconnect, self.receiver)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='deferred'))
+    def test_deferred_fan_out(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=4, text='Test deferred')
+        get_fan_out_strategy().join()
+        # Assert that the worker delivered the message
+        self.receiver.assert_called_once()
+        kwargs = self.receiver.call_args[1]
+        self.assertEqual([m.text for m in kwargs['messages']], ['Test deferred'])
+        self.assertEqual(sorted(kwargs['recipients']), [3, 5])
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='deferred'))
+    def test_deferred_unread_counts(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=4, text='Test deferred')
+        # Assert that the unread messages are counted on read whether the worker delivered them or not
+        self.assertEqual(ChatRoom.get_unread_counts(5)[uuid.UUID(self.chat_uuid)], 1)
+        get_fan_out_strategy().join()
+        self.assertEqual(ChatRoom.get_unread_counts(5)[uuid.UUID(self.chat_uuid)], 1)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(fan_out_strategy='deferred'))
+    def test_delivery_after_read(self):
+        strategy = get_fan_out_strategy()
+        with patch.object(strategy, 'enqueue') as enqueue:
+            ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test read first')
+        # The recipient reads the message before the worker delivers it
+        Participant.objects.mark_messages_as_read(user_id=4, chat_uuid=self.chat_uuid)
+        strategy.enqueue(*enqueue.call_args[0])
+        strategy.join()
+        # Assert that the read message isn't counted as unread
+        self.assertEqual(Participant.objects.get(chat_room=self.chat_uuid, person=4).unread_count, 0)
+        for user_id in [4, 5]:
+            self.assertEqual(
+                dict(Participant.objects.unread_counts(user_id)),
+                dict(Participant.objects.unread_counts(user_id, maintained=False)))
@@ -1,11 +1,15 @@
+import uuid
+from datetime import datetime, timezone
 from unittest.mock import Mock, patch
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 from rest_framework import status
 
-from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE
-from Chat.utils.helpers import preprocess_count, return_error, check_access_to_chat
+from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE, INVALID_CURSOR_MESSAGE
+from Chat.utils.helpers import (
+    preprocess_count, return_error, check_access_to_chat, encode_cursor, decode_cursor)
 
 
 class HelpersTestCase(TestCase):
@@ -25,14 +29,14 @@ class HelpersTestCase(TestCase):
         output_message = return_error('My message', 200).content.decode("utf-8")
         self.assertEqual(output_message, expected_message)
 
-    @patch('django.db.models.query.QuerySet.exists')
-    def test_check_access_to_chat_accessible(self, mock_exists):
+    @patch('Chat.utils.helpers.is_participant')
+    def test_check_access_to_chat_accessible(self, mock_is_participant):
         user_id = 3
         chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
         mock_func = Mock()
         mock_request = Mock()
         mock_request.user.id = user_id
-        mock_exists.return_value = True
+        mock_is_participant.return_value = True
         check_access_to_chat(mock_func)(mock_request, chat_uuid)
         mock_func.assert_called_once_with(mock_request, chat_uuid)
 
@@ -46,3 +50,16 @@ class HelpersTestCase(TestCase):
         check_access_to_chat(mock_func)(mock_request, chat_uuid)
         mock_return_error.assert_called_once_with(
             CHAT_ACCESS_MESSAGE, status.HTTP_403_FORBIDDEN)
+
+    def test_encode_decode_cursor(self):
+        message = Mock()
+        message.id = uuid.UUID('3ec95364-1395-49fb-9965-dff9b450ef1b')
+        message.date = datetime(2020, 10, 29, 12, 0, 0, 123456, tzinfo=timezone.utc)
+        output_cursor = decode_cursor(encode_cursor(message, previous=True))
+        self.assertEqual(output_cursor, (message.date, message.id, True))
+
+    def test_decode_cursor_invalid(self):
+        for cursor in ['', 'invalid', 'e30', 'WzFd']:
+            with self.assertRaises(ValidationError) as err:
+                decode_cursor(cursor)
+            self.assertEqual(err.exception.message, INVALID_CURSOR_MESSAGE)
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.search import get_search_backend
+
+
+class ImportMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages, user 5 read all of them
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'messages.jsonl')
+        lines = [
+            self.line(4, 'Imported 2', '2020-10-31T11:00:00Z'),
+            self.line(4, 'Imported 1', '2020-10-31T10:00:00Z'),
+            self.line(4, '', '2020-10-31T12:00:00Z'),
+            '{"chat_room": ',
+            self.line(1000, 'Unknown sender', '2020-10-31T12:00:00Z'),
+            '',
+            json.dumps({
+                'chat_room': '00000000-0000-0000-0000-000000000000',
+                'sender': 4,
+                'text': 'Unknown chat',
+                'date': '2020-10-31T12:00:00Z'}),
+            self.line(3, 'Imported 3', '2020-10-31T12:00:00'),
+        ]
+        with open(self.path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def test_import_messages(self):
+        output = self.import_messages()
+        self.assertIn('Imported 3 messages, skipped 0 existing and 4 invalid', output)
+        imported = list(Message.objects.filter(text__startswith='Imported').order_by('date'))
+        # Assert that the messages are numbered in the order of their dates after the existing ones
+        self.assertEqual(
+            [(message.text, message.seq, message.change_seq) for message in imported],
+            [('Imported 1', 11, 11), ('Imported 2', 12, 12), ('Imported 3', 13, 13)])
+        chat_room = ChatRoom.objects.get(id=self.chat_uuid)
+        self.assertEqual((chat_room.last_seq, chat_room.last_message_at), (13, imported[-1].date))
+        # Assert that the unread counters are recounted from the watermarks
+        self.assertEqual(
+            dict(Participant.objects.filter(chat_room=self.chat_uuid).values_list('person', 'unread_count')),
+            {3: 12, 4: 6, 5: 3})
+        self.assertEqual(
+            list(Participant.objects.unread_counts(user_id=4)),
+            list(Participant.objects.unread_counts(user_id=4, maintained=False)))
+        rows, next_cursor = get_search_backend().search(user_id=3, query='imported', count=10)
+        self.assertEqual(len(rows), 3)
+
+    def test_import_messages_skip_unread(self):
+        self.import_messages(unread='skip')
+        self.assertEqual(Participant.objects.get(chat_room=self.chat_uuid, person=5).unread_count, 0)
+
+    def test_import_messages_resume(self):
+        # The run which was interrupted after the first two lines
+        with open(f'{self.path}.checkpoint', 'w') as file:
+            json.dump({'lines': 2}, file)
+        output = self.import_messages()
+        self.assertIn('Resuming after line 2', output)
+        self.assertEqual(
+            list(Message.objects.filter(text__startswith='Imported').values_list('text', flat=True)),
+            ['Imported 3'])
+        # Assert that the lines which are imported already are skipped without the checkpoint
+        os.remove(f'{self.path}.checkpoint')
+        output = self.import_messages(segment_size=1)
+        self.assertIn('Imported 2 messages, skipped 1 existing and 4 invalid', output)
+        self.assertEqual(ChatRoom.objects.get(id=self.chat_uuid).last_seq, 13)
+
+    def import_messages(self, **options):
+        stdout = StringIO()
+        call_command('import_messages', self.path, stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def line(self, sender, text, date):
+        return json.dumps({'chat_room': self.chat_uuid, 'sender': sender, 'text': text, 'date': date})
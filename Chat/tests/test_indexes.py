@@ -0,0 +1,75 @@
+import re
+
+from django.db import connection
+from django.test import TestCase
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+
+# Plan lines which mean that the whole table or result set is walked
+SQLITE_FULL_SCAN_REGEX = r'\bSCAN\b|USE TEMP B-TREE'
+POSTGRESQL_FULL_SCAN_REGEX = r'Seq Scan'
+
+
+class QueryPlanTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        if connection.vendor == 'sqlite':
+            self.full_scan_regex = SQLITE_FULL_SCAN_REGEX
+        elif connection.vendor == 'postgresql':
+            self.full_scan_regex = POSTGRESQL_FULL_SCAN_REGEX
+            # Tiny fixture tables are cheaper to scan, so force the planner to show its index choice
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        else:
+            self.skipTest(f'Query plans are not checked for {connection.vendor}')
+
+    def test_read_messages_plan(self):
+        messages = Message.objects.read_messages(self.chat_uuid, 5)
+        self.assert_index_plan(messages[:51])
+
+    def test_read_messages_keyset_plan(self):
+        message = Message.objects.filter(chat_room=self.chat_uuid).first()
+        messages = (
+            Message.objects.read_messages(self.chat_uuid, 5)
+            .messages_before_position(message.date, message.id))
+        self.assert_index_plan(messages[:51])
+
+    def test_unread_messages_plan(self):
+        messages = Message.objects.unread_messages(self.chat_uuid, 3)
+        self.assert_index_plan(messages[:51])
+
+    def test_unread_messages_keyset_plan(self):
+        message = Message.objects.filter(chat_room=self.chat_uuid).last()
+        messages = (
+            Message.objects.unread_messages(self.chat_uuid, 3)
+            .messages_after_position(message.date, message.id))
+        self.assert_index_plan(messages[:51])
+
+    def test_mark_messages_as_read_plan(self):
+        messages_uuids = [message.id for message in ChatRoom.get_messages(self.chat_uuid, 3, 'unread')]
+        # Newest of the marked messages which becomes the watermark
+        self.assert_index_plan(
+            Message.objects
+            .filter(chat_room=self.chat_uuid, id__in=messages_uuids)
+            .order_by('-date', '-id')[:1])
+        self.assert_index_plan(
+            Message.objects
+            .filter(chat_room=self.chat_uuid)
+            .order_by('-date', '-id')[:1])
+
+    def test_participants_plan(self):
+        # Access check and read watermark
+        self.assert_index_plan(
+            Participant.objects.filter(chat_room=self.chat_uuid, person=3))
+        # Chat participants
+        self.assert_index_plan(
+            Participant.objects.filter(chat_room=self.chat_uuid).exclude(person=3))
+
+    def assert_index_plan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, re.compile(self.full_scan_regex))
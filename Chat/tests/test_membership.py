@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from Chat.models.participant import Participant
+from Chat.utils.membership import get_chat_participants, is_participant, get_membership_cache, get_membership_key
+
+
+class MembershipTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 3 participants
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        get_membership_cache().clear()
+        # Membership changes are rolled back after the test but the cache isn't
+        self.addCleanup(get_membership_cache().clear)
+
+    def test_get_chat_participants_cached(self):
+        self.assertEqual(get_chat_participants(self.chat_uuid), {3, 4, 5})
+        # Assert that the second check doesn't query the database
+        with self.assertNumQueries(0):
+            self.assertTrue(is_participant(self.chat_uuid, 3))
+            self.assertFalse(is_participant(self.chat_uuid, 2))
+            self.assertFalse(is_participant(self.chat_uuid, None))
+
+    def test_invalidate_on_save(self):
+        self.assertFalse(is_participant(self.chat_uuid, 2))
+        Participant.objects.create(person=User.objects.get(id=2), chat_room_id=self.chat_uuid)
+        # Assert that the new participant gets the access
+        self.assertTrue(is_participant(self.chat_uuid, 2))
+
+    def test_invalidate_on_delete(self):
+        self.assertTrue(is_participant(self.chat_uuid, 3))
+        Participant.objects.filter(person=3, chat_room=self.chat_uuid).delete()
+        # Assert that the removed participant loses the access
+        self.assertFalse(is_participant(self.chat_uuid, 3))
+
+
+class MembershipCommitTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 3 participants
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        get_membership_cache().clear()
+        self.addCleanup(get_membership_cache().clear)
+
+    def test_invalidate_on_commit(self):
+        with transaction.atomic():
+            Participant.objects.filter(person=3, chat_room=self.chat_uuid).delete()
+            # The concurrent request which caches the rows committed before the deletion
+            get_membership_cache().set(get_membership_key(self.chat_uuid), frozenset({3, 4, 5}))
+        # Assert that the removed participant loses the access after the commit
+        self.assertFalse(is_participant(self.chat_uuid, 3))
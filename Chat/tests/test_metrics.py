@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from Chat.tests.test_fanout import chat_configuration
+from Chat.utils.membership import get_membership_cache
+from Chat.utils.metrics import get_request_timings, instrument, measure_request, metrics_registry
+from Chat.utils.receipts import get_read_receipts
+
+
+class InstrumentationTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        metrics_registry.reset()
+        get_membership_cache().clear()
+        self.addCleanup(get_read_receipts().flush)
+
+    def test_server_timing_header(self):
+        self.client.force_login(User.objects.get(id=4))
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/messages', {'messages_type': 'read'})
+        self.assertEqual(response.status_code, 200)
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics[0], 'db')
+        self.assertIn('get_messages', metrics)
+        self.assertIn('serialize', metrics)
+        self.assertEqual(metrics[-1], 'total')
+
+    def test_server_timing_header_other_requests(self):
+        response = self.client.get('/admin/login/')
+        # Assert that only the chat endpoints are instrumented
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(metrics_endpoint='true', metrics_token='secret'))
+    def test_metrics_endpoint(self):
+        self.client.force_login(User.objects.get(id=3))
+        self.client.post(f'/api/chat/{self.chat_uuid}/send', {'text': 'Test metrics'}, content_type='application/json')
+        self.client.logout()
+        response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('chat_requests_total{view="send_message",method="POST",status="200"} 1', content)
+        self.assertIn('chat_request_duration_seconds_count{view="send_message"} 1', content)
+        self.assertIn('chat_phase_duration_seconds_count{phase="message_save"} 1', content)
+
+    def test_metrics_endpoint_disabled(self):
+        # The endpoint is disabled by default
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(metrics_endpoint='true', metrics_token='secret'))
+    def test_metrics_endpoint_not_authenticated(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        # Assert that the chat users which aren't staff are rejected as well
+        self.client.force_login(User.objects.get(id=4))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(metrics_endpoint='true'))
+    def test_metrics_endpoint_staff(self):
+        user = User.objects.get(id=4)
+        user.is_staff = True
+        user.save()
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+    def test_instrument(self):
+        with measure_request() as timings:
+            with instrument('test'):
+                pass
+            self.assertIs(get_request_timings(), timings)
+        self.assertIn('test', timings.phases)
+        self.assertIsNone(get_request_timings())
+        # Assert that the phase outside of a request is still aggregated
+        with instrument('test'):
+            pass
+        self.assertIn('chat_phase_duration_seconds_count{phase="test"} 2', metrics_registry.render())
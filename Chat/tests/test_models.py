@@ -1,101 +1,180 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import call_command
 from django.db.models import Max, Min
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from Chat.models.chat_room import ChatRoom
 from Chat.models.message import Message
 from Chat.models.participant import Participant
 from Chat.models.unread_message import UnreadMessage
+from Chat.utils.error_messages import EMPTY_TEXT_MESSAGE, INVALID_CURSOR_MESSAGE, SINCE_MESSAGE
+from Chat.utils.membership import get_chat_participants, get_membership_cache
 from django.contrib.auth.models import User
 
 
-class UnreadMessageTestCase(TestCase):
+class ParticipantTestCase(TestCase):
     fixtures = ['fixtures.json']
 
     def setUp(self):
         self.user = User.objects.get(id=3)
+        # Chat with 10 messages
         self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
-        self.participant = Participant.objects.get(
-            person=self.user, chat_room=self.chat_uuid)
-        self.user_unreadmessages = UnreadMessage.objects.filter(participant=self.participant)
+        # 10 unread messages of the current participant from oldest to newest
+        self.unread_messages_uuids = self.get_unread_messages_uuids()
+
+    def test_get_watermark_none(self):
+        # User which didn't read any message
+        output_watermark = Participant.objects.get_watermark(self.chat_uuid, self.user.id)
+        self.assertIsNone(output_watermark)
+
+    def test_get_watermark(self):
+        # User which read all 10 messages
+        user_id = 5
+        message = Message.objects.filter(chat_room=self.chat_uuid).first()
+        output_watermark = Participant.objects.get_watermark(self.chat_uuid, user_id)
+        # Assert that the watermark is at the newest message
+        self.assertEqual(output_watermark, (message.date, message.id))
 
     def test_mark_messages_as_read_empty_uuids(self):
-        # Emtpy list
-        test_messages_uuids = []
-        # Expect 10 unread messages for the current participant
-        expected_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
         # Pass empty list
-        UnreadMessage.objects.mark_messages_as_read(
+        Participant.objects.mark_messages_as_read(
             user_id=self.user.id,
             chat_uuid=self.chat_uuid,
-            messages_uuids=test_messages_uuids)
-        # Output 10 unread messages for the current participant
-        output_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
+            messages_uuids=[])
         # Assert that nothing changed
-        self.assertEqual(output_unreadmessages, expected_unreadmessages)
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids)
 
     def test_mark_messages_as_read_uuids_none(self):
-        # Expect empty list
-        expected_unreadmessages = []
-        # Do not provide the list of messages to delete
-        UnreadMessage.objects.mark_messages_as_read(
+        # Do not provide the list of messages to mark
+        Participant.objects.mark_messages_as_read(
             user_id=self.user.id,
             chat_uuid=self.chat_uuid)
-        # Output unread messages for the current participant
-        output_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
         # Assert that 10 unread messages marked as read
-        self.assertEqual(output_unreadmessages, expected_unreadmessages)
+        self.assertEqual(self.get_unread_messages_uuids(), [])
 
     def test_mark_messages_as_read_uuids_not_exist(self):
-        # List of unread messages which do not belong to the current participant
+        # List of messages which do not belong to the current chat
         test_messages_uuids = list(
-            Message.objects.exclude(
-                unreadmessage__participant=self.participant
-            ).values_list('id', flat=True))
-        # Expect 10 unread messages for the current participant
-        expected_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
-        # Pass unread messages list
-        UnreadMessage.objects.mark_messages_as_read(
+            Message.objects.exclude(chat_room=self.chat_uuid).values_list('id', flat=True))
+        # Pass messages list
+        Participant.objects.mark_messages_as_read(
             user_id=self.user.id,
             chat_uuid=self.chat_uuid,
             messages_uuids=test_messages_uuids)
-        # Output 10 unread messages for the current participant
-        output_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
         # Assert that nothing changed
-        self.assertEqual(output_unreadmessages, expected_unreadmessages)
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids)
 
     def test_mark_messages_as_read_one_message(self):
-        # Last message
-        test_messages_uuids = self.user_unreadmessages.last().message.id
-        # Expect 9 unread messages for the current participant
-        expected_unreadmessages = list(
-            self.user_unreadmessages
-            .exclude(message=test_messages_uuids)
-            .values_list('id', flat=True))
+        # Fifth unread message
+        test_messages_uuids = self.unread_messages_uuids[4]
         # Pass one message
-        UnreadMessage.objects.mark_messages_as_read(
+        Participant.objects.mark_messages_as_read(
             user_id=self.user.id,
             chat_uuid=self.chat_uuid,
             messages_uuids=test_messages_uuids)
-        # Output 9 unread messages for the current participant
-        output_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
-        self.assertEqual(output_unreadmessages, expected_unreadmessages)
+        # Assert that this message and all older messages are read
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids[5:])
 
     def test_mark_messages_as_read_multiple_uuids(self):
-        # List of 5 unread messages for the current participant
-        test_messages_uuids = list(self.user_unreadmessages[:5].values_list('message_id'))
-        # Expect list of remaining 5 unread messages for the current participant
-        expected_unreadmessages = list(
-            self.user_unreadmessages
-            .exclude(message__in=test_messages_uuids)
-            .values_list('id', flat=True))
+        # List of 5 oldest unread messages for the current participant
+        test_messages_uuids = self.unread_messages_uuids[:5]
         # Pass list of 5 unread messages
-        UnreadMessage.objects.mark_messages_as_read(
+        Participant.objects.mark_messages_as_read(
             user_id=self.user.id,
             chat_uuid=self.chat_uuid,
             messages_uuids=test_messages_uuids)
-        # Output list of remaining 5 unread messages for the current participant
-        output_unreadmessages = list(self.user_unreadmessages.values_list('id', flat=True))
-        self.assertEqual(output_unreadmessages, expected_unreadmessages)
+        # Assert that 5 newest messages remain unread
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids[5:])
+
+    def test_mark_messages_as_read_older_message(self):
+        # Mark 5 oldest messages as read
+        Participant.objects.mark_messages_as_read(
+            user_id=self.user.id,
+            chat_uuid=self.chat_uuid,
+            messages_uuids=self.unread_messages_uuids[:5])
+        # Mark the oldest message as read once again
+        Participant.objects.mark_messages_as_read(
+            user_id=self.user.id,
+            chat_uuid=self.chat_uuid,
+            messages_uuids=self.unread_messages_uuids[0])
+        # Assert that the watermark didn't move backwards
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids[5:])
+
+    def test_advance_watermark_not_participant(self):
+        message = Message.objects.filter(chat_room=self.chat_uuid).first()
+        # User which doesn't participate in the chat
+        output_count = Participant.objects.advance_watermark(2, self.chat_uuid, message.date, message.id)
+        self.assertEqual(output_count, 0)
+
+    def test_advance_watermark_older_message(self):
+        # User which read all 10 messages
+        user_id = 5
+        expected_watermark = Participant.objects.get_watermark(self.chat_uuid, user_id)
+        message = Message.objects.filter(chat_room=self.chat_uuid).last()
+        output_count = Participant.objects.advance_watermark(user_id, self.chat_uuid, message.date, message.id)
+        # Assert that the participant is found but the watermark didn't move backwards
+        self.assertEqual(output_count, 1)
+        self.assertEqual(Participant.objects.get_watermark(self.chat_uuid, user_id), expected_watermark)
+
+    def test_mark_messages_as_read_unread_count(self):
+        # Mark 5 oldest messages as read
+        Participant.objects.mark_messages_as_read(
+            user_id=self.user.id,
+            chat_uuid=self.chat_uuid,
+            messages_uuids=self.unread_messages_uuids[:5])
+        # Assert that 5 newest messages are counted as unread
+        participant = Participant.objects.get(chat_room=self.chat_uuid, person=self.user.id)
+        self.assertEqual(participant.unread_count, 5)
+
+    def test_unread_counts_maintained_and_counted(self):
+        for user_id in [3, 4, 5]:
+            # Assert that the maintained counters match the messages after the watermarks
+            self.assertEqual(
+                dict(Participant.objects.unread_counts(user_id)),
+                dict(Participant.objects.unread_counts(user_id, maintained=False)))
+
+    def test_increment_unread_counts(self):
+        # The messages of the sender 5 which aren't counted yet, the participant 4 has read two of them
+        messages = list(Message.objects.filter(chat_room=self.chat_uuid, sender=5).order_by('date', 'id'))
+        Participant.objects.filter(chat_room=self.chat_uuid).update(unread_count=0)
+        Participant.objects.filter(chat_room=self.chat_uuid, person=4).update(
+            last_read_at=messages[1].date, last_read_message=messages[1].id)
+        Participant.objects.increment_unread_counts(self.chat_uuid, 5, messages)
+        # Assert that only the messages after the watermarks are counted
+        self.assertEqual(
+            dict(Participant.objects.filter(chat_room=self.chat_uuid).values_list('person', 'unread_count')),
+            {3: 5, 4: 3, 5: 0})
+
+    def test_unread_message_mark_messages_as_read(self):
+        # The entry point of the callers which used the UnreadMessage table
+        UnreadMessage.objects.mark_messages_as_read(
+            user_id=self.user.id,
+            chat_uuid=self.chat_uuid,
+            messages_uuids=self.unread_messages_uuids[:5])
+        # Assert that 5 newest messages are still unread
+        self.assertEqual(self.get_unread_messages_uuids(), self.unread_messages_uuids[5:])
+
+    def test_create_participant_starts_at_newest_message(self):
+        # User which doesn't participate in the chat, added without ChatRoom.add_participants
+        participant = Participant.objects.create(person_id=2, chat_room_id=self.chat_uuid)
+        message = Message.objects.filter(chat_room=self.chat_uuid).first()
+        # Assert that the history of the chat isn't unread
+        self.assertEqual((participant.last_read_at, participant.last_read_message_id), (message.date, message.id))
+        self.assertEqual(Participant.objects.get_watermark(self.chat_uuid, 2), (message.date, message.id))
+        self.assertFalse(Message.objects.unread_messages(self.chat_uuid, 2).exists())
+        self.assertEqual(participant.unread_count, 0)
+
+    def get_unread_messages_uuids(self):
+        return list(
+            Message.objects
+            .unread_messages(self.chat_uuid, self.user.id)
+            .values_list('id', flat=True))
 
 
 class MessageTestCase(TestCase):
@@ -129,6 +208,26 @@ class MessageTestCase(TestCase):
             list(output_messages.values_list('id', flat=True)),
             expected_messages)
 
+    def test_messages_before_position(self):
+        # Take third message
+        message = Message.objects.all()[2]
+        expected_messages = Message.objects.all()[3:]
+        output_messages = Message.objects.all().messages_before_position(message.date, message.id)
+        # Assert that it returns all messages older than the third one
+        self.assertEqual(
+            list(output_messages.values_list('id', flat=True)),
+            list(expected_messages.values_list('id', flat=True)))
+
+    def test_messages_after_position(self):
+        # Take third message
+        message = Message.objects.all()[2]
+        expected_messages = Message.objects.all()[:2]
+        output_messages = Message.objects.all().messages_after_position(message.date, message.id)
+        # Assert that it returns two messages newer than the third one
+        self.assertEqual(
+            list(output_messages.values_list('id', flat=True)),
+            list(expected_messages.values_list('id', flat=True)))
+
     def test_read_messages_empty_chat(self):
         # Chat without messages
         chat_uuid = '36323c8f-47d1-4023-85d3-ad047d0275f8'
@@ -260,10 +359,12 @@ class ChatRoomTestCase(TestCase):
     def test_get_messages_five_last_unread_messages(self):
         # User which has 10 unread messages
         user_id = 3
-        messages_to_delete = UnreadMessage.objects.filter(
-            participant__person=user_id,
-            participant__chat_room=self.chat_uuid)[:5]
-        UnreadMessage.objects.filter(id__in=messages_to_delete).delete()
+        # Read 5 oldest messages
+        messages_to_read = Message.objects.filter(chat_room=self.chat_uuid).reverse()[:5]
+        Participant.objects.mark_messages_as_read(
+            user_id=user_id,
+            chat_uuid=self.chat_uuid,
+            messages_uuids=list(messages_to_read.values_list('id', flat=True)))
         expected_messages = list(Message.objects.filter(chat_room=self.chat_uuid).reverse()[5:])
         output_messages = ChatRoom.get_messages(
             chat_uuid=self.chat_uuid,
@@ -295,17 +396,348 @@ class ChatRoomTestCase(TestCase):
             text=text)
         # Get last message
         new_message = Message.objects.latest('date')
+        # Assert that the sender has read it
+        self.assertEqual(
+            Participant.objects.get_watermark(self.chat_uuid, user_id),
+            (new_message.date, new_message.id))
         # Assert that latest message is what we sent
         self.assertEqual(new_message.text, text)
         # Extract chat participants except message sender
         expected_participants = Participant.objects.filter(
             chat_room=self.chat_uuid).exclude(
-            person=user_id).values_list('id', flat=True)
+            person=user_id).values_list('person_id', flat=True)
         # Participants which have new message as unread
-        output_participants = UnreadMessage.objects.filter(
-            message=new_message).values_list('participant_id', flat=True)
+        output_participants = [
+            person_id
+            for person_id in Participant.objects.filter(
+                chat_room=self.chat_uuid).values_list('person_id', flat=True)
+            if Message.objects.unread_messages(self.chat_uuid, person_id).filter(id=new_message.id).exists()]
         # Assert that chat participants except message sender get new message as unread
-        self.assertEqual(list(output_participants), list(expected_participants))
+        self.assertEqual(output_participants, list(expected_participants))
+
+    def test_send_messages(self):
+        # User which participates
+        user_id = 3
+        texts = ['Batch message 1', '', 'Batch message 2', None]
+        new_messages, errors = ChatRoom.send_messages(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            texts=texts)
+        # Assert that invalid texts are reported by their indexes
+        self.assertEqual(errors, {1: EMPTY_TEXT_MESSAGE, 3: EMPTY_TEXT_MESSAGE})
+        # Assert that valid messages are sent in the order of the batch
+        output_messages = list(Message.objects.filter(chat_room=self.chat_uuid)[:2])
+        self.compare_messages(reversed(new_messages), output_messages)
+        self.assertEqual([m.text for m in output_messages], ['Batch message 2', 'Batch message 1'])
+        # Assert that the sender has read the whole batch
+        self.assertEqual(
+            Participant.objects.get_watermark(self.chat_uuid, user_id),
+            (output_messages[0].date, output_messages[0].id))
+
+    def test_send_messages_interleaved(self):
+        newest_date = Message.objects.filter(chat_room=self.chat_uuid).latest('date').date
+        # The sender whose clock is ahead commits first, then the sender whose clock is behind
+        with patch('Chat.models.chat_room.timezone.now', return_value=newest_date + timedelta(seconds=10)):
+            first_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='First')
+        with patch('Chat.models.chat_room.timezone.now', return_value=newest_date + timedelta(seconds=5)):
+            new_messages, errors = ChatRoom.send_messages(
+                chat_uuid=self.chat_uuid, user_id=4, texts=['Second', 'Third'])
+        # Assert that the dates follow the order of the commits
+        messages = list(Message.objects.filter(chat_room=self.chat_uuid, seq__gt=10).order_by('seq'))
+        self.assertEqual([m.text for m in messages], ['First', 'Second', 'Third'])
+        self.assertEqual([m.date for m in messages], sorted({m.date for m in messages}))
+        self.assertEqual([m.date for m in messages], [first_message.date] + [m.date for m in new_messages])
+        self.assertEqual(ChatRoom.objects.get(id=self.chat_uuid).last_message_at, messages[-1].date)
+        # Assert that the reader of the first message gets the later committed ones as unread
+        Participant.objects.mark_messages_as_read(
+            user_id=5, chat_uuid=self.chat_uuid, messages_uuids=[first_message.id])
+        self.assertEqual(
+            [m.text for m in Message.objects.unread_messages(self.chat_uuid, 5)], ['Second', 'Third'])
+
+    def test_send_messages_no_access(self):
+        messages_count = Message.objects.count()
+        # User which doesn't participate in the chat
+        with self.assertRaises(PermissionDenied):
+            ChatRoom.send_messages(
+                chat_uuid=self.chat_uuid,
+                user_id=2,
+                texts=['Batch message'])
+        # Assert that the batch is rolled back
+        self.assertEqual(Message.objects.count(), messages_count)
+
+    def test_send_messages_no_access_invalid_texts(self):
+        # User which doesn't participate in the chat sends nothing valid
+        with self.assertRaises(PermissionDenied):
+            ChatRoom.send_messages(
+                chat_uuid=self.chat_uuid,
+                user_id=2,
+                texts=[''])
+
+    def test_get_messages_page_read_cursors(self):
+        # User which read all 10 messages
+        user_id = 5
+        messages = list(Message.objects.filter(chat_room=self.chat_uuid))
+        output_messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='read',
+            count='4')
+        # Assert that the first page has no previous page
+        self.compare_messages(messages[:4], output_messages)
+        self.assertIsNone(prev_cursor)
+        output_messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='read',
+            count='4',
+            cursor=next_cursor)
+        self.compare_messages(messages[4:8], output_messages)
+        output_messages, next_cursor, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='read',
+            count='4',
+            cursor=next_cursor)
+        # Assert that the last page has no next page
+        self.compare_messages(messages[8:], output_messages)
+        self.assertIsNone(next_cursor)
+        output_messages, _, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='read',
+            count='4',
+            cursor=prev_cursor)
+        # Assert that the previous cursor returns to the first page
+        self.compare_messages(messages[:4], output_messages)
+
+    def test_get_messages_page_unread_cursors(self):
+        # User which has 10 unread messages
+        user_id = 3
+        messages = list(Message.objects.filter(chat_room=self.chat_uuid).reverse())
+        output_messages, next_cursor, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='unread',
+            count='6')
+        self.compare_messages(messages[:6], output_messages)
+        output_messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='unread',
+            count='6',
+            cursor=next_cursor)
+        # Assert that the second page returns the remaining unread messages
+        self.compare_messages(messages[6:], output_messages)
+        self.assertIsNone(next_cursor)
+        output_messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id,
+            messages_type='unread',
+            count='6',
+            cursor=prev_cursor)
+        self.compare_messages(messages[:6], output_messages)
+        self.assertIsNone(prev_cursor)
+        self.assertIsNotNone(next_cursor)
+
+    def test_get_messages_page_same_date(self):
+        # User which read all 10 messages
+        user_id = 5
+        # Make all messages share the same date
+        Message.objects.filter(chat_room=self.chat_uuid).update(date='2020-10-29T12:00:00Z')
+        expected_messages = list(Message.objects.filter(chat_room=self.chat_uuid))
+        output_messages = []
+        cursor = None
+        for _ in range(4):
+            messages, cursor, _ = ChatRoom.get_messages_page(
+                chat_uuid=self.chat_uuid,
+                user_id=user_id,
+                messages_type='read',
+                count='3',
+                cursor=cursor)
+            output_messages.extend(messages)
+        # Assert that no message is skipped or repeated
+        self.compare_messages(expected_messages, output_messages)
+        self.assertIsNone(cursor)
+
+    def test_get_unread_counts(self):
+        # User which read all 10 messages and the sender of the new message
+        user_id = 5
+        sender_id = 4
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=sender_id, text='Test unread count')
+        # Assert that the new message is unread for everyone except the sender
+        self.assertEqual(ChatRoom.get_unread_counts(user_id), {
+            uuid.UUID(self.chat_uuid): 1,
+            uuid.UUID('dc56ad05-90db-4dcd-9739-db2bee4b315f'): 0
+        })
+        self.assertEqual(ChatRoom.get_unread_counts(sender_id), {uuid.UUID(self.chat_uuid): 0})
+        self.assertEqual(ChatRoom.get_unread_counts(3)[uuid.UUID(self.chat_uuid)], 11)
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, fan_out_strategy='lazy'))
+    def test_get_unread_counts_lazy(self):
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=4, text='Test unread count')
+        # Assert that the counts are computed on read without the maintained counters
+        self.assertEqual(ChatRoom.get_unread_counts(5)[uuid.UUID(self.chat_uuid)], 1)
+        self.assertEqual(Participant.objects.get(chat_room=self.chat_uuid, person=5).unread_count, 0)
+
+    def test_get_rooms_page(self):
+        # User which participates in 3 chats
+        with self.assertNumQueries(2):
+            rooms, next_cursor = ChatRoom.get_rooms_page(user_id=3)
+        # Assert that the chats go from the most to the least recently active
+        self.assertEqual([room.name for room in rooms], ['Test Chat 1', 'Test Chat 3', 'Test Chat 2'])
+        self.assertEqual([room.unread_count for room in rooms], [10, 1, 0])
+        self.assertEqual(rooms[0].last_message.id, Message.objects.filter(chat_room=self.chat_uuid).first().id)
+        self.assertIsNone(rooms[2].last_message)
+        self.assertIsNone(next_cursor)
+
+    def test_get_rooms_page_cursor(self):
+        rooms, next_cursor = ChatRoom.get_rooms_page(user_id=3, count='2')
+        self.assertEqual([room.name for room in rooms], ['Test Chat 1', 'Test Chat 3'])
+        rooms, next_cursor = ChatRoom.get_rooms_page(user_id=3, count='2', cursor=next_cursor)
+        self.assertEqual([room.name for room in rooms], ['Test Chat 2'])
+        self.assertIsNone(next_cursor)
+
+    def test_get_rooms_page_new_message(self):
+        chat_uuid = 'dc56ad05-90db-4dcd-9739-db2bee4b315f'
+        new_message = ChatRoom.send_message(chat_uuid=chat_uuid, user_id=5, text='Test activity')
+        rooms, next_cursor = ChatRoom.get_rooms_page(user_id=3)
+        # Assert that the chat with the new message goes first
+        self.assertEqual(rooms[0].id, uuid.UUID(chat_uuid))
+        self.assertEqual(rooms[0].last_message_at, new_message.date)
+        self.assertEqual(rooms[0].last_message.text, 'Test activity')
+        self.assertEqual(rooms[0].unread_count, 2)
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, fan_out_strategy='lazy'))
+    def test_get_rooms_page_lazy(self):
+        rooms, next_cursor = ChatRoom.get_rooms_page(user_id=3)
+        # Assert that the counted unread messages match the maintained counters
+        self.assertEqual([room.unread_count for room in rooms], [10, 1, 0])
+
+    def test_get_messages_invalid_cursor(self):
+        with self.assertRaises(ValidationError) as err:
+            ChatRoom.get_messages(
+                chat_uuid=self.chat_uuid,
+                user_id=5,
+                messages_type='read',
+                cursor='invalid')
+        self.assertEqual(err.exception.message, INVALID_CURSOR_MESSAGE)
+
+    def test_add_participants(self):
+        get_membership_cache().clear()
+        self.assertEqual(get_chat_participants(self.chat_uuid), {3, 4, 5})
+        # INSERT new participants with a single statement
+        added = ChatRoom.add_participants(self.chat_uuid, [1, 2, 3, 1000])
+        # Assert that the existing and the unknown users are skipped
+        self.assertEqual(added, 2)
+        self.assertEqual(get_chat_participants(self.chat_uuid), {1, 2, 3, 4, 5})
+        # Assert that the joiners have read the whole history
+        joiner = Participant.objects.get(chat_room=self.chat_uuid, person=2)
+        self.assertEqual(joiner.unread_count, 0)
+        self.assertEqual(str(joiner.last_read_message_id), '51200695-f233-4cb4-bd92-130b8553e416')
+        self.assertFalse(Message.objects.unread_messages(self.chat_uuid, 2).exists())
+        # Assert that the existing participant keeps the unread state
+        self.assertEqual(Participant.objects.get(chat_room=self.chat_uuid, person=3).unread_count, 10)
+
+    def test_add_participants_empty_chat(self):
+        chat_uuid = '36323c8f-47d1-4023-85d3-ad047d0275f8'
+        self.assertEqual(ChatRoom.add_participants(chat_uuid, [4]), 1)
+        self.assertIsNone(Participant.objects.get_watermark(chat_uuid, 4))
+
+    def test_add_participants_concurrently_added(self):
+        get_joining_watermark = Participant.objects.get_joining_watermark
+
+        def add_concurrently(chat_uuid):
+            watermark = get_joining_watermark(chat_uuid)
+            # The participant which is added between the SELECT of the joiners and the INSERT
+            Participant.objects.bulk_create([Participant(person_id=2, chat_room_id=chat_uuid)])
+            return watermark
+
+        with patch.object(Participant.objects, 'get_joining_watermark', side_effect=add_concurrently):
+            added = ChatRoom.add_participants(self.chat_uuid, [1, 2])
+        # Assert that the conflicting participant is skipped instead of failing the INSERT
+        self.assertEqual(added, 2)
+        self.assertEqual(Participant.objects.filter(chat_room=self.chat_uuid, person__in=[1, 2]).count(), 2)
+
+    def test_remove_participants(self):
+        get_membership_cache().clear()
+        get_chat_participants(self.chat_uuid)
+        removed = ChatRoom.remove_participants(self.chat_uuid, [3, 4, 2], batch_size=2)
+        self.assertEqual(removed, 2)
+        self.assertEqual(get_chat_participants(self.chat_uuid), {5})
+
+    def test_get_changes(self):
+        messages, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, since='7')
+        self.assertEqual([message.text for message in messages], ['Message 8', 'Message 9', 'Message 10'])
+        self.assertEqual(tombstones, [])
+        self.assertEqual((seq, has_more), (10, False))
+        # Assert that the client which is up to date gets nothing and keeps its sequence number
+        self.assertEqual(ChatRoom.get_changes(self.chat_uuid, since='10'), ([], [], 10, False, False))
+
+    def test_get_changes_count(self):
+        messages, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, count='4')
+        self.assertEqual([message.seq for message in messages], [1, 2, 3, 4])
+        self.assertEqual((seq, has_more), (4, True))
+
+    def test_get_changes_send_edit_delete(self):
+        message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='New message')
+        self.assertEqual((message.seq, message.change_seq), (11, 11))
+        edited = Message.objects.get(text='Message 2')
+        edited.text = 'Edited message'
+        edited.save(update_fields=['text'])
+        deleted = Message.objects.get(text='Message 5')
+        deleted_uuid = deleted.id
+        deleted.delete()
+        messages, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, since='10')
+        # Assert that the edited message keeps its position and gets a new change number
+        self.assertEqual(
+            [(message.text, message.seq, message.change_seq) for message in messages],
+            [('New message', 11, 11), ('Edited message', 2, 12)])
+        self.assertEqual(tombstones, [(deleted_uuid, 13)])
+        self.assertEqual((seq, has_more), (13, False))
+        self.assertEqual(ChatRoom.objects.get(id=self.chat_uuid).last_seq, 13)
+
+    def test_delete_messages(self):
+        messages = list(Message.objects.filter(chat_room=self.chat_uuid).order_by('date')[:3])
+        other_chat_message = Message.objects.get(chat_room='dc56ad05-90db-4dcd-9739-db2bee4b315f')
+        deleted = ChatRoom.delete_messages(self.chat_uuid, [m.id for m in messages] + [other_chat_message.id])
+        # Assert that the message of the other chat is skipped
+        self.assertEqual(deleted, 3)
+        self.assertTrue(Message.objects.filter(id=other_chat_message.id).exists())
+        messages_, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, since='10')
+        self.assertEqual(tombstones, [(m.id, 11 + index) for index, m in enumerate(messages)])
+        self.assertEqual(seq, 13)
+
+    def test_get_changes_queryset_delete(self):
+        deleted = list(Message.objects.filter(chat_room=self.chat_uuid, sender=5).order_by('date', 'id'))
+        # The deletion of the sender deletes its messages by the cascade
+        User.objects.get(id=5).delete()
+        deleted += list(Message.objects.filter(chat_room=self.chat_uuid, text='Message 1'))
+        Message.objects.filter(chat_room=self.chat_uuid, text='Message 1').delete()
+        messages_, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, since='10')
+        # Assert that both deletions leave the tombstones of the messages
+        self.assertEqual(tombstones, [(message.id, 11 + index) for index, message in enumerate(deleted)])
+        self.assertEqual(seq, 16)
+        # Assert that the other chat of the sender gets the tombstone as well
+        messages_, tombstones, seq, has_more, resync = ChatRoom.get_changes(
+            'dc56ad05-90db-4dcd-9739-db2bee4b315f', since='1')
+        self.assertEqual((len(tombstones), seq), (1, 2))
+
+    def test_get_changes_archived(self):
+        for user_id in [3, 4]:
+            Participant.objects.mark_messages_as_read(user_id=user_id, chat_uuid=self.chat_uuid)
+        call_command('archive_messages', days=365, batch_size=3, max_batches=1, stdout=StringIO())
+        # Assert that the archived messages leave no tombstones
+        self.assertEqual(ChatRoom.get_changes(self.chat_uuid, since='10'), ([], [], 10, False, False))
+        # Assert that the client which hasn't synced the archived messages reloads the chat
+        self.assertEqual(ChatRoom.get_changes(self.chat_uuid, since='2'), ([], [], 10, False, True))
+        messages, tombstones, seq, has_more, resync = ChatRoom.get_changes(self.chat_uuid, since='3')
+        self.assertEqual((len(messages), resync), (7, False))
+
+    def test_get_changes_invalid_since(self):
+        for since in ('-1', 'abc', '1.5'):
+            with self.assertRaises(ValidationError) as err:
+                ChatRoom.get_changes(self.chat_uuid, since=since)
+            self.assertEqual(err.exception.message, SINCE_MESSAGE)
 
     def compare_messages(self, expected_messages, output_messages):
         self.assertEqual(
@@ -0,0 +1,151 @@
+import asyncio
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from Chat.consumers import CHAT_ACCESS_CLOSE_CODE
+from Chat.models.chat_room import ChatRoom
+from Chat.tests.test_fanout import chat_configuration
+from Chat.utils import pubsub
+from Chat.utils.pubsub import InMemoryPubSub, PubSubBackend
+
+
+class LocalBroker:
+    """Stand-in for the broker which connects the backends of several nodes"""
+
+    def __init__(self):
+        self.nodes = []
+
+    def publish(self, channel, payload):
+        for node in self.nodes:
+            node.deliver(channel, payload)
+
+
+class BrokerPubSub(PubSubBackend):
+    def __init__(self, broker):
+        super().__init__()
+        self.broker = broker
+        broker.nodes.append(self)
+
+    def publish(self, channel, payload):
+        self.broker.publish(channel, payload)
+
+
+class PubSubTestCase(SimpleTestCase):
+
+    async def test_in_memory_publish(self):
+        backend = InMemoryPubSub()
+        subscription = backend.subscribe('chat.1')
+        other_subscription = backend.subscribe('chat.2')
+        backend.publish('chat.1', 'payload')
+        # Assert that only the subscribers of the channel get the payload
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), 'payload')
+        self.assertTrue(other_subscription.queue.empty())
+
+    async def test_in_memory_unsubscribe(self):
+        backend = InMemoryPubSub()
+        subscription = backend.subscribe('chat.1')
+        backend.unsubscribe(subscription)
+        backend.publish('chat.1', 'payload')
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_overflow(self):
+        backend = InMemoryPubSub()
+        subscription = backend.subscribe('chat.1')
+        for i in range(pubsub.SUBSCRIPTION_QUEUE_SIZE + 1):
+            backend.publish('chat.1', str(i))
+        await asyncio.sleep(0)
+        # Assert that the subscription is marked as fallen behind
+        self.assertTrue(subscription.overflowed)
+
+    async def test_broker_publish(self):
+        broker = LocalBroker()
+        first_node, second_node = BrokerPubSub(broker), BrokerPubSub(broker)
+        subscription = second_node.subscribe('chat.1')
+        first_node.publish('chat.1', 'payload')
+        # Assert that the payload published on one node reaches the subscriber of another one
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), 'payload')
+
+
+class ChatConsumerTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+
+    async def test_push_message(self):
+        send, receive_queue, task = await self.connect(user_id=3)
+        self.assertEqual((await asyncio.wait_for(send.get(), 1))['type'], 'websocket.accept')
+        new_message = await sync_to_async(ChatRoom.send_message)(
+            chat_uuid=self.chat_uuid, user_id=4, text='Test push')
+        event = await asyncio.wait_for(send.get(), 1)
+        # Assert that the message is pushed in the format of fetch_messages
+        self.assertEqual(event['type'], 'websocket.send')
+        self.assertEqual(json.loads(event['text'])['id'], str(new_message.id))
+        self.assertEqual(json.loads(event['text'])['text'], 'Test push')
+        await receive_queue.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 1)
+
+    async def test_removed_participant(self):
+        send, receive_queue, task = await self.connect(user_id=3)
+        self.assertEqual((await asyncio.wait_for(send.get(), 1))['type'], 'websocket.accept')
+        await sync_to_async(ChatRoom.remove_participants)(self.chat_uuid, [3])
+        await sync_to_async(ChatRoom.send_message)(chat_uuid=self.chat_uuid, user_id=4, text='Test removed')
+        # Assert that the message isn't pushed to the removed participant
+        event = await asyncio.wait_for(send.get(), 1)
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CHAT_ACCESS_CLOSE_CODE})
+        await asyncio.wait_for(task, 1)
+
+    async def test_no_access(self):
+        # User which doesn't participate in the chat
+        send, receive_queue, task = await self.connect(user_id=2)
+        event = await asyncio.wait_for(send.get(), 1)
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CHAT_ACCESS_CLOSE_CODE})
+        await asyncio.wait_for(task, 1)
+
+    async def test_foreign_origin(self):
+        send, receive_queue, task = await self.connect(user_id=3, origin='https://attacker.example')
+        # Assert that the page of the foreign origin can't use the cookies of the participant
+        event = await asyncio.wait_for(send.get(), 1)
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CHAT_ACCESS_CLOSE_CODE})
+        await asyncio.wait_for(task, 1)
+
+    @override_settings(CHAT_CONFIGURATION=chat_configuration(websocket_allowed_origins='https://app.example'))
+    async def test_allowed_origin(self):
+        send, receive_queue, task = await self.connect(user_id=3, origin='https://app.example')
+        self.assertEqual((await asyncio.wait_for(send.get(), 1))['type'], 'websocket.accept')
+        await receive_queue.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 1)
+
+    async def connect(self, user_id, origin='http://testserver'):
+        from notifier.asgi import application
+        session_key = await sync_to_async(self.create_session)(user_id)
+        scope = {
+            'type': 'websocket',
+            'path': f'/ws/chat/{self.chat_uuid}',
+            'headers': [
+                (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode()),
+                (b'origin', origin.encode()),
+            ],
+        }
+        send, receive_queue = asyncio.Queue(), asyncio.Queue()
+        await receive_queue.put({'type': 'websocket.connect'})
+        task = asyncio.ensure_future(application(scope, receive_queue.get, send.put))
+        return send, receive_queue, task
+
+    @staticmethod
+    def create_session(user_id):
+        user = User.objects.get(id=user_id)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.id)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
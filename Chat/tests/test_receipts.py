@@ -0,0 +1,110 @@
+import json
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Chat import views
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.membership import get_membership_cache
+from Chat.utils.receipts import get_read_receipts, SyncReadReceipts, DeferredReadReceipts
+
+
+class ReadReceiptsTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which didn't read any message
+        self.user_id = 3
+        # 10 messages from oldest to newest
+        self.messages = list(Message.objects.filter(chat_room=self.chat_uuid).reverse())
+
+    def test_get_read_receipts(self):
+        self.assertIsInstance(get_read_receipts('sync'), SyncReadReceipts)
+        self.assertIsInstance(get_read_receipts('deferred'), DeferredReadReceipts)
+        with self.assertRaises(ImproperlyConfigured):
+            get_read_receipts('unknown')
+
+    def test_sync_mark_as_read(self):
+        get_read_receipts('sync').mark_as_read(self.user_id, self.chat_uuid, self.messages[:5])
+        # Assert that 5 newest messages remain unread
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, self.user_id).count(), 5)
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, read_receipts_interval='60'))
+    def test_deferred_mark_as_read_coalesced(self):
+        receipts = DeferredReadReceipts()
+        # Buffering the receipts doesn't touch the database
+        with self.assertNumQueries(0):
+            receipts.mark_as_read(self.user_id, self.chat_uuid, self.messages[:5])
+            receipts.mark_as_read(self.user_id, self.chat_uuid, self.messages[:2])
+            receipts.mark_as_read(self.user_id, self.chat_uuid, [])
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, self.user_id).count(), 10)
+        # Assert that the receipts are coalesced into the newest message
+        self.assertEqual(receipts.flush(), 1)
+        self.assertEqual(
+            Participant.objects.get_watermark(self.chat_uuid, self.user_id),
+            (self.messages[4].date, self.messages[4].id))
+        self.assertEqual(receipts.flush(), 0)
+
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, read_receipts_interval='60'))
+    def test_deferred_flush_set_based(self):
+        receipts = DeferredReadReceipts()
+        receipts.mark_as_read(self.user_id, self.chat_uuid, self.messages[:5])
+        # User which read 5 of 10 messages
+        receipts.mark_as_read(4, self.chat_uuid, self.messages[:7])
+        # SAVEPOINT, UPDATE watermarks, UPDATE unread counts, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            self.assertEqual(receipts.flush(), 2)
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, self.user_id).count(), 5)
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, 4).count(), 3)
+        for user_id in [self.user_id, 4]:
+            self.assertEqual(
+                dict(Participant.objects.unread_counts(user_id)),
+                dict(Participant.objects.unread_counts(user_id, maintained=False)))
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, read_receipts_interval='60'))
+    def test_deferred_flush_failure_keeps_receipts(self):
+        receipts = DeferredReadReceipts()
+        receipts.mark_as_read(self.user_id, self.chat_uuid, self.messages[:5])
+        with mock.patch.object(Participant.objects, 'advance_watermarks', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                receipts.flush()
+        # Assert that the failed receipts are flushed next time
+        self.assertEqual(receipts.flush(), 1)
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, self.user_id).count(), 5)
+
+@override_settings(CHAT_CONFIGURATION=dict(
+    settings.CHAT_CONFIGURATION, read_receipts='deferred', read_receipts_interval='0.1'))
+class DeferredReadReceiptsTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which didn't read any message
+        self.user = User.objects.get(id=3)
+        get_membership_cache().clear()
+        self.addCleanup(get_read_receipts().flush)
+
+    def test_fetch_messages_read_only(self):
+        request = APIRequestFactory().get(
+            f'/chat/{self.chat_uuid}/messages', {'messages_type': 'unread', 'count': '5'})
+        force_authenticate(request, user=self.user)
+        # Access check, chat version, watermark and messages, nothing is written by the request
+        with self.assertNumQueries(4):
+            response = views.fetch_messages(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(len(json.loads(response.content)), 5)
+        # Assert that the worker marks the fetched messages as read
+        deadline = time.monotonic() + 5
+        while Message.objects.unread_messages(self.chat_uuid, self.user.id).count() != 5:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.utils.recent import (
+    append_recent_messages, get_recent_messages, get_recent_messages_cache, recent_messages_stats)
+
+
+class RecentMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which read all 10 messages
+        self.user_id = 5
+        get_recent_messages_cache().clear()
+        recent_messages_stats.reset()
+
+    def test_get_messages_page_from_cache(self):
+        expected_page = self.get_page(version=None)
+        version = ChatRoom.get_messages_version(self.chat_uuid, self.user_id)
+        # The first request fills the ring buffer of the chat
+        self.assertEqual(self.get_page(version), expected_page)
+        # Assert that the next request doesn't touch the database
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_page(version), expected_page)
+        self.assertEqual(recent_messages_stats.as_dict(), {'hits': 2, 'misses': 0, 'hit_ratio': 1.0})
+
+    def test_get_messages_page_stale_cache(self):
+        version = ChatRoom.get_messages_version(self.chat_uuid, self.user_id)
+        self.get_page(version)
+        # The message isn't written through, the transaction of the test isn't committed
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=self.user_id, text='Test stale')
+        version = ChatRoom.get_messages_version(self.chat_uuid, self.user_id)
+        # Assert that the cache behind the version is refilled
+        messages, _, _ = self.get_page(version)
+        self.assertEqual(messages[0].text, 'Test stale')
+        self.assertEqual(recent_messages_stats.misses, 0)
+
+    def test_get_recent_messages_other_seq(self):
+        get_recent_messages(self.chat_uuid, seq=10)
+        # The chat which is changed by another process, e.g. by the import command
+        ChatRoom.allocate_seq(self.chat_uuid)
+        # Assert that the buffer of the previous sequence number isn't used
+        self.assertIsNotNone(get_recent_messages(self.chat_uuid, fill=False, seq=10))
+        self.assertIsNone(get_recent_messages(self.chat_uuid, fill=False, seq=11))
+
+    def test_get_messages_page_own_messages(self):
+        # User which didn't read any message has only its own messages read
+        version = ChatRoom.get_messages_version(self.chat_uuid, 3)
+        self.assertEqual(
+            self.get_page(version, user_id=3),
+            self.get_page(version=None, user_id=3))
+
+    def test_append_recent_messages(self):
+        rows, complete = get_recent_messages(self.chat_uuid, seq=10)
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test append')
+        append_recent_messages(self.chat_uuid, [new_message])
+        # Assert that the message is written through to the head of the buffer
+        output_rows, output_complete = get_recent_messages(self.chat_uuid, fill=False)
+        self.assertEqual([row.id for row in output_rows], [new_message.id] + [row.id for row in rows])
+        self.assertTrue(output_complete)
+        # Assert that the older message drops the buffer
+        append_recent_messages(self.chat_uuid, [Message.objects.get(id=rows[0].id)])
+        self.assertIsNone(get_recent_messages(self.chat_uuid, fill=False))
+        # Assert that the message which doesn't follow the sequence number of the buffer drops it
+        get_recent_messages(self.chat_uuid, seq=11)
+        ChatRoom.allocate_seq(self.chat_uuid)
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test gap')
+        append_recent_messages(self.chat_uuid, [new_message])
+        self.assertIsNone(get_recent_messages(self.chat_uuid, fill=False))
+
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, recent_messages_count='3'))
+    def test_recent_messages_bounded(self):
+        rows, complete = get_recent_messages(self.chat_uuid, seq=10)
+        self.assertEqual(len(rows), 3)
+        self.assertFalse(complete)
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test bounded')
+        append_recent_messages(self.chat_uuid, [new_message])
+        output_rows, _ = get_recent_messages(self.chat_uuid, fill=False)
+        self.assertEqual([row.id for row in output_rows], [new_message.id] + [row.id for row in rows[:2]])
+
+    def test_delete_invalidates_recent_messages(self):
+        rows, complete = get_recent_messages(self.chat_uuid)
+        Message.objects.filter(id=rows[0].id).delete()
+        self.assertIsNone(get_recent_messages(self.chat_uuid, fill=False))
+
+    def get_page(self, version, user_id=None):
+        return ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid,
+            user_id=user_id or self.user_id,
+            messages_type='read',
+            count='5',
+            as_rows=True,
+            version=version)
@@ -0,0 +1,94 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.error_messages import SEARCH_QUERY_MESSAGE
+
+
+class SearchMessagesTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+
+    def test_search_messages(self):
+        # User which participates in the chats with all 11 messages
+        messages, next_cursor = ChatRoom.search_messages(user_id=3, query='message 1')
+        self.assertEqual(sorted(message.text for message in messages), ['Message 1', 'Message 1'])
+        self.assertIsNone(next_cursor)
+
+    def test_search_messages_scope(self):
+        # User which participates in the chat with 10 messages only
+        messages, next_cursor = ChatRoom.search_messages(user_id=4, query='Message')
+        self.assertEqual(len(messages), 10)
+        self.assertEqual({str(message.chat_room) for message in messages}, {self.chat_uuid})
+        # User which doesn't participate in any chat
+        self.assertEqual(ChatRoom.search_messages(user_id=2, query='Message'), ([], None))
+
+    def test_search_messages_cursor(self):
+        output_ids = []
+        cursor = None
+        while True:
+            messages, cursor = ChatRoom.search_messages(user_id=3, query='message', count='4', cursor=cursor)
+            output_ids += [message.id for message in messages]
+            if cursor is None:
+                break
+        # Assert that the pages cover all the matches once
+        self.assertEqual(len(output_ids), 11)
+        self.assertEqual(set(output_ids), set(Message.objects.values_list('id', flat=True)))
+
+    def test_search_messages_query_syntax(self):
+        # The FTS5 operators are treated as words
+        messages, next_cursor = ChatRoom.search_messages(user_id=3, query='"Message" OR * 10')
+        self.assertEqual(messages, [])
+        with self.assertRaises(ValidationError) as err:
+            ChatRoom.search_messages(user_id=3, query='" *')
+        self.assertEqual(err.exception.message, SEARCH_QUERY_MESSAGE)
+
+    def test_search_index_updates(self):
+        new_message = ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Unique needle')
+        ChatRoom.send_messages(chat_uuid=self.chat_uuid, user_id=3, texts=['Batch needle'])
+        self.assertEqual(self.search_texts('needle'), ['Batch needle', 'Unique needle'])
+        # Assert that the changed text replaces the indexed one
+        new_message.text = 'Changed haystack'
+        new_message.save()
+        self.assertEqual(self.search_texts('needle'), ['Batch needle'])
+        self.assertEqual(self.search_texts('haystack'), ['Changed haystack'])
+        # Assert that the deleted message is removed from the index
+        new_message.delete()
+        self.assertEqual(self.search_texts('haystack'), [])
+
+    def test_search_messages_archived(self):
+        for user_id in [3, 4]:
+            Participant.objects.mark_messages_as_read(user_id=user_id, chat_uuid=self.chat_uuid)
+        call_command('archive_messages', days=365, stdout=StringIO())
+        # Assert that the archived messages aren't searched
+        self.assertEqual(self.search_texts('message'), ['Message 1'])
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM message_search')
+        self.assertEqual(self.search_texts('message'), [])
+        call_command('rebuild_search_index', batch_size=4, stdout=StringIO())
+        self.assertEqual(len(self.search_texts('message')), 11)
+
+    def test_search_view(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get('/api/search', {'q': 'Message 10'})
+        self.assertEqual([message['text'] for message in json.loads(response.content)], ['Message 10'])
+        response = self.client.get('/api/search')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['error']['message'], SEARCH_QUERY_MESSAGE)
+
+    def search_texts(self, query):
+        messages, next_cursor = ChatRoom.search_messages(user_id=3, query=query)
+        return sorted(message.text for message in messages)
@@ -0,0 +1,62 @@
+import json
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.serializers import MessageSerializer, orjson, serialize_message_rows, render_message_rows
+
+
+class MessageRowsTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # Message with the non-ASCII text and the microseconds in the date
+        Message.objects.create(
+            chat_room_id=self.chat_uuid,
+            sender_id=3,
+            text='Привет "мир" ☃',
+            date=timezone.now() + timedelta(microseconds=123))
+
+    def test_serialize_message_rows(self):
+        messages = Message.objects.filter(chat_room=self.chat_uuid)
+        self.assertEqual(
+            serialize_message_rows(messages.as_rows()),
+            json.loads(JsonResponse(MessageSerializer(messages, many=True).data, safe=False).content))
+
+    def test_render_message_rows_byte_compatible(self):
+        messages = Message.objects.filter(chat_room=self.chat_uuid)
+        expected_content = JsonResponse(MessageSerializer(messages, many=True).data, safe=False).content
+        self.assertEqual(render_message_rows(messages.as_rows()), expected_content)
+        # Assert that the dates are formatted in the current time zone as well
+        with timezone.override('Europe/Moscow'):
+            expected_content = JsonResponse(MessageSerializer(messages, many=True).data, safe=False).content
+            self.assertEqual(render_message_rows(messages.as_rows()), expected_content)
+
+    @skipUnless(orjson, 'orjson is an optional dependency')
+    @override_settings(CHAT_CONFIGURATION=dict(settings.CHAT_CONFIGURATION, json_backend='orjson'))
+    def test_render_message_rows_orjson(self):
+        messages = Message.objects.filter(chat_room=self.chat_uuid)
+        self.assertEqual(
+            json.loads(render_message_rows(messages.as_rows())),
+            serialize_message_rows(messages.as_rows()))
+
+    def test_get_messages_page_as_rows(self):
+        messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid, user_id=5, messages_type='read', count='5')
+        rows, rows_next_cursor, rows_prev_cursor = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid, user_id=5, messages_type='read', count='5', as_rows=True)
+        # Assert that the rows give the same page and the same cursors
+        self.assertEqual([row.id for row in rows], [message.id for message in messages])
+        self.assertEqual((rows_next_cursor, rows_prev_cursor), (next_cursor, prev_cursor))
+        rows, _, _ = ChatRoom.get_messages_page(
+            chat_uuid=self.chat_uuid, user_id=5, messages_type='read', count='5',
+            cursor=next_cursor, as_rows=True)
+        self.assertEqual(len(rows), 5)
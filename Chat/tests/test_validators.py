@@ -2,11 +2,13 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-from Chat.utils.error_messages import TEXT_PARAM_MESSAGE
+from Chat.utils.error_messages import TEXT_PARAM_MESSAGE, INVALID_BATCH_MESSAGE, MAX_BATCH_MESSAGE, \
+    WAIT_MESSAGE, MAX_WAIT_MESSAGE, COMPRESSION_MESSAGE
 from Chat.utils.validators import (
     validate_count, validate_messages_type,
     POSITIVE_INTEGER_MESSAGE, MESSAGES_TYPES_MESSAGE,
-    MAX_COUNT_MESSAGE, validate_message_text, EMPTY_TEXT_MESSAGE, validate_request_data)
+    MAX_COUNT_MESSAGE, validate_message_text, EMPTY_TEXT_MESSAGE, validate_request_data,
+    validate_batch_request_data, validate_wait, validate_compression)
 
 
 class ValidatorsTestCase(TestCase):
@@ -136,5 +138,89 @@ class ValidatorsTestCase(TestCase):
             err.exception.message,
             TEXT_PARAM_MESSAGE)
 
+    def test_validate_request_data_list(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_request_data(['text'])
+        self.assertEqual(
+            err.exception.message,
+            TEXT_PARAM_MESSAGE)
+
     def test_validate_request_data_with_text(self):
         validate_request_data({'text': 'test_content'})
+
+    def test_validate_batch_request_data_none(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data(None)
+        self.assertEqual(
+            err.exception.message,
+            INVALID_BATCH_MESSAGE)
+
+    def test_validate_batch_request_data_not_list(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data({'texts': 'test_content'})
+        self.assertEqual(
+            err.exception.message,
+            INVALID_BATCH_MESSAGE)
+
+    def test_validate_batch_request_data_list(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data(['test_content'])
+        self.assertEqual(
+            err.exception.message,
+            INVALID_BATCH_MESSAGE)
+
+    def test_validate_batch_request_data_not_string(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data({'texts': ['test_content', 1]})
+        self.assertEqual(
+            err.exception.message,
+            INVALID_BATCH_MESSAGE)
+
+    def test_validate_batch_request_data_empty_list(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data({'texts': []})
+        self.assertEqual(
+            err.exception.message,
+            INVALID_BATCH_MESSAGE)
+
+    def test_validate_batch_request_data_greater_than_max(self):
+        max_batch_size = settings.CHAT_CONFIGURATION['max_batch_size']
+        with self.assertRaises(ValidationError) as err:
+            validate_batch_request_data({'texts': ['test_content'] * (int(max_batch_size) + 1)})
+        self.assertEqual(
+            err.exception.message,
+            MAX_BATCH_MESSAGE.format(max_batch_size))
+
+    def test_validate_batch_request_data_with_texts(self):
+        validate_batch_request_data({'texts': ['test_content', '']})
+
+    def test_validate_wait_none(self):
+        validate_wait(None)
+
+    def test_validate_wait_zero(self):
+        validate_wait('0')
+
+    def test_validate_wait_negative(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_wait('-1')
+        self.assertEqual(
+            err.exception.message,
+            WAIT_MESSAGE)
+
+    def test_validate_wait_greater_than_max(self):
+        max_wait = settings.CHAT_CONFIGURATION['max_wait_seconds']
+        with self.assertRaises(ValidationError) as err:
+            validate_wait(str(int(max_wait) + 1))
+        self.assertEqual(
+            err.exception.message,
+            MAX_WAIT_MESSAGE.format(max_wait))
+
+    def test_validate_compression_none(self):
+        validate_compression(None)
+
+    def test_validate_compression_unknown(self):
+        with self.assertRaises(ValidationError) as err:
+            validate_compression('zip')
+        self.assertEqual(
+            err.exception.message,
+            COMPRESSION_MESSAGE)
@@ -0,0 +1,473 @@
+import asyncio
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Chat import views
+from Chat.views import NEXT_CURSOR_HEADER
+from Chat.models.chat_room import ChatRoom
+from Chat.models.message import Message
+from Chat.models.participant import Participant
+from Chat.utils.helpers import database_sync_to_async
+from Chat.utils.idempotency import get_idempotency_cache
+from Chat.utils.receipts import get_read_receipts
+from Chat.utils.membership import get_membership_cache, get_chat_participants
+from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE, EMPTY_TEXT_MESSAGE, IDEMPOTENCY_KEY_MESSAGE, \
+    MAX_WAIT_MESSAGE, WAIT_ASYNC_MESSAGE
+
+
+class SendMessageViewTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # Chat with 10 messages and 3 participants
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # Keep the participants of the chat in the membership cache
+        get_membership_cache().clear()
+        get_chat_participants(self.chat_uuid)
+
+    def test_send_message_query_count(self):
+        user = User.objects.get(id=3)
+        request = self.send_request(user, 'Test query count')
+        # SAVEPOINT, UPDATE chat sequence and activity, SELECT chat sequence, INSERT message, INSERT search index,
+        # UPDATE participant watermark, UPDATE unread counters, RELEASE SAVEPOINT
+        with self.assertNumQueries(8):
+            response = views.send_message(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Assert that the sent message is read by its sender
+        self.assertFalse(
+            Message.objects.unread_messages(self.chat_uuid, user.id).exists())
+
+    def test_send_message_no_access(self):
+        # User which doesn't participate in the chat
+        user = User.objects.get(id=2)
+        messages_count = Message.objects.count()
+        response = views.send_message(
+            self.send_request(user, 'Test no access'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content)['error']['message'], CHAT_ACCESS_MESSAGE)
+        # Assert that the message is rolled back
+        self.assertEqual(Message.objects.count(), messages_count)
+
+    def test_send_message_empty_text(self):
+        user = User.objects.get(id=3)
+        response = views.send_message(self.send_request(user, ''), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_send_message_no_access_empty_text(self):
+        # User which doesn't participate in the chat
+        user = User.objects.get(id=2)
+        response = views.send_message(self.send_request(user, ''), chat_uuid=self.chat_uuid)
+        # Assert that the access is checked before the text
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content)['error']['message'], CHAT_ACCESS_MESSAGE)
+
+    def test_send_messages_query_count(self):
+        user = User.objects.get(id=3)
+        request = self.factory.post(
+            f'/chat/{self.chat_uuid}/send-batch',
+            {'texts': ['Test batch 1', '', 'Test batch 2']},
+            format='json')
+        force_authenticate(request, user=user)
+        # SAVEPOINT, UPDATE chat sequence and activity, SELECT chat sequence, bulk INSERT messages,
+        # INSERT search index, UPDATE participant watermark, UPDATE unread counters, RELEASE SAVEPOINT
+        with self.assertNumQueries(8):
+            response = views.send_messages(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Assert that the errors are reported per item
+        self.assertEqual(json.loads(response.content), {
+            'success': False,
+            'results': [
+                {'success': True},
+                {'success': False, 'error': {'status': 400, 'message': EMPTY_TEXT_MESSAGE}},
+                {'success': True}
+            ]
+        })
+
+    def test_send_messages_no_access_empty_text(self):
+        # User which doesn't participate in the chat
+        request = self.factory.post(f'/chat/{self.chat_uuid}/send-batch', {'texts': ['']}, format='json')
+        force_authenticate(request, user=User.objects.get(id=2))
+        response = views.send_messages(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_send_messages_list_body(self):
+        request = self.factory.post(f'/chat/{self.chat_uuid}/send-batch', ['Test list'], format='json')
+        force_authenticate(request, user=User.objects.get(id=3))
+        response = views.send_messages(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_send_message_retry_same_idempotency_key(self):
+        user = User.objects.get(id=3)
+        request = self.send_request(user, 'Test retry', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(views.send_message(request, chat_uuid=self.chat_uuid).status_code, status.HTTP_200_OK)
+        participant = Participant.objects.get(chat_room=self.chat_uuid, person=4)
+        # The retry after the cache timeout is rejected by the unique constraint of the key
+        get_idempotency_cache().clear()
+        request = self.send_request(user, 'Test retry', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(views.send_message(request, chat_uuid=self.chat_uuid).status_code, status.HTTP_200_OK)
+        # Assert that the message is sent and fanned out once
+        self.assertEqual(Message.objects.filter(text='Test retry').count(), 1)
+        self.assertEqual(
+            Participant.objects.get(chat_room=self.chat_uuid, person=4).unread_count, participant.unread_count)
+
+    def test_send_message_invalid_idempotency_key(self):
+        user = User.objects.get(id=3)
+        request = self.send_request(user, 'Test invalid key', HTTP_IDEMPOTENCY_KEY='key with spaces')
+        response = views.send_message(request, chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)['error']['message'], IDEMPOTENCY_KEY_MESSAGE)
+
+    def send_request(self, user, text, **extra):
+        request = self.factory.post(
+            f'/chat/{self.chat_uuid}/send', {'text': text}, format='json', **extra)
+        force_authenticate(request, user=user)
+        return request
+
+
+class IdempotentSendTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        get_idempotency_cache().clear()
+
+    def test_send_message_retry_from_cache(self):
+        message = ChatRoom.send_message(
+            chat_uuid=self.chat_uuid, user_id=3, text='Test cached retry', idempotency_key='retry-2')
+        # Assert that the retry is answered from the idempotency cache without queries
+        with self.assertNumQueries(0):
+            retried = ChatRoom.send_message(
+                chat_uuid=self.chat_uuid, user_id=3, text='Test cached retry', idempotency_key='retry-2')
+        self.assertEqual((retried.id, retried.seq), (message.id, message.seq))
+        # Assert that the keys are scoped by the sender
+        other = ChatRoom.send_message(
+            chat_uuid=self.chat_uuid, user_id=4, text='Test cached retry', idempotency_key='retry-2')
+        self.assertNotEqual(other.id, message.id)
+        self.assertEqual(Message.objects.filter(text='Test cached retry').count(), 2)
+
+
+class FetchRoomsViewTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def test_fetch_rooms(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get('/api/chats', {'count': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), [{
+            'id': 'd65d0970-1933-11eb-adc1-0242ac120002',
+            'name': 'Test Chat 1',
+            'last_message_at': '2020-10-30T16:00:00Z',
+            'unread_count': 10,
+            'last_message': {
+                'id': '51200695-f233-4cb4-bd92-130b8553e416',
+                'chat_room': 'd65d0970-1933-11eb-adc1-0242ac120002',
+                'sender': 5,
+                'text': 'Message 10',
+                'date': '2020-10-30T16:00:00Z'
+            }
+        }])
+        # Assert that the next page is given by the cursor
+        response = self.client.get('/api/chats', {'cursor': response['X-Next-Cursor']})
+        self.assertEqual([room['name'] for room in json.loads(response.content)], ['Test Chat 3', 'Test Chat 2'])
+
+    def test_fetch_rooms_invalid_count(self):
+        self.client.force_login(User.objects.get(id=3))
+        response = self.client.get('/api/chats', {'count': '0'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FetchUnreadCountsViewTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+
+    def test_fetch_unread_counts(self):
+        # User which didn't read any message
+        request = self.factory.get('/chats/unread-counts')
+        force_authenticate(request, user=User.objects.get(id=3))
+        # The counters of all chats of the user are read with a single query
+        with self.assertNumQueries(1):
+            response = views.fetch_unread_counts(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {
+            self.chat_uuid: 10,
+            '36323c8f-47d1-4023-85d3-ad047d0275f8': 0,
+            'dc56ad05-90db-4dcd-9739-db2bee4b315f': 1
+        })
+        # Assert that nothing is marked as read
+        self.assertEqual(Message.objects.unread_messages(self.chat_uuid, 3).count(), 10)
+
+
+class FetchChangesViewTestCase(TestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        self.client.force_login(User.objects.get(id=3))
+
+    def test_fetch_changes(self):
+        ChatRoom.delete_messages(self.chat_uuid, [Message.objects.get(text='Message 10').id])
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/changes', {'since': '8'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {
+            'messages': [{
+                'id': 'd3b2066c-c573-4639-8799-c6e308aa5ce7',
+                'chat_room': self.chat_uuid,
+                'sender': 5,
+                'text': 'Message 9',
+                'date': '2020-10-30T15:00:00Z',
+                'seq': 9
+            }],
+            'deleted': [{'id': '51200695-f233-4cb4-bd92-130b8553e416', 'seq': 11}],
+            'seq': 11,
+            'has_more': False,
+            'resync': False
+        })
+
+    def test_fetch_changes_invalid_since(self):
+        response = self.client.get(f'/api/chat/{self.chat_uuid}/changes', {'since': '-1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fetch_changes_no_access(self):
+        self.client.force_login(User.objects.get(id=4))
+        response = self.client.get('/api/chat/36323c8f-47d1-4023-85d3-ad047d0275f8/changes')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FetchMessagesViewTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which read all 10 messages
+        self.user = User.objects.get(id=5)
+        get_membership_cache().clear()
+        # Don't leave the deferred receipts for the following tests
+        self.addCleanup(get_read_receipts().flush)
+
+    def test_fetch_messages_etag(self):
+        response = views.fetch_messages(self.fetch_request(), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)), 10)
+        # The chat version only, the access is checked by the cached participants
+        with self.assertNumQueries(1):
+            response = views.fetch_messages(
+                self.fetch_request(HTTP_IF_NONE_MATCH=response['ETag']), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_fetch_messages_etag_new_message(self):
+        etag = views.fetch_messages(self.fetch_request(), chat_uuid=self.chat_uuid)['ETag']
+        ChatRoom.send_message(chat_uuid=self.chat_uuid, user_id=3, text='Test ETag')
+        response = views.fetch_messages(
+            self.fetch_request(HTTP_IF_NONE_MATCH=etag), chat_uuid=self.chat_uuid)
+        # Assert that the new message changes the version
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_fetch_messages_etag_other_params(self):
+        etag = views.fetch_messages(self.fetch_request(), chat_uuid=self.chat_uuid)['ETag']
+        response = views.fetch_messages(
+            self.fetch_request(count='5', HTTP_IF_NONE_MATCH=etag), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_fetch_messages_wait_sync(self):
+        etag = views.fetch_messages(self.fetch_request(), chat_uuid=self.chat_uuid)['ETag']
+        response = views.fetch_messages(
+            self.fetch_request(wait='1', HTTP_IF_NONE_MATCH=etag), chat_uuid=self.chat_uuid)
+        # Assert that the long polling is left to the async view
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)['error']['message'], WAIT_ASYNC_MESSAGE)
+
+    def test_fetch_messages_etag_after_read(self):
+        # User which read 5 of 10 messages
+        self.user = User.objects.get(id=4)
+        response = views.fetch_messages(self.fetch_request(messages_type='unread'), chat_uuid=self.chat_uuid)
+        self.assertEqual(len(json.loads(response.content)), 5)
+        get_read_receipts().flush()
+        # Assert that the ETag of the response matches after its messages are marked as read
+        response = views.fetch_messages(
+            self.fetch_request(messages_type='unread', HTTP_IF_NONE_MATCH=response['ETag']),
+            chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_fetch_messages_etag_after_partial_read(self):
+        # User which read 5 of 10 messages
+        self.user = User.objects.get(id=4)
+        response = views.fetch_messages(
+            self.fetch_request(messages_type='unread', count='2'), chat_uuid=self.chat_uuid)
+        get_read_receipts().flush()
+        # Assert that the rest of the unread messages is fetched
+        response = views.fetch_messages(
+            self.fetch_request(messages_type='unread', count='2', HTTP_IF_NONE_MATCH=response['ETag']),
+            chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in json.loads(response.content)], ['Message 8', 'Message 9'])
+
+    def fetch_request(self, messages_type='read', HTTP_IF_NONE_MATCH=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': HTTP_IF_NONE_MATCH} if HTTP_IF_NONE_MATCH else {}
+        request = self.factory.get(
+            f'/chat/{self.chat_uuid}/messages',
+            dict(messages_type=messages_type, **params),
+            **headers)
+        force_authenticate(request, user=self.user)
+        return request
+
+
+class AsyncViewsTestCase(TransactionTestCase):
+    fixtures = ['fixtures.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Chat with 10 messages
+        self.chat_uuid = 'd65d0970-1933-11eb-adc1-0242ac120002'
+        # User which read 5 of 10 messages
+        self.user = User.objects.get(id=4)
+        get_membership_cache().clear()
+        self.addCleanup(get_read_receipts().flush)
+
+    async def test_fetch_messages_async(self):
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='unread', count='2'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in json.loads(response.content)], ['Message 6', 'Message 7'])
+        self.assertIn(NEXT_CURSOR_HEADER, response)
+        # Move the watermark now rather than between the following requests
+        await database_sync_to_async(get_read_receipts().flush)()
+        # Assert that the response matches the sync view
+        request = APIRequestFactory().get(
+            f'/chat/{self.chat_uuid}/messages', {'messages_type': 'read', 'count': '5'})
+        force_authenticate(request, user=self.user)
+        sync_response = await sync_to_async(views.fetch_messages)(request, chat_uuid=self.chat_uuid)
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read', count='5'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.content, sync_response.content)
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+        # Assert that the conditional request is answered without the messages
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read', count='5', HTTP_IF_NONE_MATCH=response['ETag']),
+            chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_fetch_messages_async_no_access(self):
+        # User which doesn't participate in the chat
+        self.user = await sync_to_async(User.objects.get)(id=2)
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content)['error']['message'], CHAT_ACCESS_MESSAGE)
+
+    async def test_fetch_messages_async_not_authenticated(self):
+        self.user = AnonymousUser()
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_fetch_messages_async_invalid_type(self):
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='unknown'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_fetch_messages_async_long_poll_timeout(self):
+        response = await views.fetch_messages_async(self.fetch_request(messages_type='read'), chat_uuid=self.chat_uuid)
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read', wait='1', HTTP_IF_NONE_MATCH=response['ETag']),
+            chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_fetch_messages_async_long_poll_new_message(self):
+        async def send_message():
+            await asyncio.sleep(0.2)
+            await sync_to_async(ChatRoom.send_message)(chat_uuid=self.chat_uuid, user_id=3, text='Test long poll')
+
+        sender = asyncio.ensure_future(send_message())
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='unread', wait='10'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        await database_sync_to_async(get_read_receipts().flush)()
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='unread', wait='10', HTTP_IF_NONE_MATCH=response['ETag']),
+            chat_uuid=self.chat_uuid)
+        await sender
+        # Assert that the request is woken up by the new message
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in json.loads(response.content)], ['Test long poll'])
+
+    async def test_fetch_messages_async_wait_greater_than_max(self):
+        response = await views.fetch_messages_async(
+            self.fetch_request(messages_type='read', wait='100000'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            json.loads(response.content)['error']['message'],
+            MAX_WAIT_MESSAGE.format(settings.CHAT_CONFIGURATION['max_wait_seconds']))
+
+    async def test_send_message_async(self):
+        response = await views.send_message_async(
+            self.send_request({'text': 'Test async'}), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await sync_to_async(Message.objects.filter(text='Test async').exists)())
+        response = await views.send_message_async(self.send_request('invalid'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_send_message_async_no_access(self):
+        # User which doesn't participate in the chat
+        self.user = await sync_to_async(User.objects.get)(id=2)
+        response = await views.send_message_async(self.send_request({'text': ''}), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_fetch_messages_async_basic_authentication(self):
+        await sync_to_async(self.set_password)('password')
+        response = await views.fetch_messages_async(
+            self.basic_request(f'{self.user.username}:password'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Assert that the wrong credentials are rejected
+        response = await views.fetch_messages_async(
+            self.basic_request(f'{self.user.username}:wrong'), chat_uuid=self.chat_uuid)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_fetch_messages_async_middleware(self):
+        response = await AsyncClient().get(f'/api/async/chat/{self.chat_uuid}/messages?messages_type=read')
+        # Assert that the middleware runs in the async mode and still instruments the request
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn('Server-Timing', response)
+
+    def fetch_request(self, HTTP_IF_NONE_MATCH=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': HTTP_IF_NONE_MATCH} if HTTP_IF_NONE_MATCH else {}
+        request = self.factory.get(f'/api/async/chat/{self.chat_uuid}/messages', params, **headers)
+        request.user = self.user
+        return request
+
+    def send_request(self, data):
+        request = self.factory.post(
+            f'/api/async/chat/{self.chat_uuid}/send', data, content_type='application/json')
+        request.user = self.user
+        # The CSRF token is checked by CsrfViewMiddleware which the factory requests skip
+        request._dont_enforce_csrf_checks = True
+        return request
+
+    def basic_request(self, credentials):
+        request = self.factory.get(
+            f'/api/async/chat/{self.chat_uuid}/messages', {'messages_type': 'read'},
+            HTTP_AUTHORIZATION=f'Basic {base64.b64encode(credentials.encode()).decode()}')
+        # The session of the request has no user, the user is authenticated by the DRF authentication classes
+        request.user = AnonymousUser()
+        return request
+
+    def set_password(self, password):
+        self.user.set_password(password)
+        self.user.save()
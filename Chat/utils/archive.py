@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def get_archive_after_days():
+    """Returns the age in days configured by CHAT_CONFIGURATION['archive_after_days'] or None if it's disabled"""
+    days = settings.CHAT_CONFIGURATION.get('archive_after_days')
+    return int(days) if days is not None else None
+
+
+def get_archive_cutoff(days: int = None):
+    """Returns the date before which messages are moved to the archive or None if it's disabled"""
+    if days is None:
+        days = get_archive_after_days()
+    if days is None:
+        return None
+    return timezone.now() - timedelta(days=days)
@@ -1,6 +1,18 @@
 CHAT_ACCESS_MESSAGE = "You don't have access to this chat or it doesn't exist"
+COMPRESSION_MESSAGE = "The parameter 'compression' must be one of the following: ['gzip']"
 EMPTY_TEXT_MESSAGE = "Text can't be empty"
+IDEMPOTENCY_KEY_MESSAGE = "The header 'Idempotency-Key' must contain from 1 to 64 letters, digits, '-' or '_'"
+INVALID_BATCH_MESSAGE = "Data should have the 'texts' parameter which contains a non-empty list of strings"
+INVALID_CURSOR_MESSAGE = "The parameter 'cursor' is not a valid pagination cursor"
+INVALID_IMPORT_LINE_MESSAGE = "The line must be a JSON object with the valid 'chat_room', 'sender', 'text' and 'date'"
+MAX_BATCH_MESSAGE = "The parameter 'texts' can't contain more than {} items"
 MAX_COUNT_MESSAGE = "The parameter 'count' can't be greater than {}"
+MAX_WAIT_MESSAGE = "The parameter 'wait' can't be greater than {}"
 MESSAGES_TYPES_MESSAGE = "The parameter 'messages_type' must be one of the following: ['read', 'unread']"
+NOT_AUTHENTICATED_MESSAGE = "Authentication credentials were not provided."
 POSITIVE_INTEGER_MESSAGE = "The parameter 'count' must be string which contains a non-zero positive integer."
+SEARCH_QUERY_MESSAGE = "The parameter 'q' must contain at least one word"
+SINCE_MESSAGE = "The parameter 'since' must be string which contains a non-negative integer."
 TEXT_PARAM_MESSAGE = "Data should have the 'text' parameter"
+WAIT_ASYNC_MESSAGE = "The parameter 'wait' is only supported by the async API: /api/async/chat/<chat_uuid>/messages"
+WAIT_MESSAGE = "The parameter 'wait' must be string which contains a non-negative integer."
@@ -0,0 +1,34 @@
+import tempfile
+import zlib
+
+from django.conf import settings
+
+DEFAULT_EXPORT_CHUNK_SIZE = '2000'
+# Gzip container of the deflate stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Number of bytes of the spooled export kept in memory before it's moved to a temporary file
+EXPORT_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def get_export_chunk_size() -> int:
+    """Returns the number of rows fetched at once configured by CHAT_CONFIGURATION['export_chunk_size']"""
+    return int(settings.CHAT_CONFIGURATION.get('export_chunk_size', DEFAULT_EXPORT_CHUNK_SIZE))
+
+
+def compress_gzip(chunks, level: int = 6):
+    """Compresses the stream of byte strings into the stream of gzip data chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def spool_chunks(chunks):
+    """Writes the stream of byte strings into a temporary file and returns it rewound to the beginning"""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    for chunk in chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
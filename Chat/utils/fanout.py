@@ -0,0 +1,139 @@
+import abc
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+
+from Chat.signals import messages_fanned_out
+from Chat.utils.membership import get_chat_participants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAN_OUT_STRATEGY = 'eager'
+
+
+class FanOutStrategy(abc.ABC):
+    """Delivers new messages to the participants of their chats"""
+
+    def fan_out(self, message):
+        self.fan_out_batch([message])
+
+    @abc.abstractmethod
+    def fan_out_batch(self, messages):
+        """Delivers the messages which are saved in the current transaction"""
+
+    @staticmethod
+    def deliver(messages):
+        """Sends the `messages_fanned_out` signal for every group of messages with the same chat and sender"""
+        groups = {}
+        for message in messages:
+            groups.setdefault((message.chat_room_id, message.sender_id), []).append(message)
+        for (chat_uuid, sender_id), group in groups.items():
+            recipients = [
+                person_id
+                for person_id in get_chat_participants(chat_uuid)
+                if person_id != sender_id]
+            messages_fanned_out.send(
+                sender=group[0].__class__,
+                messages=group,
+                recipients=recipients)
+
+    @property
+    def maintains_unread_counts(self) -> bool:
+        """Whether the unread counters of the participants are exact, so the read paths may read them"""
+        return False
+
+
+class EagerFanOut(FanOutStrategy):
+    """
+    Delivers messages synchronously while they are being saved
+
+    The unread counters are updated in the send transaction, so they are exact
+    and the unread counts are read from the participant rows.
+    """
+
+    def fan_out_batch(self, messages):
+        self.deliver(messages)
+
+    @property
+    def maintains_unread_counts(self) -> bool:
+        return True
+
+
+class LazyFanOut(FanOutStrategy):
+    """
+    Does nothing on write
+
+    The read state and the unread counts of the recipients are computed
+    on read by comparing messages against the read watermarks of the participants.
+    """
+
+    def fan_out_batch(self, messages):
+        pass
+
+
+class DeferredFanOut(FanOutStrategy):
+    """
+    Delivers messages from the background worker thread after the transaction commits
+
+    The unread counters lag behind the messages until the delivery, so the unread
+    counts are computed on read as with the lazy strategy.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def fan_out_batch(self, messages):
+        messages = list(messages)
+        transaction.on_commit(lambda: self.enqueue(messages))
+
+    def enqueue(self, messages):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._work,
+                    name='chat-fan-out',
+                    daemon=True)
+                self._worker.start()
+        self.queue.put(messages)
+
+    def join(self):
+        """Blocks until all the queued messages are delivered"""
+        self.queue.join()
+
+    def _work(self):
+        while True:
+            messages = self.queue.get()
+            try:
+                self.deliver(messages)
+            except Exception:
+                logger.exception('Failed to fan out %s messages', len(messages))
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+FAN_OUT_STRATEGIES = {
+    'eager': EagerFanOut,
+    'lazy': LazyFanOut,
+    'deferred': DeferredFanOut,
+}
+
+_strategies = {}
+
+
+def get_fan_out_strategy(name: str = None) -> FanOutStrategy:
+    """Returns the strategy instance configured by CHAT_CONFIGURATION['fan_out_strategy']"""
+    if name is None:
+        name = settings.CHAT_CONFIGURATION.get('fan_out_strategy', DEFAULT_FAN_OUT_STRATEGY)
+    if name not in FAN_OUT_STRATEGIES:
+        raise ImproperlyConfigured(
+            f"CHAT_CONFIGURATION['fan_out_strategy'] must be one of the following: {list(FAN_OUT_STRATEGIES)}")
+    if name not in _strategies:
+        _strategies[name] = FAN_OUT_STRATEGIES[name]()
+    return _strategies[name]
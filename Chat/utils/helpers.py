@@ -1,19 +1,30 @@
+import base64
+import binascii
+import hashlib
+import json
+import uuid
+from functools import wraps
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
 from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
 from django.utils.translation import ugettext as _
 from rest_framework import status
 
 
-from Chat.models.participant import Participant
-from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE
+from Chat.utils.membership import is_participant
+from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE, INVALID_CURSOR_MESSAGE
 from Chat.utils.validators import validate_messages_type, validate_count
 
 
 def check_access_to_chat(func):
+    @wraps(func)
     def decorator(request, chat_uuid):
-        access = Participant.objects.filter(
-            chat_room=chat_uuid, person=request.user.id).exists()
-        if access:
+        if is_participant(chat_uuid, request.user.id):
             return func(request, chat_uuid)
         else:
             return return_error(
@@ -37,3 +48,73 @@ def preprocess_count(count):
     if count is None:
         count = settings.CHAT_CONFIGURATION['max_messages_count']
     return int(count)
+
+
+def encode_cursor(message, previous=False):
+    """Packs the (date, id) position of the message into an opaque string"""
+    return encode_position(message.date, message.id, previous)
+
+
+def encode_position(date, position_uuid, previous=False):
+    """Packs the (date, id) keyset position into an opaque string"""
+    position = {'d': date.isoformat(), 'i': str(position_uuid)}
+    if previous:
+        position['p'] = 1
+    data = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpacks the cursor into a (date, id, previous) tuple"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(data)
+        date = parse_datetime(position['d'])
+        message_uuid = uuid.UUID(position['i'])
+        previous = bool(position.get('p'))
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        raise ValidationError(_(INVALID_CURSOR_MESSAGE))
+    if date is None:
+        raise ValidationError(_(INVALID_CURSOR_MESSAGE))
+    return date, message_uuid, previous
+
+
+def encode_rank_cursor(rank: float, position_uuid):
+    """Packs the (rank, id) position of the search result into an opaque string"""
+    data = json.dumps({'r': rank, 'i': str(position_uuid)}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_rank_cursor(cursor):
+    """Unpacks the search cursor into a (rank, id) tuple"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(data)
+        rank = float(position['r'])
+        position_uuid = uuid.UUID(position['i'])
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        raise ValidationError(_(INVALID_CURSOR_MESSAGE))
+    return rank, position_uuid
+
+
+def build_etag(version, params):
+    """Returns the quoted ETag of the messages response for the chat version and the query parameters"""
+    key = json.dumps([list(map(str, version)), sorted(params.items())])
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def database_sync_to_async(func):
+    """
+    Wraps the sync database function for the async views
+
+    Every call runs in a thread of its own, so the independent queries of the
+    request run concurrently. The connections of the thread are closed after
+    the call the same way as at the end of a request.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
@@ -0,0 +1,27 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_IDEMPOTENCY_CACHE = 'default'
+
+
+def get_idempotency_cache():
+    """Returns the cache configured by CHAT_CONFIGURATION['idempotency_cache']"""
+    return caches[settings.CHAT_CONFIGURATION.get('idempotency_cache', DEFAULT_IDEMPOTENCY_CACHE)]
+
+
+def get_idempotency_cache_key(chat_uuid, user_id: int, idempotency_key: str) -> str:
+    return f'chat:sent:{uuid.UUID(str(chat_uuid)).hex}:{user_id}:{idempotency_key}'
+
+
+def get_sent_message(chat_uuid, user_id: int, idempotency_key: str):
+    """Returns the message which the user has sent to the chat with the key or None if it isn't cached"""
+    return get_idempotency_cache().get(get_idempotency_cache_key(chat_uuid, user_id, idempotency_key))
+
+
+def remember_sent_message(message):
+    """Caches the message which is sent with the idempotency key for the retries of the send"""
+    get_idempotency_cache().set(
+        get_idempotency_cache_key(message.chat_room_id, message.sender_id, message.idempotency_key),
+        message)
@@ -0,0 +1,63 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Chat.db.routers import use_primary
+from Chat.models.participant import Participant
+
+DEFAULT_MEMBERSHIP_CACHE = 'default'
+
+
+def get_membership_cache():
+    """Returns the cache configured by CHAT_CONFIGURATION['membership_cache']"""
+    return caches[settings.CHAT_CONFIGURATION.get('membership_cache', DEFAULT_MEMBERSHIP_CACHE)]
+
+
+def get_membership_key(chat_uuid) -> str:
+    return f'chat:participants:{uuid.UUID(str(chat_uuid)).hex}'
+
+
+def get_chat_participants(chat_uuid) -> frozenset:
+    """Returns the ids of the Users which participate in the chat"""
+    cache = get_membership_cache()
+    key = get_membership_key(chat_uuid)
+    participants = cache.get(key)
+    if participants is None:
+        # The entry outlives the replication lag, so it's filled from the primary
+        with use_primary():
+            participants = frozenset(
+                Participant.objects
+                .filter(chat_room=chat_uuid)
+                .values_list('person_id', flat=True))
+        cache.set(key, participants)
+    return participants
+
+
+def is_participant(chat_uuid, user_id: int) -> bool:
+    return user_id is not None and user_id in get_chat_participants(chat_uuid)
+
+
+def invalidate_chat_participants(chat_uuid):
+    """
+    Drops the cached participants of the chat
+
+    The signals below cover the saved and deleted models, the cascades included.
+    `bulk_create` and `QuerySet.update` don't send them, so the code which changes
+    the membership with them calls this function itself. The participants are
+    dropped again after the commit: until then the concurrent requests read the
+    old rows and may cache them again.
+    """
+    key = get_membership_key(chat_uuid)
+    get_membership_cache().delete(key)
+    transaction.on_commit(lambda: get_membership_cache().delete(key))
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_participant_chat(sender, instance, **kwargs):
+    """Drops the cached participants of the chat whenever its membership changes"""
+    invalidate_chat_participants(instance.chat_room_id)
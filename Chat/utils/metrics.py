@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """
+    Costs of the request which is being handled in the current context
+
+    The async views run the independent queries of the request concurrently,
+    each call in a thread of its own, so the database time is the sum of the
+    query times and may exceed the total time of the request.
+    """
+    __slots__ = ('start', 'queries', 'db_seconds', 'phases', '_lock')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.phases = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+    def add_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] += seconds
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+
+class MetricsRegistry:
+    """Aggregates the request and phase costs of the current process in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = defaultdict(int)
+            self._durations = defaultdict(lambda: [0.0, [0] * len(DURATION_BUCKETS)])
+            self._queries = defaultdict(int)
+            self._db_seconds = defaultdict(float)
+            self._phases = defaultdict(lambda: [0.0, 0])
+
+    def observe_request(self, view: str, method: str, status_code: int, timings: RequestTimings, total: float):
+        with self._lock:
+            self._requests[(view, method, str(status_code))] += 1
+            duration = self._durations[view]
+            duration[0] += total
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    duration[1][index] += 1
+            self._queries[view] += timings.queries
+            self._db_seconds[view] += timings.db_seconds
+
+    def observe_phase(self, phase: str, seconds: float):
+        with self._lock:
+            observed = self._phases[phase]
+            observed[0] += seconds
+            observed[1] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                '# HELP chat_requests_total Handled chat requests.',
+                '# TYPE chat_requests_total counter',
+            ]
+            for (view, method, status_code), count in sorted(self._requests.items()):
+                lines.append(f'chat_requests_total{{view="{view}",method="{method}",status="{status_code}"}} {count}')
+            lines += [
+                '# HELP chat_request_duration_seconds Total time of the chat requests.',
+                '# TYPE chat_request_duration_seconds histogram',
+            ]
+            for view, (seconds, buckets) in sorted(self._durations.items()):
+                count = sum(
+                    value for key, value in self._requests.items() if key[0] == view)
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'chat_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {bucket_count}')
+                lines.append(f'chat_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}')
+                lines.append(f'chat_request_duration_seconds_sum{{view="{view}"}} {seconds}')
+                lines.append(f'chat_request_duration_seconds_count{{view="{view}"}} {count}')
+            lines += [
+                '# HELP chat_request_queries_total SQL statements issued by the chat requests.',
+                '# TYPE chat_request_queries_total counter',
+            ]
+            for view, count in sorted(self._queries.items()):
+                lines.append(f'chat_request_queries_total{{view="{view}"}} {count}')
+            lines += [
+                '# HELP chat_request_db_seconds_total Time spent in the database by the chat requests.',
+                '# TYPE chat_request_db_seconds_total counter',
+            ]
+            for view, seconds in sorted(self._db_seconds.items()):
+                lines.append(f'chat_request_db_seconds_total{{view="{view}"}} {seconds}')
+            lines += [
+                '# HELP chat_phase_duration_seconds Time spent in the instrumented phases.',
+                '# TYPE chat_phase_duration_seconds summary',
+            ]
+            for phase, (seconds, count) in sorted(self._phases.items()):
+                lines.append(f'chat_phase_duration_seconds_sum{{phase="{phase}"}} {seconds}')
+                lines.append(f'chat_phase_duration_seconds_count{{phase="{phase}"}} {count}')
+        # The models import the instrumentation, so the cache module is imported lazily
+        from Chat.utils.recent import recent_messages_stats
+        stats = recent_messages_stats.as_dict()
+        lines += [
+            '# HELP chat_recent_messages_cache_total Lookups of the recent messages cache.',
+            '# TYPE chat_recent_messages_cache_total counter',
+            f'chat_recent_messages_cache_total{{result="hit"}} {stats["hits"]}',
+            f'chat_recent_messages_cache_total{{result="miss"}} {stats["misses"]}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+_current_timings = ContextVar('chat_request_timings', default=None)
+
+
+def get_request_timings():
+    """Returns the timings of the request which is being handled in the current context or None"""
+    return _current_timings.get()
+
+
+@contextmanager
+def measure_request():
+    """Collects the timings of the request handled inside the block"""
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper which adds the statement and its time to the timings of the current request"""
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - start)
+
+
+@receiver(connection_created, dispatch_uid='chat_record_query')
+def instrument_connection(sender, connection, **kwargs):
+    """Times the queries of every connection, the sync_to_async threads share the context of the request"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def instrument(phase: str):
+    """
+    Attributes the time of the block to the phase, it's also usable as a decorator
+
+    The time is added to the timings of the current request, if there is one,
+    and to the process-wide metrics.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add_phase(phase, seconds)
+        metrics_registry.observe_phase(phase, seconds)
@@ -0,0 +1,132 @@
+import abc
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from Chat.serializers import MessageSerializer
+
+DEFAULT_PUBSUB_BACKEND = 'Chat.utils.pubsub.InMemoryPubSub'
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Receives payloads published to the channel on the event loop of the subscriber"""
+
+    def __init__(self, channel: str, loop: asyncio.AbstractEventLoop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        # Set when the subscriber falls behind and payloads are dropped
+        self.overflowed = False
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+    def put(self, payload: str):
+        """Puts the payload from any thread"""
+        self.loop.call_soon_threadsafe(self._put, payload)
+
+    def _put(self, payload: str):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class PubSubBackend(abc.ABC):
+    """
+    Delivers payloads to the subscribers of the channel
+
+    Subscriptions are kept locally by every node. A backend for multiple nodes
+    implements `publish` by sending the payload to its broker and calls `deliver`
+    for every payload which its broker receives from any node.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def publish(self, channel: str, payload: str):
+        """Sends the payload to the subscribers of the channel on every node"""
+
+    def subscribe(self, channel: str) -> Subscription:
+        """Subscribes the running event loop to the channel"""
+        subscription = Subscription(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def deliver(self, channel: str, payload: str):
+        """Puts the payload to the local subscriptions of the channel"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(payload)
+
+
+class InMemoryPubSub(PubSubBackend):
+    """Delivers payloads to the subscribers of the current process only"""
+
+    def publish(self, channel: str, payload: str):
+        self.deliver(channel, payload)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_pubsub_backend() -> PubSubBackend:
+    """Returns the backend configured by CHAT_CONFIGURATION['pubsub_backend']"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = settings.CHAT_CONFIGURATION.get('pubsub_backend', DEFAULT_PUBSUB_BACKEND)
+            _backend = import_string(path)()
+        return _backend
+
+
+def get_chat_channel(chat_uuid) -> str:
+    return f'chat.{chat_uuid}'
+
+
+def publish_messages(messages):
+    """Publishes the serialized messages to the channels of their chats"""
+    backend = get_pubsub_backend()
+    for message, data in zip(messages, MessageSerializer(messages, many=True).data):
+        backend.publish(
+            get_chat_channel(message.chat_room_id),
+            json.dumps(data, cls=DjangoJSONEncoder))
+
+
+async def wait_for_publish(channel: str, timeout: float, is_unchanged=None) -> bool:
+    """
+    Waits until something is published to the channel
+
+    The optional `is_unchanged` callable is checked after subscribing,
+    so the payload published right before the wait is not missed.
+    Returns False if the timeout expired.
+    """
+    backend = get_pubsub_backend()
+    subscription = backend.subscribe(channel)
+    try:
+        if is_unchanged is not None and not await sync_to_async(is_unchanged)():
+            return True
+        await asyncio.wait_for(subscription.get(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        backend.unsubscribe(subscription)
@@ -0,0 +1,133 @@
+import abc
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+
+from Chat.models.participant import Participant
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_READ_RECEIPTS = 'sync'
+DEFAULT_READ_RECEIPTS_INTERVAL = '0.5'
+# Number of the receipts moved by the same pair of UPDATEs
+FLUSH_BATCH_SIZE = 100
+
+
+class ReadReceipts(abc.ABC):
+    """Marks the fetched messages as read for the user"""
+
+    @abc.abstractmethod
+    def mark_as_read(self, user_id: int, chat_uuid: str, messages):
+        """Marks the messages and the older messages of the chat as read"""
+
+    def flush(self) -> int:
+        """Moves the watermarks of the buffered receipts, returns the number of the moved watermarks"""
+        return 0
+
+    @staticmethod
+    def newest_position(messages):
+        """Returns the (date, id) position of the newest message or None"""
+        return max(((message.date, message.id) for message in messages), default=None)
+
+
+class SyncReadReceipts(ReadReceipts):
+    """Moves the read watermark before the response is sent"""
+
+    def mark_as_read(self, user_id: int, chat_uuid: str, messages):
+        Participant.objects.mark_messages_as_read(
+            user_id=user_id,
+            chat_uuid=chat_uuid,
+            messages_uuids=[message.id for message in messages])
+
+
+class DeferredReadReceipts(ReadReceipts):
+    """
+    Buffers the receipts and moves the read watermarks from the background worker thread
+
+    The watermark only moves forward, so the receipts of the same user and chat
+    are coalesced into the newest position and every flush is a single transaction.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._worker = None
+        atexit.register(self.flush)
+
+    def mark_as_read(self, user_id: int, chat_uuid: str, messages):
+        position = self.newest_position(messages)
+        if position is None:
+            return
+        key = (user_id, str(chat_uuid))
+        with self._lock:
+            if key not in self._pending or self._pending[key] < position:
+                self._pending[key] = position
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._work,
+                    name='chat-read-receipts',
+                    daemon=True)
+                self._worker.start()
+        self._event.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        items = list(pending.items())
+        try:
+            with transaction.atomic():
+                for offset in range(0, len(items), FLUSH_BATCH_SIZE):
+                    Participant.objects.advance_watermarks(dict(items[offset:offset + FLUSH_BATCH_SIZE]))
+        except Exception:
+            # Keep the receipts for the next flush unless newer ones came meanwhile
+            self._merge(pending)
+            raise
+        return len(pending)
+
+    def _merge(self, pending: dict):
+        with self._lock:
+            for key, position in pending.items():
+                if key not in self._pending or self._pending[key] < position:
+                    self._pending[key] = position
+
+    def _work(self):
+        while True:
+            self._event.wait()
+            # Collect more receipts to coalesce them into the same flush
+            time.sleep(float(settings.CHAT_CONFIGURATION.get(
+                'read_receipts_interval', DEFAULT_READ_RECEIPTS_INTERVAL)))
+            self._event.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush the read receipts')
+            finally:
+                close_old_connections()
+
+
+READ_RECEIPTS = {
+    'sync': SyncReadReceipts,
+    'deferred': DeferredReadReceipts,
+}
+
+_read_receipts = {}
+
+
+def get_read_receipts(name: str = None) -> ReadReceipts:
+    """Returns the instance configured by CHAT_CONFIGURATION['read_receipts']"""
+    if name is None:
+        name = settings.CHAT_CONFIGURATION.get('read_receipts', DEFAULT_READ_RECEIPTS)
+    if name not in READ_RECEIPTS:
+        raise ImproperlyConfigured(
+            f"CHAT_CONFIGURATION['read_receipts'] must be one of the following: {list(READ_RECEIPTS)}")
+    if name not in _read_receipts:
+        _read_receipts[name] = READ_RECEIPTS[name]()
+    return _read_receipts[name]
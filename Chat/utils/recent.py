@@ -0,0 +1,136 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Chat.db.routers import use_primary
+from Chat.models.message import Message, MessageRow
+
+DEFAULT_RECENT_MESSAGES_CACHE = 'default'
+DEFAULT_RECENT_MESSAGES_COUNT = '50'
+
+
+class RecentMessagesStats:
+    """Hit and miss counters of the recent messages cache in the current process"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+recent_messages_stats = RecentMessagesStats()
+
+
+def get_recent_messages_cache():
+    """Returns the cache configured by CHAT_CONFIGURATION['recent_messages_cache']"""
+    return caches[settings.CHAT_CONFIGURATION.get('recent_messages_cache', DEFAULT_RECENT_MESSAGES_CACHE)]
+
+
+def get_recent_messages_count() -> int:
+    """Returns the size of the ring buffer configured by CHAT_CONFIGURATION['recent_messages_count']"""
+    return int(settings.CHAT_CONFIGURATION.get('recent_messages_count', DEFAULT_RECENT_MESSAGES_COUNT))
+
+
+def get_recent_messages_key(chat_uuid) -> str:
+    return f'chat:recent:{uuid.UUID(str(chat_uuid)).hex}'
+
+
+def get_recent_messages(chat_uuid, fill: bool = True, seq: int = None):
+    """
+    Returns the newest messages of the chat from newest to oldest and whether they are all its messages
+
+    Every ring buffer keeps the sequence number of the chat changes from which it's filled.
+    With `seq` the buffer of another sequence number is stale: the chat is changed by another
+    process, e.g. the import command, whose invalidation doesn't reach the cache of this one.
+    The ring buffer is filled from the database on a miss unless `fill` is False,
+    then None is returned instead.
+    """
+    cache = get_recent_messages_cache()
+    key = get_recent_messages_key(chat_uuid)
+    entry = cache.get(key)
+    if entry is None or seq is not None and entry[2] != seq:
+        if not fill:
+            return None
+        size = get_recent_messages_count()
+        # The entry outlives the replication lag, so it's filled from the primary
+        with use_primary():
+            rows = [
+                tuple(row)
+                for row in Message.objects.filter(chat_room=chat_uuid).as_rows()[:size + 1]]
+        # The rows are read after the sequence number, so they are never older than it
+        entry = (rows[:size], len(rows) <= size, seq)
+        cache.set(key, entry)
+    rows, complete = entry[:2]
+    return [MessageRow(*row) for row in rows], complete
+
+
+def append_recent_messages(chat_uuid, messages):
+    """
+    Writes the new messages through to the ring buffer of the chat
+
+    The buffer is dropped if the messages are not newer than its newest message,
+    e.g. when the transactions of two senders commit out of order, or if they don't
+    directly follow the sequence number of the buffer.
+    """
+    messages = sorted(messages, key=lambda message: (message.date, message.id), reverse=True)
+    if not messages:
+        return
+    cache = get_recent_messages_cache()
+    key = get_recent_messages_key(chat_uuid)
+    entry = cache.get(key)
+    if entry is None:
+        return
+    rows, complete, seq = entry
+    seqs = sorted(message.seq for message in messages)
+    if (rows and (rows[0][4], rows[0][0]) >= (messages[-1].date, messages[-1].id)
+            or seq is None or seqs != list(range(seq + 1, seq + 1 + len(seqs)))):
+        cache.delete(key)
+        return
+    rows = [
+        (message.id, uuid.UUID(str(message.chat_room_id)), message.sender_id, message.text, message.date)
+        for message in messages] + rows
+    size = get_recent_messages_count()
+    cache.set(key, (rows[:size], complete and len(rows) <= size, seqs[-1]))
+
+
+def invalidate_recent_messages(chat_uuid):
+    get_recent_messages_cache().delete(get_recent_messages_key(chat_uuid))
+
+
+@receiver(post_save, sender=Message)
+def invalidate_changed_message(sender, instance, created, **kwargs):
+    """Drops the ring buffer of the chat whenever one of its messages is changed"""
+    if not created:
+        invalidate_recent_messages(instance.chat_room_id)
+
+
+@receiver(post_delete, sender=Message)
+def invalidate_deleted_message(sender, instance, **kwargs):
+    """Drops the ring buffer of the chat whenever one of its messages is deleted"""
+    invalidate_recent_messages(instance.chat_room_id)
@@ -0,0 +1,220 @@
+import abc
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from Chat.models.message import Message, MessageRow
+from Chat.models.participant import Participant
+from Chat.utils.helpers import encode_rank_cursor, decode_rank_cursor
+
+DEFAULT_SEARCH_BACKEND = 'Chat.utils.search.SQLiteSearchBackend'
+SEARCH_TABLE = 'message_search'
+SEARCH_CONFIG = 'simple'
+TOKEN_REGEX = re.compile(r'\w+')
+
+
+class SearchBackend(abc.ABC):
+    """
+    Full-text index of the message texts
+
+    Results are ordered by the `rank` from the best to the worst match, a lower rank is better.
+    Every page is continued by the keyset cursor over the (rank, id) pair. The ranks depend
+    on the indexed corpus, so pages may shift slightly while new messages are indexed.
+    Only the hot messages are searched: the messages moved to the archive by the
+    `archive_messages` command are removed from the index and aren't found.
+    """
+
+    @abc.abstractmethod
+    def index_messages(self, messages, replace: bool = False):
+        """Adds the messages to the index, `replace` drops their previous versions first"""
+
+    @abc.abstractmethod
+    def remove_messages(self, messages_uuids):
+        """Removes the messages from the index"""
+
+    @abc.abstractmethod
+    def remove_chat_messages(self, chat_uuid):
+        """Removes all the messages of the chat from the index"""
+
+    @abc.abstractmethod
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """Indexes all the messages from scratch, returns the number of indexed messages"""
+
+    @abc.abstractmethod
+    def search_page(self, user_id: int, query: str, count: int, rank_position: tuple = None) -> list:
+        """Returns up to `count` (row, rank) pairs of the chats of the user after the (rank, id) position"""
+
+    def search(self, user_id: int, query: str, count: int, cursor: str = None) -> tuple:
+        """Returns the rows of the page of matching messages and the next cursor"""
+        rank_position = decode_rank_cursor(cursor) if cursor is not None else None
+        results = self.search_page(user_id, query, count + 1, rank_position)
+        next_cursor = None
+        if len(results) > count:
+            row, rank = results[count - 1]
+            next_cursor = encode_rank_cursor(rank, row.id)
+        return [row for row, rank in results[:count]], next_cursor
+
+    @staticmethod
+    def tokenize(query: str) -> list:
+        return TOKEN_REGEX.findall(query)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 index which is kept in the `message_search` virtual table
+
+    The table is updated together with the messages and ranked by bm25 of the text.
+    The chat of every message is indexed as a token of its own, so the match
+    is limited to the chats of the user by the index instead of a join.
+    """
+
+    def index_messages(self, messages, replace: bool = False):
+        messages = list(messages)
+        if not messages:
+            return
+        with connection.cursor() as cursor:
+            if replace:
+                self.remove_messages([message.id for message in messages])
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (text, chat_room, message_id) VALUES (%s, %s, %s)',
+                [(message.text, to_uuid(message.chat_room_id).hex, message.id.hex) for message in messages])
+
+    def remove_messages(self, messages_uuids):
+        messages_uuids = [message_uuid.hex for message_uuid in messages_uuids]
+        if not messages_uuids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE message_id IN ({", ".join(["%s"] * len(messages_uuids))})',
+                messages_uuids)
+
+    def remove_chat_messages(self, chat_uuid):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+                [f'chat_room : "{to_uuid(chat_uuid).hex}"'])
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        indexed_count = 0
+        batch = []
+        for message in Message.objects.order_by().only('id', 'chat_room', 'text').iterator(chunk_size=batch_size):
+            batch.append(message)
+            if len(batch) == batch_size:
+                self.index_messages(batch)
+                indexed_count += len(batch)
+                batch = []
+        self.index_messages(batch)
+        return indexed_count + len(batch)
+
+    def search_page(self, user_id: int, query: str, count: int, rank_position: tuple = None) -> list:
+        # Every token is quoted, so the FTS5 query syntax can't be injected
+        tokens = ' '.join(f'"{token}"' for token in self.tokenize(query))
+        if not tokens:
+            return []
+        chats = ' OR '.join(
+            f'"{chat_uuid.hex}"'
+            for chat_uuid in Participant.objects.filter(person=user_id).values_list('chat_room', flat=True))
+        if not chats:
+            return []
+        # The text is ranked alone, the chat column only narrows the match
+        rank_expression = f'bm25({SEARCH_TABLE}, 1.0, 0.0)'
+        params = [f'text : ({tokens}) AND chat_room : ({chats})']
+        after_position = ''
+        if rank_position is not None:
+            rank, message_uuid = rank_position
+            after_position = f'AND ({rank_expression} > %s OR ({rank_expression} = %s AND m.id > %s))'
+            params += [rank, rank, message_uuid.hex]
+        params.append(count)
+        messages = Message.objects.raw(
+            f'SELECT m.id, m.chat_room_id, m.sender_id, m.text, m.date, {rank_expression} AS rank '
+            f'FROM {SEARCH_TABLE} '
+            f'JOIN message m ON m.id = {SEARCH_TABLE}.message_id '
+            f'WHERE {SEARCH_TABLE} MATCH %s {after_position} '
+            f'ORDER BY {rank_expression}, m.id '
+            f'LIMIT %s',
+            params)
+        return [(to_row(message), message.rank) for message in messages]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    PostgreSQL full-text search over the GIN index of the `to_tsvector` of the message text
+
+    The expression index is maintained by PostgreSQL itself, so nothing is done on write.
+    """
+
+    def index_messages(self, messages, replace: bool = False):
+        pass
+
+    def remove_messages(self, messages_uuids):
+        pass
+
+    def remove_chat_messages(self, chat_uuid):
+        pass
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX message_text_search_idx')
+        return Message.objects.count()
+
+    def search_page(self, user_id: int, query: str, count: int, rank_position: tuple = None) -> list:
+        # The optional dependency of the PostgreSQL databases only
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+        tokens = self.tokenize(query)
+        if not tokens:
+            return []
+        search_query = SearchQuery(' '.join(tokens), config=SEARCH_CONFIG, search_type='plain')
+        search_vector = SearchVector('text', config=SEARCH_CONFIG)
+        # The negated rank keeps the lower is better order of the backends
+        messages = (
+            Message.objects
+            .filter(chat_room__participant__person=user_id)
+            .annotate(search=search_vector, rank=SearchRank(search_vector, search_query) * Value(-1.0))
+            .filter(search=search_query)
+            .order_by('rank', 'id'))
+        if rank_position is not None:
+            rank, message_uuid = rank_position
+            messages = messages.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=message_uuid))
+        return [(to_row(message), message.rank) for message in messages[:count]]
+
+
+def to_uuid(value) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def to_row(message):
+    """Returns the row of the `MessageQuerySet.as_rows` format for the message"""
+    return MessageRow(message.id, message.chat_room_id, message.sender_id, message.text, message.date)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_search_backend() -> SearchBackend:
+    """Returns the backend configured by CHAT_CONFIGURATION['search_backend']"""
+    path = settings.CHAT_CONFIGURATION.get('search_backend', DEFAULT_SEARCH_BACKEND)
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+
+@receiver(post_save, sender=Message)
+def index_saved_message(sender, instance, created, **kwargs):
+    """Keeps the saved message in the index, the batches which skip the signals are indexed explicitly"""
+    get_search_backend().index_messages([instance], replace=not created)
+
+
+@receiver(post_delete, sender=Message)
+def remove_deleted_message(sender, instance, **kwargs):
+    get_search_backend().remove_messages([instance.id])
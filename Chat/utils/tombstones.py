@@ -0,0 +1,12 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from Chat.models.message import Message
+
+
+@receiver(pre_delete, sender=User, dispatch_uid='chat_sender_tombstones')
+def write_sender_tombstones(sender, instance, **kwargs):
+    """Leaves the tombstones of the messages which the deletion of the user deletes by the cascade"""
+    # The receiver runs in the transaction of the deletion, before the messages are deleted
+    Message.objects.filter(sender=instance).write_tombstones()
@@ -0,0 +1,16 @@
+from django.dispatch import receiver
+
+from Chat.models.participant import Participant
+from Chat.signals import messages_fanned_out
+
+
+@receiver(messages_fanned_out, dispatch_uid='chat_unread_counts')
+def increment_unread_counts(sender, messages, recipients, **kwargs):
+    """Counts the delivered messages as unread for their recipients"""
+    if not recipients:
+        return
+    message = messages[0]
+    Participant.objects.increment_unread_counts(
+        chat_uuid=message.chat_room_id,
+        sender_id=message.sender_id,
+        messages=messages)
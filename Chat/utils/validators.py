@@ -5,10 +5,16 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext as _
 
 from Chat.utils.error_messages import POSITIVE_INTEGER_MESSAGE, MAX_COUNT_MESSAGE, MESSAGES_TYPES_MESSAGE, \
-    EMPTY_TEXT_MESSAGE, TEXT_PARAM_MESSAGE
+    EMPTY_TEXT_MESSAGE, TEXT_PARAM_MESSAGE, INVALID_BATCH_MESSAGE, MAX_BATCH_MESSAGE, WAIT_MESSAGE, MAX_WAIT_MESSAGE, \
+    SEARCH_QUERY_MESSAGE, SINCE_MESSAGE, IDEMPOTENCY_KEY_MESSAGE, COMPRESSION_MESSAGE
 
 VALID_COUNT_REGEX = r'^[1-9]\d*$'
 VALID_MESSAGES_TYPES = ['read', 'unread']
+VALID_COMPRESSIONS = ['gzip']
+VALID_WAIT_REGEX = r'^\d+$'
+VALID_SEARCH_QUERY_REGEX = r'\w'
+VALID_SINCE_REGEX = r'^\d+$'
+VALID_IDEMPOTENCY_KEY_REGEX = r'^[\w-]{1,64}$'
 
 
 def validate_count(count):
@@ -20,6 +26,15 @@ def validate_count(count):
             raise ValidationError(_(MAX_COUNT_MESSAGE.format(max_count)))
 
 
+def validate_wait(wait):
+    if wait is not None:
+        if not re.search(VALID_WAIT_REGEX, wait):
+            raise ValidationError(_(WAIT_MESSAGE))
+        max_wait = settings.CHAT_CONFIGURATION['max_wait_seconds']
+        if int(wait) > int(max_wait):
+            raise ValidationError(_(MAX_WAIT_MESSAGE.format(max_wait)))
+
+
 def validate_messages_type(messages_type):
     if messages_type not in VALID_MESSAGES_TYPES:
         raise ValidationError(_(MESSAGES_TYPES_MESSAGE))
@@ -31,5 +46,35 @@ def validate_message_text(text):
 
 
 def validate_request_data(data):
-    if data is None or 'text' not in data.keys():
+    if not isinstance(data, dict) or 'text' not in data:
         raise ValidationError(_(TEXT_PARAM_MESSAGE))
+
+
+def validate_batch_request_data(data):
+    if not isinstance(data, dict) or not isinstance(data.get('texts'), list) or not data['texts']:
+        raise ValidationError(_(INVALID_BATCH_MESSAGE))
+    max_batch_size = settings.CHAT_CONFIGURATION['max_batch_size']
+    if len(data['texts']) > int(max_batch_size):
+        raise ValidationError(_(MAX_BATCH_MESSAGE.format(max_batch_size)))
+    if not all(isinstance(text, str) for text in data['texts']):
+        raise ValidationError(_(INVALID_BATCH_MESSAGE))
+
+
+def validate_search_query(query):
+    if not query or not re.search(VALID_SEARCH_QUERY_REGEX, query):
+        raise ValidationError(_(SEARCH_QUERY_MESSAGE))
+
+
+def validate_since(since):
+    if since is not None and not re.search(VALID_SINCE_REGEX, since):
+        raise ValidationError(_(SINCE_MESSAGE))
+
+
+def validate_idempotency_key(key):
+    if key is not None and not re.search(VALID_IDEMPOTENCY_KEY_REGEX, key, re.ASCII):
+        raise ValidationError(_(IDEMPOTENCY_KEY_MESSAGE))
+
+
+def validate_compression(compression):
+    if compression is not None and compression not in VALID_COMPRESSIONS:
+        raise ValidationError(_(COMPRESSION_MESSAGE))
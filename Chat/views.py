@@ -1,16 +1,40 @@
-from django.core.exceptions import ValidationError
-from django.http import JsonResponse
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, Http404, HttpResponse, JsonResponse, HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
+from django.utils.translation import ugettext as _
 from rest_framework import permissions
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 
 from Chat.models.chat_room import ChatRoom
-from Chat.models.unread_message import UnreadMessage
-from Chat.serializers import MessageSerializer
-from Chat.utils.helpers import return_error, check_access_to_chat
-from Chat.utils.validators import validate_request_data
+from Chat.serializers import render_export_lines, render_message_rows, serialize_changes, serialize_rooms
+from Chat.utils.error_messages import CHAT_ACCESS_MESSAGE, NOT_AUTHENTICATED_MESSAGE, WAIT_ASYNC_MESSAGE
+from Chat.utils.export import compress_gzip, spool_chunks
+from Chat.utils.helpers import return_error, check_access_to_chat, build_etag, database_sync_to_async
+from Chat.utils.membership import is_participant
+from Chat.utils.metrics import instrument, metrics_registry
+from Chat.utils.pubsub import wait_for_publish, get_chat_channel
+from Chat.utils.receipts import ReadReceipts, get_read_receipts
+from Chat.utils.validators import validate_request_data, validate_batch_request_data, validate_wait, \
+    validate_compression
 
-GET_REQUEST_QUERY_PARAMS = ['messages_type', 'count', 'message_uuid']
+GET_REQUEST_QUERY_PARAMS = ['messages_type', 'count', 'message_uuid', 'cursor']
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+PREV_CURSOR_HEADER = 'X-Prev-Cursor'
+GZIP_CONTENT_TYPE = 'application/gzip'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 @api_view(['GET'])
@@ -20,28 +44,220 @@ def fetch_messages(request, chat_uuid):
     user = request.user
     params = request.query_params.dict()
     try:
+        # Long polling would block the worker, it's served by fetch_messages_async only
+        if params.get('wait') is not None:
+            raise ValidationError(_(WAIT_ASYNC_MESSAGE))
         params = {p: params[p] for p in GET_REQUEST_QUERY_PARAMS if p in params}
-        # Get messages
-        chat_messages = ChatRoom.get_messages(
+        # Conditional request: nothing new since the ETag which the client has
+        version = ChatRoom.get_messages_version(chat_uuid, user.id)
+        etag = build_etag(version, params)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        # Get messages, the newest page may come from the recent messages cache
+        chat_messages, next_cursor, prev_cursor = ChatRoom.get_messages_page(
             chat_uuid=chat_uuid,
             user_id=user.id,
+            as_rows=True,
+            version=version,
             **params)
         # Mark messages as read for the current user
-        UnreadMessage.objects.mark_messages_as_read(
+        get_read_receipts().mark_as_read(
             user_id=user.id,
             chat_uuid=chat_uuid,
-            messages_uuids=list(map(lambda x: x.id, chat_messages)))
-        # Serialize
-        serializer = MessageSerializer(chat_messages, many=True)
-        return JsonResponse(serializer.data, safe=False)
+            messages=chat_messages)
+        etag = build_etag(get_read_version(version, params, chat_messages), params)
+        return build_messages_response(chat_messages, etag, next_cursor, prev_cursor)
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+
+
+async def fetch_messages_async(request, chat_uuid):
+    # The same API as fetch_messages without blocking a worker for the database round-trips
+    user_id = await get_user_id(request)
+    if user_id is None:
+        return return_error(_(NOT_AUTHENTICATED_MESSAGE), status.HTTP_403_FORBIDDEN)
+    params = request.GET.dict()
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    try:
+        wait = params.get('wait')
+        validate_wait(wait)
+        params = {p: params[p] for p in GET_REQUEST_QUERY_PARAMS if p in params}
+        get_version = database_sync_to_async(ChatRoom.get_messages_version)
+        get_messages_page = database_sync_to_async(ChatRoom.get_messages_page)
+
+        async def load():
+            # The page is None if nothing changed since the ETag which the client has
+            version = await get_version(chat_uuid, user_id)
+            etag = build_etag(version, params)
+            if etag in etags:
+                return version, etag, None
+            return version, etag, await get_messages_page(
+                chat_uuid=chat_uuid, user_id=user_id, as_rows=True, version=version, **params)
+
+        # The access check and the read-only fetch are independent, so they run concurrently
+        # and the fetched page is dropped if the user doesn't participate in the chat
+        allowed, loaded = await asyncio.gather(
+            database_sync_to_async(is_participant)(chat_uuid, user_id), load(), return_exceptions=True)
+        if isinstance(allowed, Exception):
+            raise allowed
+        if not allowed:
+            return return_error(_(CHAT_ACCESS_MESSAGE), status.HTTP_403_FORBIDDEN)
+        if isinstance(loaded, Exception):
+            raise loaded
+        version, etag, page = loaded
+        if page is None and wait:
+            # Long polling: wait until a new message is sent to the chat
+            def is_unchanged():
+                return build_etag(ChatRoom.get_messages_version(chat_uuid, user_id), params) == etag
+
+            if await wait_for_publish(get_chat_channel(chat_uuid), int(wait), is_unchanged):
+                version, etag, page = await load()
+        if page is None:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        chat_messages, next_cursor, prev_cursor = page
+        await database_sync_to_async(get_read_receipts().mark_as_read)(
+            user_id=user_id,
+            chat_uuid=chat_uuid,
+            messages=chat_messages)
+        etag = build_etag(get_read_version(version, params, chat_messages), params)
+        return build_messages_response(chat_messages, etag, next_cursor, prev_cursor)
     except ValidationError as err:
         return return_error(err.message, status.HTTP_400_BAD_REQUEST)
 
 
+def get_read_version(version, params, chat_messages):
+    """
+    Returns the version of the chat after the messages of the response are marked as read
+
+    The unread page which reaches the newest message leaves nothing unread, so the next
+    conditional request of the client matches until a new message is sent. Otherwise the
+    version before the marking is returned, it never matches again.
+    """
+    newest_uuid, last_read_uuid, archived_until, last_seq = version
+    position = ReadReceipts.newest_position(chat_messages)
+    if params.get('messages_type') == 'unread' and position is not None and position[1] == newest_uuid:
+        return newest_uuid, newest_uuid, archived_until, last_seq
+    return version
+
+
+def build_messages_response(chat_messages, etag, next_cursor, prev_cursor):
+    # Serialize the rows without building the models
+    with instrument('serialize'):
+        content = render_message_rows(chat_messages)
+    response = HttpResponse(content, content_type='application/json')
+    # The version from which the response is built
+    response['ETag'] = etag
+    # Keyset cursors for the adjacent pages
+    if next_cursor is not None:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+    if prev_cursor is not None:
+        response[PREV_CURSOR_HEADER] = prev_cursor
+    return response
+
+
+@api_view(['GET'])
+@check_access_to_chat
+@permission_classes((permissions.IsAuthenticated,))
+def fetch_changes(request, chat_uuid):
+    # Delta sync: the messages changed after the sequence number which the client has
+    params = request.query_params.dict()
+    try:
+        chat_messages, tombstones, seq, has_more, resync = ChatRoom.get_changes(
+            chat_uuid=chat_uuid,
+            since=params.get('since'),
+            count=params.get('count'))
+        with instrument('serialize'):
+            content = serialize_changes(chat_messages, tombstones, seq, has_more, resync)
+        return JsonResponse(content)
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@check_access_to_chat
+@permission_classes((permissions.IsAuthenticated,))
+def export_messages(request, chat_uuid):
+    # The whole history as NDJSON, nothing is marked as read, `cursor` of the last line resumes the export
+    params = request.query_params.dict()
+    try:
+        validate_compression(params.get('compression'))
+        rows = ChatRoom.export_messages(chat_uuid=chat_uuid, cursor=params.get('cursor'))
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+    content = render_export_lines(rows)
+    filename = f'{chat_uuid}.ndjson'
+    content_type = NDJSON_CONTENT_TYPE
+    if params.get('compression') == 'gzip':
+        content = compress_gzip(content)
+        filename += '.gz'
+        content_type = GZIP_CONTENT_TYPE
+    if isinstance(request._request, ASGIRequest):
+        # The ASGI handler iterates the streaming content on the event loop where the queries
+        # are forbidden, so the export is written to a temporary file in the thread of the view
+        response = FileResponse(spool_chunks(content), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsAuthenticated,))
+def fetch_rooms(request):
+    params = request.query_params.dict()
+    try:
+        rooms, next_cursor = ChatRoom.get_rooms_page(
+            user_id=request.user.id,
+            count=params.get('count'),
+            cursor=params.get('cursor'))
+        with instrument('serialize'):
+            content = serialize_rooms(rooms)
+        response = JsonResponse(content, safe=False)
+        if next_cursor is not None:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsAuthenticated,))
+def search_messages(request):
+    params = request.query_params.dict()
+    try:
+        chat_messages, next_cursor = ChatRoom.search_messages(
+            user_id=request.user.id,
+            query=params.get('q'),
+            count=params.get('count'),
+            cursor=params.get('cursor'))
+        with instrument('serialize'):
+            content = render_message_rows(chat_messages)
+        response = HttpResponse(content, content_type='application/json')
+        if next_cursor is not None:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsAuthenticated,))
+def fetch_unread_counts(request):
+    # Fetching the counts doesn't mark any message as read
+    unread_counts = ChatRoom.get_unread_counts(user_id=request.user.id)
+    return JsonResponse({str(chat_uuid): count for chat_uuid, count in unread_counts.items()})
+
+
 @api_view(['POST'])
 @check_access_to_chat
 @permission_classes((permissions.IsAuthenticated,))
 def send_message(request, chat_uuid):
+    # The cached membership is checked before the validation, ChatRoom.send_message checks it again
+    # in the same transaction
     user = request.user
     data = request.data
     try:
@@ -49,10 +265,88 @@ def send_message(request, chat_uuid):
         ChatRoom.send_message(
             chat_uuid=chat_uuid,
             user_id=user.id,
-            text=data['text'])
-        UnreadMessage.objects.mark_messages_as_read(
-            user_id=user.id,
-            chat_uuid=chat_uuid)
+            text=data['text'],
+            idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER))
+        return JsonResponse({'success': True})
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+    except PermissionDenied as err:
+        return return_error(str(err), status.HTTP_403_FORBIDDEN)
+
+
+async def send_message_async(request, chat_uuid):
+    # The same API as send_message, the message is sent in a single transaction of one thread
+    user_id = await get_user_id(request)
+    if user_id is None:
+        return return_error(_(NOT_AUTHENTICATED_MESSAGE), status.HTTP_403_FORBIDDEN)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    if not await database_sync_to_async(is_participant)(chat_uuid, user_id):
+        return return_error(_(CHAT_ACCESS_MESSAGE), status.HTTP_403_FORBIDDEN)
+    try:
+        validate_request_data(data if isinstance(data, dict) else None)
+        await database_sync_to_async(ChatRoom.send_message)(
+            chat_uuid=chat_uuid,
+            user_id=user_id,
+            text=data['text'],
+            idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER))
         return JsonResponse({'success': True})
     except ValidationError as err:
         return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+    except PermissionDenied as err:
+        return return_error(str(err), status.HTTP_403_FORBIDDEN)
+
+
+@database_sync_to_async
+def get_user_id(request):
+    """Returns the id of the User authenticated by the authentication classes of the DRF views or None"""
+    authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        user = Request(request, authenticators=authenticators).user
+    except APIException:
+        return None
+    return user.id if user.is_authenticated else None
+
+
+@api_view(['POST'])
+@check_access_to_chat
+@permission_classes((permissions.IsAuthenticated,))
+def send_messages(request, chat_uuid):
+    # The cached membership is checked before the validation, ChatRoom.send_messages checks it again
+    # in the same transaction
+    user = request.user
+    data = request.data
+    try:
+        validate_batch_request_data(data)
+        new_messages, errors = ChatRoom.send_messages(
+            chat_uuid=chat_uuid,
+            user_id=user.id,
+            texts=data['texts'])
+        results = [
+            {
+                'success': False,
+                'error': {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'message': errors[index]
+                }
+            } if index in errors else {'success': True}
+            for index in range(len(data['texts']))
+        ]
+        return JsonResponse({'success': not errors, 'results': results})
+    except ValidationError as err:
+        return return_error(err.message, status.HTTP_400_BAD_REQUEST)
+    except PermissionDenied as err:
+        return return_error(str(err), status.HTTP_403_FORBIDDEN)
+
+
+def fetch_metrics(request):
+    # Plain view, the scraper isn't a chat user, so it's authenticated by the configured token
+    if settings.CHAT_CONFIGURATION.get('metrics_endpoint', 'false') != 'true':
+        raise Http404
+    token = settings.CHAT_CONFIGURATION.get('metrics_token', '')
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or token and constant_time_compare(authorization, f'Bearer {token}')):
+        return return_error(_(NOT_AUTHENTICATED_MESSAGE), status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
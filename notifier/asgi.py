@@ -0,0 +1,39 @@
+"""
+ASGI config for notifier project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are handled by Django, the async views such as
+``Chat.views.fetch_messages_async`` run on the event loop without blocking
+a worker thread. WebSocket connections are routed to the consumers from
+``Chat.routing``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+from django.urls import Resolver404, URLResolver
+from django.urls.resolvers import RegexPattern
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notifier.settings')
+
+django_application = get_asgi_application()
+
+from Chat.routing import websocket_urlpatterns  # noqa: E402 Django must be set up first
+
+websocket_resolver = URLResolver(RegexPattern(r'^/'), websocket_urlpatterns)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        try:
+            match = websocket_resolver.resolve(scope['path'])
+        except Resolver404:
+            await receive()
+            await send({'type': 'websocket.close'})
+            return
+        await match.func(scope, receive, send, **match.kwargs)
+    else:
+        await django_application(scope, receive, send)
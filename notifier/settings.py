@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Chat.middleware.InstrumentationMiddleware',
+    'Chat.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -70,6 +72,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'notifier.wsgi.application'
 
+ASGI_APPLICATION = 'notifier.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -81,6 +85,53 @@ DATABASES = {
     }
 }
 
+# The reads go to CHAT_CONFIGURATION['read_replicas'] and the writes go to the default database
+DATABASE_ROUTERS = ['Chat.db.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Participants of the chats, the least recently used chats are culled.
+    # Every process keeps its own copy and the membership changes invalidate only the copy
+    # of the process which made them, so the other processes see a removed participant
+    # for at most TIMEOUT seconds. A cache shared by the processes (e.g. memcached)
+    # is invalidated everywhere at once and can keep the entries longer.
+    'chat_membership': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-membership',
+        'TIMEOUT': 10,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Sent messages by the idempotency keys of the clients, the retries of the sends are
+    # answered from it, the unique constraint deduplicates the retries after the timeout
+    'chat_idempotency': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-idempotency',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Ring buffers of the newest messages of the chats, every process keeps its own copy.
+    # A buffer is refilled when the sequence number of the chat changes, so the changes
+    # made by other processes (e.g. the import command) aren't served from a stale copy
+    'chat_recent': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-recent',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -121,5 +172,51 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 CHAT_CONFIGURATION = {
-    'max_messages_count': '50'
+    'max_messages_count': '50',
+    # Maximum number of messages in a single batch send request
+    'max_batch_size': '1000',
+    # Maximum number of seconds the long-polling fetch request waits for a new message
+    'max_wait_seconds': '30',
+    # How a new message is delivered to the chat participants: `eager` updates the unread counters
+    # in the send transaction and the unread counts are read from them. `lazy` and `deferred` are
+    # opt-in, the counters aren't exact with them, so the unread messages are counted on read.
+    # After switching from `lazy` or `deferred` to `eager` run `manage.py recount_unread_counts`
+    'fan_out_strategy': 'eager',
+    # How the fetched messages are marked as read: `sync` before the response
+    # or `deferred` by the background worker which coalesces the receipts,
+    # with `deferred` an immediate refetch of the unread messages may return them again
+    'read_receipts': 'sync',
+    # Number of seconds the deferred receipts are collected before they are flushed
+    'read_receipts_interval': '0.5',
+    # JSON encoder of the fetched messages: `json` or the faster optional `orjson`
+    'json_backend': 'json',
+    # Comma-separated origins (e.g. `https://app.example.com`) of the pages which may open
+    # the WebSocket connections besides the ones served by ALLOWED_HOSTS
+    'websocket_allowed_origins': '',
+    # Cache alias which keeps the ring buffers of the newest messages of the chats
+    'recent_messages_cache': 'chat_recent',
+    # Number of the newest messages kept in the ring buffer of every chat
+    'recent_messages_count': '50',
+    # Age in days after which the `archive_messages` command moves messages to the archive table
+    'archive_after_days': '365',
+    # Number of messages fetched from the server-side cursor at once by the history export
+    'export_chunk_size': '2000',
+    # Full-text index of the messages: Chat.utils.search.SQLiteSearchBackend
+    # or Chat.utils.search.PostgresSearchBackend, it must match the database
+    'search_backend': 'Chat.utils.search.SQLiteSearchBackend',
+    # Publish/subscribe backend which pushes new messages to the WebSocket subscribers
+    'pubsub_backend': 'Chat.utils.pubsub.InMemoryPubSub',
+    # Cache alias which keeps the participants of the chats for the access checks
+    'membership_cache': 'chat_membership',
+    # Cache alias which keeps the messages sent with the idempotency keys for the retries of the sends
+    'idempotency_cache': 'chat_idempotency',
+    # Whether the app serves the Prometheus-style metrics of the process at /api/metrics
+    # to the staff users and to the scraper which sends `Authorization: Bearer <metrics_token>`
+    'metrics_endpoint': 'false',
+    # Token of the metrics scraper, the empty token lets only the staff users in
+    'metrics_token': '',
+    # Comma-separated aliases of DATABASES which are read replicas of the default database
+    'read_replicas': '',
+    # Number of seconds the reads of a client go to the default database after its write
+    'replica_stickiness_seconds': '5'
 }
@@ -0,0 +1,80 @@
+"""
+Production settings for notifier project.
+
+Select them with DJANGO_SETTINGS_MODULE=notifier.settings_production.
+The secrets and the databases are configured by the environment variables:
+
+    DJANGO_SECRET_KEY, DJANGO_ALLOWED_HOSTS
+    DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT
+    DATABASE_POOL_MAX_SIZE, DATABASE_POOL_TIMEOUT, DATABASE_POOL_HEALTH_CHECK_INTERVAL
+    DATABASE_REPLICA_HOST, DATABASE_REPLICA_PORT - the optional read replica
+
+For a local check of the replica router two SQLite files can be used instead:
+set DATABASE_ENGINE=django.db.backends.sqlite3 and DATABASE_NAME / DATABASE_REPLICA_NAME.
+"""
+
+import os
+
+from notifier.settings import *  # noqa: F401,F403
+from notifier.settings import CHAT_CONFIGURATION
+
+DEBUG = False
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+
+# Database
+# The connections are taken from the in-process pool of Chat.db.backends.postgresql
+# and returned to it at the end of every request, so CONN_MAX_AGE must stay 0
+
+def database(prefix, defaults=None):
+    defaults = defaults or {}
+
+    def env(name, default=''):
+        return os.environ.get(prefix + name, defaults.get(name, default))
+
+    engine = env('ENGINE', 'Chat.db.backends.postgresql')
+    settings_dict = {
+        'ENGINE': engine,
+        'NAME': env('NAME'),
+        'CONN_MAX_AGE': 0,
+    }
+    if engine == 'Chat.db.backends.postgresql':
+        settings_dict.update({
+            'USER': env('USER'),
+            'PASSWORD': env('PASSWORD'),
+            'HOST': env('HOST'),
+            'PORT': env('PORT', '5432'),
+            'OPTIONS': {
+                'POOL': {
+                    'max_size': int(env('POOL_MAX_SIZE', '20')),
+                    'timeout': float(env('POOL_TIMEOUT', '10')),
+                    'health_check_interval': float(env('POOL_HEALTH_CHECK_INTERVAL', '30')),
+                },
+            },
+        })
+    return settings_dict
+
+
+DATABASES = {
+    'default': database('DATABASE_'),
+}
+
+if os.environ.get('DATABASE_REPLICA_HOST') or os.environ.get('DATABASE_REPLICA_NAME'):
+    # The replica shares the credentials of the primary unless they are overridden
+    primary = {name: os.environ[f'DATABASE_{name}'] for name in (
+        'ENGINE', 'NAME', 'USER', 'PASSWORD', 'PORT', 'POOL_MAX_SIZE', 'POOL_TIMEOUT',
+        'POOL_HEALTH_CHECK_INTERVAL') if f'DATABASE_{name}' in os.environ}
+    DATABASES['replica'] = dict(database('DATABASE_REPLICA_', primary), TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['Chat.db.routers.ReplicaRouter']
+
+
+CHAT_CONFIGURATION = dict(
+    CHAT_CONFIGURATION,
+    search_backend='Chat.utils.search.PostgresSearchBackend' if (
+        DATABASES['default']['ENGINE'] == 'Chat.db.backends.postgresql') else CHAT_CONFIGURATION['search_backend'],
+    read_replicas='replica' if 'replica' in DATABASES else '',
+)